@@ -38,6 +38,9 @@ For more details, please go to the `home page`_.
           "gui_scripts": [
               "treenote=treenote.main:start"
           ],
+          "console_scripts": [
+              "treenote-cli=treenote.cli:main"
+          ],
       },
       classifiers=[
           'Development Status :: 5 - Production/Stable',
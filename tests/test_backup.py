@@ -0,0 +1,53 @@
+import os
+import tempfile
+from unittest import TestCase
+from treenote import backup
+from treenote.model import Tree_item
+from tree_helpers import item_dicts
+
+
+class TestBackup(TestCase):
+    """Test of the differential backups"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root = Tree_item()
+        self.bookmark_root = Tree_item()
+        for i in range(5):
+            item = self.root.add_child(i)
+            item.text = 'row {}'.format(i)
+            item.add_child(0).text = 'child of row {}'.format(i)
+
+    def test_full_and_delta(self):
+        full_path = os.path.join(self.folder, 'tree' + backup.FULL_SUFFIX)
+        state = backup.write_backup((self.root, self.bookmark_root), full_path)
+        old_dicts = item_dicts(self.root)
+
+        self.root.childItems[0].text = 'changed'
+        self.root.childItems[1].add_child(1).text = 'new'
+        del self.root.childItems[4]
+        delta_path = os.path.join(self.folder, 'tree' + backup.DELTA_SUFFIX)
+        backup.write_backup((self.root, self.bookmark_root), delta_path,
+                            state, os.path.basename(full_path))
+        self.assertLess(os.path.getsize(delta_path),
+                        os.path.getsize(full_path))
+
+        root, bookmark_root = backup.restore(delta_path)
+        self.assertEqual(item_dicts(root), item_dicts(self.root))
+        new_item = root.childItems[1].childItems[1]
+        self.assertIs(new_item.parentItem, root.childItems[1])
+        root, bookmark_root = backup.restore(full_path)
+        self.assertEqual(item_dicts(root), old_dicts)
+
+    def test_copies(self):
+        """copies of an item have the same creation time,
+        but are backed up separately
+        """
+        copy = self.root.add_child(5)
+        copy.text = 'copy'
+        copy.creation_date_time = self.root.childItems[0].creation_date_time
+        path = os.path.join(self.folder, 'tree' + backup.FULL_SUFFIX)
+        backup.write_backup((self.root, self.bookmark_root), path)
+        root, bookmark_root = backup.restore(path)
+        self.assertEqual([item.text for item in root.childItems[::5]],
+                         ['row 0', 'copy'])
@@ -0,0 +1,68 @@
+import pickle
+from unittest import TestCase
+from treenote import binary_format, model
+from treenote.model import Tree_item
+from tree_helpers import item_dicts
+
+
+class TestBinaryFormat(TestCase):
+    """Test of the compact binary file format"""
+
+    def setUp(self):
+        self.root = Tree_item()
+        self.root.header_list = ['Text', 'Start date', 'Estimate']
+        self.bookmark_root = Tree_item()
+        for i in range(20):
+            item = self.root.add_child(i)
+            item.text = 'row {} #tag ü'.format(i)
+            item.type = model.TASK if i % 2 else model.NOTE
+            item.date = '{:02}.01.18'.format(i + 1)
+            item.estimate = str(i * 10)
+            item.planned = i % 3
+            item.expanded = i % 2 == 0
+            item.quicklink_expanded = i % 4 == 0
+            item.add_child(0).text = 'child of row {}'.format(i)
+        self.root.childItems[3].color = model.CHAR_QCOLOR_DICT['r']
+        self.root.childItems[4].estimate = '1.5'  # doesn't fit into the column
+        bookmark = self.bookmark_root.add_child(0)
+        bookmark.search_text = '#tag'
+        bookmark.shortcut = 'Ctrl+1'
+        bookmark.saved_root_item_creation_date_time = \
+            self.root.childItems[2].creation_date_time
+        self.selected_item = self.root.childItems[5].childItems[0]
+
+    def test_round_trip(self):
+        trees = self.root, self.bookmark_root
+        data = binary_format.dumps(self.selected_item, trees, {})
+        self.assertTrue(data.startswith(binary_format.MAGIC))
+        pickled = pickle.dumps((self.selected_item,) + trees)
+        self.assertLess(len(data), len(pickled))
+        selected_item, root, bookmark_root = binary_format.loads(data)
+        self.assertEqual(item_dicts(root), item_dicts(self.root))
+        self.assertEqual(item_dicts(bookmark_root),
+                         item_dicts(self.bookmark_root))
+        self.assertIs(selected_item, root.childItems[5].childItems[0])
+        self.assertIs(selected_item.parentItem.parentItem, root)
+
+    def test_unfetched_and_deep_trees(self):
+        """lazy children are saved, and the depth of the tree is not limited
+        by the recursion limit
+        """
+        item = self.root.childItems[0]
+        for i in range(5000):
+            item = item.add_child(0)
+        collapsed = self.root.childItems[1]
+        unfetched = {collapsed: model.LazyChildren(collapsed, {})}
+        collapsed.childItems = []
+        data = binary_format.dumps(None, (self.root, self.bookmark_root),
+                                   unfetched)
+        selected_item, root, bookmark_root = binary_format.loads(data)
+        self.assertIsNone(selected_item)
+        self.assertEqual(root.childItems[1].childItems[0].text,
+                         'child of row 1')
+        depth = 0
+        item = root.childItems[0]
+        while item.childItems:
+            item = item.childItems[0]
+            depth += 1
+        self.assertEqual(depth, 5000)
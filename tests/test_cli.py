@@ -0,0 +1,79 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+from PyQt5.QtWidgets import QApplication
+from treenote import cli, model
+from treenote.model import Tree_item
+
+EXPORTED = ('- project :home\n\t- task 0\n\t- task 1\n\t\t- collapsed child\n'
+            '- note\n')
+
+
+class TestCli(TestCase):
+    """Test of querying and exporting files without the GUI"""
+
+    def setUp(self):
+        root = Tree_item()
+        root.header_list = ['Text', 'Start date', 'Estimate']
+        project = root.add_child(0)
+        project.text = 'project :home'
+        project.type = model.SEQ
+        for i, date in enumerate(('01.01.01', '01.01.99')):
+            task = project.add_child(i)
+            task.text = 'task {}'.format(i)
+            task.type = model.TASK
+            task.date = date
+        root.add_child(1).text = 'note'
+        project.childItems[1].add_child(0).text = 'collapsed child'
+        bookmark_root = Tree_item()
+        bookmark_root.header_list = ['Bookmarks']
+        self.path = os.path.join(tempfile.mkdtemp(), 'tree.treenote')
+        with open(self.path, 'wb') as file:
+            file.write(model.dump_trees(project, root, bookmark_root, {}))
+
+    def run_cli(self, *arguments):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            exit_code = cli.main(list(arguments))
+        return exit_code, output.getvalue()
+
+    def test_search(self):
+        # the second task of the sequential project is not available,
+        # the first one is overdue
+        self.assertEqual(self.run_cli('search', self.path, 't=t'),
+                         (0, '- project :home\n\t- task 0\n'))
+        self.assertEqual(
+            self.run_cli('search', self.path, 'date<0d', '--count'),
+            (0, '1\n'))
+        self.assertEqual(self.run_cli('search', self.path, 'child'),
+                         (0, '- project :home\n\t- task 1\n'
+                             '\t\t- collapsed child\n'))
+        self.assertEqual(self.run_cli('search', self.path, '*child'),
+                         (1, ''))
+        self.assertIsNone(QApplication.instance())
+
+    def test_export(self):
+        exit_code, output = self.run_cli('export', self.path)
+        self.assertEqual(output, EXPORTED)
+        exit_code, output = self.run_cli('export', self.path,
+                                         '--format', 'json')
+        root, bookmark_root = json.loads(output)
+        task = root['childItems'][0]['childItems'][1]
+        self.assertEqual(task['childItems'][0]['text'], 'collapsed child')
+
+    def test_convert(self):
+        folder = os.path.dirname(self.path)
+        with open(os.path.join(folder, 'broken.treenote'), 'wb') as file:
+            file.write(b'no pickle')
+        output_folder = tempfile.mkdtemp()
+        exit_code, output = self.run_cli('convert', folder, '--to', 'sqlite',
+                                         '--output', output_folder,
+                                         '--jobs', '1')
+        self.assertEqual(exit_code, 1)
+        self.assertIn('2 files, 1 failed, 5 rows', output)
+        exit_code, output = self.run_cli(
+            'export', os.path.join(output_folder, 'tree.treenote'))
+        self.assertEqual(output, EXPORTED)
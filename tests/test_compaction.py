@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest import TestCase
+from treenote import compaction, database, model
+from treenote.model import Tree_item
+
+
+class TestCompaction(TestCase):
+    """Test of the removal of dead data"""
+
+    def setUp(self):
+        self.root = Tree_item()
+        self.root.header_list = ['Text']
+        self.bookmark_root = Tree_item()
+        for i in range(3):
+            item = self.root.add_child(i)
+            item.text = 'row {}'.format(i)
+            item.add_child(0).text = 'child of row {}'.format(i)
+
+    def test_remove_tombstones(self):
+        setattr(self.root.childItems[1], model.DELETED, True)
+        collapsed_item = self.root.childItems[2]
+        setattr(collapsed_item.childItems[0], model.DELETED, True)
+        collapsed_item.childItems = model.LazyChildren(collapsed_item, {})
+        trees = self.root, self.bookmark_root
+        self.assertEqual(compaction.remove_tombstones(trees), 3)
+        self.assertEqual([item.text for item in self.root.childItems],
+                         ['row 0', 'row 2'])
+        self.assertEqual(self.root.childItems[1].childItems, [])
+
+    def test_reset_unused_fields(self):
+        item = self.root.childItems[0]
+        # like an attribute of a pickle of an earlier version
+        item.__setstate__({'removed_field': 1})
+        item.search_text = 'a search'
+        bookmark = self.bookmark_root.add_child(0)
+        root_id = self.root.childItems[1].creation_date_time
+        bookmark.saved_root_item_creation_date_time = root_id
+        dangling_bookmark = self.bookmark_root.add_child(1)
+        dangling_bookmark.saved_root_item_creation_date_time = 'removed item'
+        self.assertEqual(
+            compaction.reset_unused_fields(self.root, self.bookmark_root), 3)
+        self.assertNotIn('removed_field', item.__getstate__())
+        self.assertEqual(item.search_text, '')
+        self.assertEqual(bookmark.saved_root_item_creation_date_time, root_id)
+        self.assertIsNone(
+            dangling_bookmark.saved_root_item_creation_date_time)
+        self.assertEqual(self.root.header_list, ['Text'])
+
+    def test_database_orphans(self):
+        path = os.path.join(tempfile.mkdtemp(), 'tree.sqlite')
+        db = database.Database.create(path, self.root,
+                                      (self.root, self.bookmark_root))
+        db.connection.execute('UPDATE items SET parent = -1 WHERE text = ?',
+                              ('row 1',))
+        self.assertEqual(db.remove_orphans(), 2)
+        selected_item, (root, bookmark_root) = db.load()
+        self.assertEqual([item.text for item in root.childItems],
+                         ['row 0', 'row 2'])
+        db.close()
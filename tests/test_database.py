@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+from treenote import database, journal
+from treenote.model import Tree_item
+from tree_helpers import texts
+
+
+def first_child_texts(item):
+    first_child_texts = []
+    while item.childItems:
+        item = item.childItems[0]
+        first_child_texts.append(item.text)
+    return first_child_texts
+
+
+class TestDatabase(TestCase):
+    """Test of the SQLite storage"""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'tree.treenote')
+        self.root = Tree_item()
+        self.bookmark_root = Tree_item()
+        for i in range(3):
+            self.root.add_child(i).text = str(i)
+            self.root.childItems[i].add_child(0).text = 'child of ' + str(i)
+        self.database = database.Database.create(
+            self.path, self.root.childItems[2],
+            (self.root, self.bookmark_root))
+
+    def load(self):
+        self.database.close()
+        loaded_database = database.Database(self.path)
+        selected_item, (root, bookmark_root) = loaded_database.load()
+        loaded_database.close()
+        return selected_item, root
+
+    def test_load(self):
+        """the trees and the selected item are restored"""
+        self.assertTrue(database.is_database(self.path))
+        selected_item, root = self.load()
+        self.assertEqual(texts(root), texts(self.root))
+        self.assertEqual(selected_item.text, '2')
+        self.assertIs(root.childItems[1].childItems[0].parentItem,
+                      root.childItems[1])
+
+    def test_apply(self):
+        """changes reported by the model update the rows"""
+        item = self.root.childItems[1]
+        item.text = 'renamed'
+        self.database.apply(journal.ITEM_TREE, journal.SET, item,
+                            'text', item.text)
+        item.color = 'red'
+        self.database.apply(journal.ITEM_TREE, journal.SET, item,
+                            'color', item.color)
+
+        new_item = Tree_item(item)
+        new_item.add_child(0).text = 'grandchild'
+        item.childItems.insert(0, new_item)
+        self.database.apply(journal.ITEM_TREE, journal.INSERT, item,
+                            0, [new_item])
+
+        del self.root.childItems[0]
+        self.database.apply(journal.ITEM_TREE, journal.REMOVE, self.root, 0, 1)
+
+        self.root.childItems.insert(1, self.root.childItems.pop(0))
+        self.database.apply(journal.ITEM_TREE, journal.MOVE, self.root, 0, 1)
+        self.database.commit()
+
+        selected_item, root = self.load()
+        self.assertEqual(texts(root), texts(self.root))
+        self.assertEqual(root.childItems[1].color, 'red')
+
+    def test_search(self):
+        self.assertEqual(self.database.search('child 2'),
+                         [self.root.childItems[2].childItems[0]])
+        self.assertTrue(database.is_word_search('child 2'))
+        for text in ('', ':tag', '*chil*', 'date<1d', 'child-2'):
+            self.assertFalse(database.is_word_search(text))
+
+    def test_deep_tree(self):
+        """trees deeper than the recursion limit are written and inserted"""
+        depth = sys.getrecursionlimit() + 100
+        item = self.root.childItems[0]
+        for i in range(depth):
+            item = item.add_child(0)
+            item.text = str(i)
+        self.database.close()
+        self.database = database.Database.create(
+            self.path, self.root.childItems[2],
+            (self.root, self.bookmark_root))
+        subtree = Tree_item(self.root)
+        item = subtree
+        for i in range(depth):
+            item = item.add_child(0)
+        self.root.childItems.append(subtree)
+        self.database.apply(journal.ITEM_TREE, journal.INSERT, self.root,
+                            3, [subtree])
+
+        selected_item, root = self.load()
+        self.assertEqual(first_child_texts(root.childItems[0]),
+                         [str(i) for i in range(depth)])
+        self.assertEqual(len(first_child_texts(root.childItems[3])), depth)
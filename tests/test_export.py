@@ -0,0 +1,66 @@
+import json
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+from treenote import export, model
+from treenote.model import Tree_item
+
+
+class TestExport(TestCase):
+    """Test of the JSON and plain text exports"""
+
+    def setUp(self):
+        self.root = Tree_item()
+        self.bookmark_root = Tree_item()
+        item = self.root
+        for i in range(3):
+            item = item.add_child(0)
+            item.text = 'row "{}" ü'.format(i)
+        self.root.add_child(1).text = 'sibling'
+
+    def expected_json(self):
+        def json_encoder(obj):
+            dic = obj.__getstate__()
+            del dic['parentItem']
+            return dic
+
+        return json.loads(json.dumps((self.root, self.bookmark_root),
+                                     default=json_encoder))
+
+    def test_json_pieces(self):
+        """the streamed JSON is the same as the JSON of the recursive
+        encoder
+        """
+        pieces = export.json_pieces((self.root, self.bookmark_root))
+        self.assertEqual(json.loads(''.join(pieces)), self.expected_json())
+
+    def test_write_json_from_snapshot(self):
+        """a snapshot with collapsed subtrees is written completely"""
+        snapshot = model.snapshot_trees((self.root, self.bookmark_root), {})
+        root_items = pickle.loads(snapshot)
+        self.root.childItems[0].text = 'changed after the snapshot'
+        collapsed = root_items[0].childItems[0]
+        collapsed.childItems = model.LazyChildren(collapsed, {})
+        path = os.path.join(tempfile.mkdtemp(), 'backup.json')
+        progress = []
+        item_count = export.write_json(root_items, path,
+                                       lambda *args: progress.append(args))
+        self.assertEqual(item_count, 6)
+        self.assertEqual(progress[-1][:2], (6, os.path.getsize(path)))
+        with open(path, encoding='utf-8') as file:
+            root = json.load(file)[0]
+        self.assertEqual(root['childItems'][0]['text'], 'row "0" ü')
+
+    def test_plain_text(self):
+        self.root.childItems[1].text = 'two\nlines'
+        path = os.path.join(tempfile.mkdtemp(), 'export.txt')
+        export.write_plain_text(self.root, path)
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), '- row "0" ü\n\t- row "1" ü\n'
+                                          '\t\t- row "2" ü\n- two\n\tlines\n')
+        selected_item = self.root.childItems[0].childItems[0]
+        selected_item.date = '01.01.18'
+        rows = export.outline_rows(self.root, {selected_item})
+        self.assertEqual(list(export.plain_text_lines(rows, dates=True)),
+                         ['\t- row "1" ü [[01.01.18]]\n'])
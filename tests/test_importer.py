@@ -0,0 +1,63 @@
+import os
+import tempfile
+from unittest import TestCase
+from treenote import compression, export, importer
+from treenote.model import Tree_item
+
+
+class TestImporter(TestCase):
+    """Test of the streaming JSON import"""
+
+    def setUp(self):
+        self.root = Tree_item()
+        self.root.header_list = ['Text', 'Estimate', 'Start date']
+        self.bookmark_root = Tree_item()
+        item = self.root
+        for i in range(3000):  # deeper than the recursion limit
+            item = item.add_child(0)
+            item.text = 'row "{}" ü\n'.format(i)
+            item.estimate = i
+        self.root.add_child(1).text = 'sibling'
+        self.path = os.path.join(tempfile.mkdtemp(), 'backup.json')
+        export.write_json((self.root, self.bookmark_root), self.path)
+
+    def test_load_json(self):
+        """importing an export gives the same trees, with parent pointers"""
+        progress = []
+        root, bookmark_root = importer.load_json(
+            self.path, lambda *args: progress.append(args))
+        self.assertEqual(
+            ''.join(export.json_pieces((root, bookmark_root))),
+            ''.join(export.json_pieces((self.root, self.bookmark_root))))
+        size = os.path.getsize(self.path)
+        self.assertEqual(progress[-1], (size, size))
+        self.assertIs(root.childItems[0].childItems[0].parentItem,
+                      root.childItems[0])
+        self.assertIsNone(root.parentItem)
+
+    def test_small_chunks(self):
+        """tokens which are split between chunks are parsed correctly"""
+        chunk_size = importer.CHUNK_SIZE
+        importer.CHUNK_SIZE = 7
+        try:
+            root, bookmark_root = importer.load_json(self.path)
+        finally:
+            importer.CHUNK_SIZE = chunk_size
+        self.assertEqual(root.childItems[1].text, 'sibling')
+        self.assertEqual(root.childItems[0].childItems[0].estimate, 1)
+
+    def test_compressed(self):
+        """exports are compressed according to the suffix and decompressed
+        while importing
+        """
+        for suffix in compression.FORMATS:
+            path = self.path + suffix
+            export.write_json((self.root, self.bookmark_root), path, level=1)
+            size = os.path.getsize(path)
+            self.assertLess(size, os.path.getsize(self.path) / 10)
+            progress = []
+            root, bookmark_root = importer.load_json(
+                path, lambda *args: progress.append(args))
+            self.assertEqual(root.childItems[0].childItems[0].text,
+                             'row "1" ü\n')
+            self.assertEqual(progress[-1], (size, size))
@@ -0,0 +1,118 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+from treenote import journal
+from treenote.model import Tree_item
+from tree_helpers import texts
+
+
+class TestJournal(TestCase):
+    """Test of the append-only change journal"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.folder, 'tree.treenote')
+        self.journal_path = self.snapshot_path + journal.JOURNAL_SUFFIX
+        self.root = Tree_item()
+        self.bookmark_root = Tree_item()
+        for i in range(3):
+            self.root.add_child(i).text = str(i)
+        self.root.journal_token = 'token'
+        with open(self.snapshot_path, 'wb') as file:
+            pickle.dump((self.root, self.bookmark_root), file)
+        self.journal = journal.Journal(self.journal_path, 'token')
+
+    def load_and_replay(self):
+        with open(self.snapshot_path, 'rb') as file:
+            root, bookmark_root = pickle.load(file)
+        count = journal.replay(self.journal_path, (root, bookmark_root))
+        return root, count
+
+    def test_replay(self):
+        """changes recorded in the journal are applied on top of the
+        snapshot
+        """
+        item = self.root.childItems[1]
+        item.text = 'renamed'
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', item.text)
+
+        new_item = Tree_item(item)
+        new_item.text = 'new child'
+        item.childItems.append(new_item)
+        self.journal.append(journal.ITEM_TREE, journal.INSERT, item,
+                            0, [new_item])
+
+        del self.root.childItems[0]
+        self.journal.append(journal.ITEM_TREE, journal.REMOVE, self.root, 0, 1)
+
+        self.root.childItems.insert(1, self.root.childItems.pop(0))
+        self.journal.append(journal.ITEM_TREE, journal.MOVE, self.root, 0, 1)
+        self.journal.close()
+
+        root, count = self.load_and_replay()
+        self.assertEqual(count, 4)
+        self.assertEqual(texts(root), texts(self.root))
+        self.assertIs(root.childItems[1].childItems[0].parentItem,
+                      root.childItems[1])
+
+    def test_truncated_record_is_skipped(self):
+        item = self.root.childItems[0]
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', 'first')
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', 'second')
+        self.journal.close()
+        with open(self.journal_path, 'r+b') as file:
+            file.truncate(os.path.getsize(self.journal_path) - 3)
+
+        root, count = self.load_and_replay()
+        self.assertEqual(count, 1)
+        self.assertEqual(root.childItems[0].text, 'first')
+
+    def test_journal_of_other_snapshot_is_ignored(self):
+        self.journal.append(journal.ITEM_TREE, journal.SET,
+                            self.root.childItems[0], 'text', 'changed')
+        self.journal.close()
+        journal.Journal(self.journal_path, 'other token').close()
+
+        root, count = self.load_and_replay()
+        self.assertEqual(count, 0)
+        self.assertEqual(root.childItems[0].text, '0')
+
+    def test_write_ahead_log(self):
+        """after a crash, the changes after the checkpoint of the last written
+        snapshot are replayed
+        """
+        self.journal.close()
+        self.journal = journal.Journal(self.journal_path, 'token', fsync=True)
+        item = self.root.childItems[0]
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', 'in the snapshot')
+        self.journal.checkpoint('new token')
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', 'after the snapshot')
+        self.journal.flush()
+        # the new snapshot was not written yet, so all changes are replayed
+        # on top of the old one
+        root, count = self.load_and_replay()
+        self.assertEqual((count, root.childItems[0].text),
+                         (2, 'after the snapshot'))
+
+        item.text = 'in the snapshot'
+        self.root.journal_token = 'new token'
+        with open(self.snapshot_path, 'wb') as file:
+            pickle.dump((self.root, self.bookmark_root), file)
+        self.journal.truncate('new token')
+        # the file is rewritten in the background, changes done meanwhile
+        # are kept
+        self.journal.append(journal.ITEM_TREE, journal.SET, item,
+                            'text', 'while truncating')
+        self.journal.finish_truncation()
+        self.journal.close()
+        root, count = self.load_and_replay()
+        self.assertEqual((count, root.childItems[0].text),
+                         (2, 'while truncating'))
+        self.assertEqual(self.journal.record_count, 2)
+        self.assertFalse(os.path.exists(self.journal_path + '.tmp'))
@@ -0,0 +1,96 @@
+import copyreg
+import io
+import pickle
+from unittest import TestCase
+from treenote import journal, model
+from treenote.model import Tree_item
+from tree_helpers import texts
+
+
+class TestLazyChildren(TestCase):
+    """Test of pickling the children of collapsed items separately"""
+
+    def setUp(self):
+        self.root = Tree_item()
+        self.collapsed = self.root.add_child(0)
+        self.collapsed.text = 'collapsed'
+        self.expanded = self.root.add_child(1)
+        self.expanded.expanded = True
+        for parent_item in self.collapsed, self.expanded:
+            child_item = parent_item.add_child(0)
+            child_item.text = 'child :tag'
+            child_item.planned = 1
+            child_item.expanded = True
+            child_item.add_child(0).text = 'grandchild'
+
+    def load(self, selected_item):
+        return pickle.loads(model.dump_trees(selected_item, self.root,
+                                             Tree_item(), {}))
+
+    def test_collapsed_children_are_pickled_separately(self):
+        selected_item, root, bookmark_root = self.load(self.root.childItems[1])
+        lazy_children = root.childItems[0].childItems
+        self.assertIsInstance(lazy_children, model.LazyChildren)
+        # expanded, but near the root,
+        # see test_expanded_children_of_first_levels_are_pickled_separately()
+        self.assertIsInstance(root.childItems[1].childItems,
+                              model.LazyChildren)
+        self.assertEqual(lazy_children.tags, {':tag'})
+        self.assertTrue(lazy_children.planned)
+        self.assertTrue(lazy_children.might_contain('grandchild'))
+        self.assertFalse(lazy_children.might_contain('something else'))
+
+        root.childItems[0].childItems = lazy_children.load(root.childItems[0])
+        self.assertEqual(texts(root), texts(self.root))
+        self.assertIs(root.childItems[0].childItems[0].parentItem,
+                      root.childItems[0])
+
+    def test_ancestors_of_selected_item_are_kept(self):
+        selected_item, root, bookmark_root = self.load(
+            self.collapsed.childItems[0].childItems[0])
+        self.assertIsInstance(root.childItems[0].childItems, list)
+        self.assertIs(selected_item.parentItem.parentItem, root.childItems[0])
+
+    def test_journal_replay_unpickles_collapsed_children(self):
+        selected_item, root, bookmark_root = self.load(self.expanded)
+        record = journal.SET, journal.ITEM_TREE, (0, 0), 'text', 'changed'
+        journal.apply_record(record, (root, bookmark_root))
+        self.assertEqual(root.childItems[0].childItems[0].text, 'changed')
+
+    def test_expanded_children_of_first_levels_are_pickled_separately(self):
+        item = self.expanded.childItems[0].childItems[0]
+        item.expanded = True
+        item.add_child(0).text = 'great-grandchild'
+        selected_item, root, bookmark_root = self.load(self.collapsed)
+        expanded = root.childItems[1]
+        lazy_children = expanded.childItems
+        self.assertEqual(lazy_children.tags, {':tag'})
+        expanded.childItems = lazy_children.load(expanded)
+        child_item = expanded.childItems[0]
+        self.assertIsInstance(child_item.childItems, model.LazyChildren)
+        child_item.childItems = child_item.childItems.load(child_item)
+        # below model.PROGRESSIVE_DEPTH
+        self.assertIsInstance(child_item.childItems[0].childItems, list)
+        self.assertEqual(texts(expanded), texts(self.expanded))
+
+    def test_pickles_of_earlier_versions_are_loaded(self):
+        """items of earlier versions were pickled with their __dict__, which
+        had all fields
+        """
+        def reduce_item(item):
+            state = dict(item.__getstate__(), removed_field=1)
+            return copyreg.__newobj__, (Tree_item,), state
+
+        file = io.BytesIO()
+        pickler = pickle.Pickler(file)
+        pickler.dispatch_table = {Tree_item: reduce_item}
+        pickler.dump(self.root)
+        root = pickle.loads(file.getvalue())
+        self.assertEqual(texts(root), texts(self.root))
+        self.assertEqual(root.childItems[0].childItems[0].planned, 1)
+        # the unknown field is kept, the default bookmark fields are not stored
+        self.assertEqual(root.childItems[0].extras, {'removed_field': 1})
+        bookmark = Tree_item()
+        bookmark.search_text = 'a search'
+        self.assertEqual(pickle.loads(pickle.dumps(bookmark)).__getstate__(),
+                         bookmark.__getstate__())
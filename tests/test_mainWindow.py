@@ -1,25 +1,58 @@
+import os
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 from PyQt5 import QtWidgets
-from treenote.main import MainWindow
+from treenote.main import ExportThread, MainWindow
+from treenote.model import Tree_item
 
 
 class TestMainWindow(TestCase):
     """test of the treenote.main.MainWindow class"""
 
-    def setUp(self):
-        """Creates the QApplication instance"""
+    @classmethod
+    def setUpClass(cls):
+        """Creates the QApplication instance, once for all tests"""
+        cls.app = (QtWidgets.QApplication.instance() or
+                   QtWidgets.QApplication([]))
 
-        # Simple way of making instance a singleton
+    def setUp(self):
         super(TestMainWindow, self).setUp()
-
-        self.app = QtWidgets.QApplication([])
         self.window = MainWindow(self.app)
 
-    def tearDown(self):
-        """Deletes the reference owned by self"""
-        del self.app
-        super(TestMainWindow, self).tearDown()
-
     def test_is_sidebar_shown(self):
         """Test is_sidebar_shown"""
         self.assertEqual(self.window.is_sidebar_shown(), False)
+
+    def test_unreadable_file_keeps_the_shown_file(self):
+        path = os.path.join(tempfile.mkdtemp(), 'broken.treenote')
+        with open(path, 'wb') as file:
+            file.write(b'no tree')
+        save_path = self.window.save_path
+        root_item = self.window.item_model.rootItem
+        with self.assertRaises(Exception):
+            self.window.open_file(path)
+        self.assertEqual(self.window.save_path, save_path)
+        self.assertIs(self.window.item_model.rootItem, root_item)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'no tree')
+
+    def test_failed_export_removes_the_partial_file(self):
+        model = self.window.item_model
+        model.rootItem.childItems[0].planned = {1}  # not JSON serializable
+        path = os.path.join(tempfile.mkdtemp(), 'export.json')
+        worker = ExportThread((model.snapshot(),
+                               self.window.bookmark_model.snapshot()), path)
+        errors = []
+        worker.failed.connect(errors.append)
+        worker.run()
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_compact_file_resets_a_missing_selected_item(self):
+        model = self.window.item_model
+        for selected_item in (None, Tree_item()):  # e.g. of an other tree
+            model.selected_item = selected_item
+            with patch.object(QtWidgets.QMessageBox, 'information'):
+                self.window.compact_file()
+            self.assertIs(model.selected_item, model.rootItem)
@@ -0,0 +1,53 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+from treenote import binary_format, mapped_model, model
+from treenote.model import Tree_item
+
+
+class TestMappedModel(TestCase):
+    """Test of the read-only view of memory-mapped files"""
+
+    def setUp(self):
+        root = Tree_item()
+        root.header_list = ['Text', 'Start date', 'Estimate']
+        bookmark_root = Tree_item()
+        for i in range(3):
+            item = root.add_child(i)
+            item.text = 'row {}'.format(i)
+            for j in range(3):
+                item.add_child(j).text = 'child {} {}'.format(i, j)
+        root.childItems[2].childItems[1].planned = 1
+        path = os.path.join(tempfile.mkdtemp(), 'archive.treenote')
+        with open(path, 'wb') as file:
+            file.write(binary_format.dumps(root.childItems[1].childItems[2],
+                                           (root, bookmark_root), {}))
+        self.tree = mapped_model.MappedTree(path)
+
+    def tearDown(self):
+        self.tree.close()
+
+    def test_load(self):
+        """just the root items and the path to the selected item are created"""
+        selected_item, root, bookmark_root = self.tree.load()
+        self.assertEqual(selected_item.text, 'child 1 2')
+        self.assertIs(selected_item.parentItem.parentItem, root)
+        self.assertEqual(root.header_list, ['Text', 'Start date', 'Estimate'])
+        self.assertIsInstance(root.childItems[0].childItems,
+                              mapped_model.MappedChildren)
+        self.assertFalse(root.childItems[0].childItems.planned)
+        self.assertTrue(root.childItems[2].childItems.planned)
+        child_items = root.childItems[2].childItems.load(root.childItems[2])
+        self.assertEqual([item.text for item in child_items],
+                         ['child 2 0', 'child 2 1', 'child 2 2'])
+        self.assertEqual(child_items[1].planned, 1)
+
+    def test_snapshot(self):
+        """copies of the tree contain the items which were not created yet"""
+        selected_item, root, bookmark_root = self.tree.load()
+        root_items = pickle.loads(
+            model.snapshot_trees((root, bookmark_root), {}))
+        item = root_items[0].childItems[0]
+        self.assertEqual(item.childItems[1].text, 'child 0 1')
+        self.assertIs(item.childItems[1].parentItem, item)
@@ -0,0 +1,37 @@
+import io
+from unittest import TestCase
+from treenote import outline
+from tree_helpers import item_texts
+
+
+class TestOutline(TestCase):
+    """Test of the parsers which build subtrees out of outlines"""
+
+    def test_indented_text(self):
+        items = outline.parse_indented_text('a\n  b\n    c\n  d\ne\r\n')
+        self.assertEqual(item_texts(items),
+                         [('a', [('b', [('c', [])]), ('d', [])]), ('e', [])])
+        self.assertIs(items[0].childItems[0].parentItem, items[0])
+        self.assertIsNone(items[0].parentItem)
+
+    def test_dashes_continue_items(self):
+        items = outline.parse_indented_text('- a\ncontinued\n\t- b\n- c')
+        self.assertEqual(item_texts(items),
+                         [('a\ncontinued', [('b', [])]), ('c', [])])
+
+    def test_markdown(self):
+        items = outline.parse_markdown(
+            '# Title\nIntro\n## Section\n- a\n  - b\n\n1. c\n# Other')
+        self.assertEqual(item_texts(items),
+                         [('Title', [('Intro', []),
+                                     ('Section', [('a', [('b', [])]),
+                                                  ('c', [])])]),
+                          ('Other', [])])
+
+    def test_opml(self):
+        file = io.BytesIO(b'<opml version="2.0"><head><title>t</title></head>'
+                          b'<body><outline text="a" _note="note">'
+                          b'<outline text="b"/></outline><outline text="c"/>'
+                          b'</body></opml>')
+        self.assertEqual(item_texts(outline.parse_opml(file)),
+                         [('a\nnote', [('b', [])]), ('c', [])])
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from PyQt5.QtWidgets import QApplication
+from treenote import saver, util
+
+
+class TestWriteAtomically(TestCase):
+    """Test of the atomic replacement of saved files"""
+
+    def test_write_atomically(self):
+        """the file is replaced and no temporary file is left behind"""
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'tree.treenote')
+        with open(path, 'wb') as file:
+            file.write(b'old')
+        util.write_atomically(path, b'new', fsync=True)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'new')
+        self.assertEqual(os.listdir(folder), ['tree.treenote'])
+
+
+class TestSaver(TestCase):
+    """Test of saving the tree in a background thread"""
+
+    def setUp(self):
+        self.app = QApplication([])
+        self.path = os.path.join(tempfile.mkdtemp(), 'tree.treenote')
+        self.version = 0  # changed by the tests, like the tree
+        self.snapshots = 0
+        self.writes = []
+        self.saved = []
+        self.failed = []
+
+    def tearDown(self):
+        del self.app
+
+    def create_saver(self, interval):
+        self.saver = saver.Saver(None, self.take_snapshot, interval)
+        self.saver.saved.connect(self.saved.append)
+        self.saver.failed.connect(self.failed.append)
+
+    def take_snapshot(self):
+        self.snapshots += 1
+        data = str(self.version).encode()
+
+        def serialize():
+            self.writes.append(data)
+            return data
+        return self.path, serialize, self.version
+
+    def process_events(self, seconds):
+        end = time.time() + seconds
+        while time.time() < end:
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_changes_within_interval_are_written_once(self):
+        self.create_saver(0.1)
+        for self.version in range(3):
+            self.saver.mark_dirty()
+        self.process_events(0.5)
+        self.saver.flush()
+        self.process_events(0.1)  # the signals of the worker are queued
+        self.assertEqual((self.snapshots, self.writes), (1, [b'2']))
+        self.assertEqual(self.saved, [2])
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), b'2')
+
+    def test_flush_writes_pending_changes(self):
+        self.create_saver(60)
+        self.saver.mark_dirty()
+        self.saver.flush()
+        self.assertFalse(self.saver.timer.isActive())
+        self.assertEqual((self.writes, self.saved), ([b'0'], [0]))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_discard_drops_pending_changes(self):
+        self.create_saver(0.1)
+        self.saver.mark_dirty()
+        self.saver.discard()
+        self.process_events(0.3)
+        self.saver.flush()
+        self.assertEqual((self.snapshots, self.writes), (0, []))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_errors_are_reported(self):
+        """saving synchronously and in the background fail the same way"""
+        self.path = os.path.join(self.path, 'missing folder', 'tree')
+        self.create_saver(0.1)
+        self.assertFalse(self.saver.save())
+        self.saver.mark_dirty()
+        self.process_events(0.3)
+        self.saver.flush()
+        self.process_events(0.1)
+        self.assertEqual(len(self.failed), 2)
+        self.assertEqual(self.saved, [])
@@ -0,0 +1,68 @@
+import pickle
+from unittest import TestCase
+from PyQt5.QtWidgets import QApplication
+from treenote import binary_format, main
+from treenote.main import MainWindow
+from tree_helpers import texts
+
+
+class TestSnapshot(TestCase):
+    """Test of the immutable snapshots of the tree"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.window = MainWindow(self.app)
+        self.model = self.window.item_model
+
+    def test_snapshot_is_not_changed_by_edits(self):
+        snapshot = self.model.snapshot()
+        old_texts = texts(self.model.rootItem)
+        self.model.set_data('changed', index=self.model.index(
+            0, 0, self.model.index(0, 0)))
+        new_snapshot = self.model.snapshot()
+        self.assertEqual(texts(snapshot.root_item()), old_texts)
+        root_item = new_snapshot.root_item()
+        self.assertEqual(texts(root_item), texts(self.model.rootItem))
+        self.assertEqual(root_item.childItems[0].childItems[0].text, 'changed')
+        self.assertIs(root_item.childItems[0].childItems[0].parentItem,
+                      root_item.childItems[0])
+        # the unchanged subtrees are shared
+        child_nodes = snapshot.node[2][0][2]
+        new_child_nodes = new_snapshot.node[2][0][2]
+        self.assertIsNot(new_child_nodes[0], child_nodes[0])
+        self.assertIs(new_child_nodes[1], child_nodes[1])
+
+        self.model.undoStack.undo()
+        self.assertEqual(texts(self.model.snapshot().root_item()), old_texts)
+
+    def test_unchanged_tree_gives_the_same_nodes(self):
+        self.assertIs(self.model.snapshot().node, self.model.snapshot().node)
+
+    def test_saver_serializes_like_the_shown_tree(self):
+        """the Saver serializes a snapshot in its thread. The file is the
+        same as if the shown tree was serialized
+        """
+        selected_item = self.model.rootItem.childItems[0].childItems[0]
+        self.model.selected_item = selected_item
+        files = []
+        for binary in (False, True):
+            self.window.storage_mode = (main.STORAGE_BINARY if binary else
+                                        main.STORAGE_EVERY_CHANGE)
+            path, serialize, checkpoint = self.window.snapshot_tree()
+            files.append((binary, serialize(), checkpoint))
+        self.model.fetch_all()
+        self.window.bookmark_model.fetch_all()
+        for binary, data, checkpoint in files:
+            if binary:
+                loaded = binary_format.loads(data)
+            else:
+                loaded = pickle.loads(data)
+            self.assertEqual(loaded[0].text, selected_item.text)
+            self.assertEqual(loaded[1].journal_token, checkpoint)
+            self.assertEqual(texts(loaded[1]),
+                             texts(self.model.rootItem))
+            self.assertEqual(texts(loaded[2]),
+                             texts(self.window.bookmark_model.rootItem))
@@ -0,0 +1,38 @@
+import time
+from unittest import TestCase
+from treenote.model import Tree_item
+
+
+class TestTreeItem(TestCase):
+    """Test of the rows which Tree_item.child_number() caches"""
+
+    def test_rows_follow_changes(self):
+        root = Tree_item()
+        items = [root.add_child(i) for i in range(5)]
+        self.assertEqual([item.child_number() for item in items],
+                         [0, 1, 2, 3, 4])
+        root.childItems.insert(1, root.childItems.pop(3))
+        root.add_child(0)
+        removed_item = root.childItems.pop(3)
+        self.assertEqual([item.child_number() for item in root.childItems],
+                         [0, 1, 2, 3, 4])
+        self.assertEqual(items[3].child_number(), 2)
+        self.assertRaises(ValueError, removed_item.child_number)
+
+    def test_rows_of_many_siblings_take_constant_time(self):
+        """Qt asks for the rows of the shown items while painting, e.g. of the
+        last ones of a big project
+        """
+
+        def lookup_time(sibling_count):
+            root = Tree_item()
+            root.childItems = [Tree_item(root) for _ in range(sibling_count)]
+            shown_items = root.childItems[-50:]
+            shown_items[0].child_number()
+            start = time.perf_counter()
+            for _ in range(20):
+                for item in shown_items:
+                    item.child_number()
+            return time.perf_counter() - start
+
+        self.assertLess(lookup_time(100000), 10 * lookup_time(100))
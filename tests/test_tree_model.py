@@ -1,7 +1,9 @@
+import pickle
 from unittest import TestCase
+from PyQt5.QtCore import QModelIndex
 from PyQt5.QtWidgets import QApplication
 from treenote.main import MainWindow
-from treenote.model import TreeModel
+from treenote.model import Tree_item, TreeModel, dump_trees
 
 
 class TestTreeModel(TestCase):
@@ -22,6 +24,12 @@ class TestTreeModel(TestCase):
         del self.app
         super(TestTreeModel, self).tearDown()
 
+    def load(self, root):
+        """Sets the tree of 'root' like a tree of a file"""
+        selected_item, self.tree.rootItem, bookmark_root = pickle.loads(
+            dump_trees(None, root, Tree_item(), {}))
+        self.tree.take_lazy_children()
+
     def test_correct_init(self):
         self.assertEqual(self.tree.rootItem.header_list, ['a', 'b', 'c'])
 
@@ -41,3 +49,119 @@ class TestTreeModel(TestCase):
         self.assertEqual(index[1].column(), 0)
         # No Change after use move_vertical!
         # Todo: Add useful tests
+
+    def test_item_of_id(self):
+        root = Tree_item()
+        root.header_list = ['a', 'b', 'c']
+        collapsed = root.add_child(0)
+        hidden = collapsed.add_child(0)
+        hidden.creation_date_time = 1.5
+        copy = root.add_child(1)
+        copy.creation_date_time = 1.5
+        other = root.add_child(2)
+        other.add_child(0).creation_date_time = 3.5
+        self.load(root)
+        collapsed, copy, other = self.tree.rootItem.childItems
+        # the id of the settings is a string
+        self.assertIs(self.tree.item_of_id('1.5'), copy)
+        self.assertIn(collapsed, self.tree.unfetched)
+        self.tree.beginRemoveRows(QModelIndex(), 1, 1)
+        del self.tree.rootItem.childItems[1]
+        self.tree.endRemoveRows()
+        self.assertNotIn(1.5, self.tree.id_items)
+        hidden = self.tree.item_of_id(1.5)  # unpickled
+        self.assertIs(hidden.parentItem, collapsed)
+        # just the subtrees which contain the id are unpickled
+        self.assertIn(other, self.tree.unfetched)
+        self.assertIsNone(self.tree.item_of_id(2.5))
+        self.assertIn(2.5, self.tree.missing_ids)
+        self.assertIsNone(self.tree.item_of_id(None))
+
+        # an inserted item is found, a removed copy is replaced by another
+        copy.creation_date_time = 2.5
+        self.tree.beginInsertRows(QModelIndex(), 1, 1)
+        self.tree.rootItem.childItems.insert(1, copy)
+        self.tree.endInsertRows()
+        self.tree.register_items(copy)
+        self.assertIs(self.tree.item_of_id(2.5), copy)
+        copy.creation_date_time = 1.5
+        self.tree.register_items(copy)
+        self.tree.beginRemoveRows(self.tree.item_index(collapsed), 0, 0)
+        del collapsed.childItems[0]
+        self.tree.endRemoveRows()
+        self.assertIs(self.tree.item_of_id(1.5), copy)
+        self.assertIn(other, self.tree.unfetched)
+
+    def test_rename_link_target(self):
+        root = Tree_item()
+        root.header_list = ['a', 'b', 'c']
+        root.add_child(0).text = 'target'
+        root.add_child(1).text = 'see #target# #target#'
+        collapsed = root.add_child(2)
+        collapsed.add_child(0).text = 'also #target#'
+        other = root.add_child(3)
+        other.add_child(0).text = 'no #target#s'
+        self.load(root)
+        target, source, collapsed, other = self.tree.rootItem.childItems
+        self.assertEqual(self.tree.unfetched[collapsed].links, {'target'})
+        self.tree.set_data('new target', self.tree.item_index(target))
+        self.assertEqual(source.text, 'see #new target# #new target#')
+        self.assertEqual(collapsed.childItems[0].text, 'also #new target#')
+        # it contains no link to the target
+        self.assertIn(other, self.tree.unfetched)
+        self.assertCountEqual(self.tree.link_sources('new target'),
+                              [source, collapsed.childItems[0]])
+        self.tree.undoStack.undo()
+        self.assertEqual(source.text, 'see #target# #target#')
+        self.assertEqual(self.tree.link_sources('new target'), [])
+        self.assertIs(self.tree.item_of_text('target'), target)
+
+    def test_tag_counts(self):
+        root = Tree_item()
+        root.header_list = ['a', 'b', 'c']
+        project = root.add_child(0)
+        project.text = 'project :home'
+        project.add_child(0).text = 'call :phone :home'
+        project.add_child(1).text = 'write :home'
+        other = root.add_child(1)
+        other.add_child(0).text = 'buy :shop'
+        self.load(root)
+        project, other = self.tree.rootItem.childItems
+        self.assertEqual(self.tree.tag_counts(),
+                         {':home': 3, ':phone': 1, ':shop': 1})
+        self.assertEqual(self.tree.tag_counts(other), {':shop': 1})
+        self.tree.set_data('project', self.tree.item_index(project))
+        self.assertEqual(self.tree.tag_counts(),
+                         {':home': 2, ':phone': 1, ':shop': 1})
+        tagged_items = self.tree.tagged_items(':home')
+        self.assertEqual(sorted(item.text for item in tagged_items),
+                         ['call :phone :home', 'write :home'])
+        # it has no item with the tag
+        self.assertIn(other, self.tree.unfetched)
+        del project.childItems[0]
+        self.assertEqual(self.tree.tag_counts(project), {':home': 1})
+        self.assertEqual(self.tree.tag_counts(), {':home': 1, ':shop': 1})
+
+    def test_iter_items(self):
+        root = Tree_item()
+        root.header_list = ['a', 'b', 'c']
+        first = root.add_child(0)
+        first.text = 'first'
+        first.add_child(0).text = 'child'
+        root.add_child(1).add_child(0).text = 'collapsed'
+        self.load(root)
+        first, second = self.tree.rootItem.childItems
+        self.assertIs(next(item for item in self.tree.iter_items()
+                           if item.text == 'first'), first)
+        # the search stopped before
+        self.assertIn(second, self.tree.unfetched)
+        items = self.tree.iter_items(first, with_depth=True)
+        self.assertEqual([(item.text, depth) for item, depth in items],
+                         [('first', 0), ('child', 1)])
+        items = self.tree.iter_items(post_order=True)
+        self.assertEqual([item.text for item in items],
+                         ['child', 'first', 'collapsed', '', ''])
+        item = self.tree.rootItem
+        for i in range(5000):  # deeper than the recursion limit
+            item = item.add_child(0)
+        self.assertEqual(len(self.tree.indexes()), 5005)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+from treenote import workspace
+from treenote.model import Tree_item
+
+
+def open_tree(path, item_count):
+    root = Tree_item()
+    for i in range(item_count):
+        root.add_child(i).text = 'row {}'.format(i)
+    state = {'rootItem': root, 'unfetched': {}}
+    bookmark_state = {'rootItem': Tree_item(), 'unfetched': {}}
+    return workspace.OpenTree(path, 'every_change', state, bookmark_state,
+                              None, None, None, '', root, None)
+
+
+class TestWorkspace(TestCase):
+    """Test of the least recently used eviction of parked files"""
+
+    def test_evicts_least_recently_used(self):
+        space = workspace.Workspace(budget=1)
+        # 3 trees don't fit
+        item_count = 1024 * 1024 * 2 // 5 // (workspace.ITEM_SIZE +
+                                              len('row 1000'))
+        self.assertEqual(space.park(open_tree('a', item_count)), [])
+        self.assertEqual(space.park(open_tree('b', item_count)), [])
+        space.park(space.take('a'))  # 'a' is used more recently now
+        evicted_trees = space.park(open_tree('c', item_count))
+        self.assertEqual([evicted_tree.path for evicted_tree in evicted_trees],
+                         ['b'])
+        self.assertEqual(space.paths(), ['c', 'a'])
+        evicted_trees = space.set_budget(0)
+        self.assertEqual([evicted_tree.path for evicted_tree in evicted_trees],
+                         ['a', 'c'])
+        self.assertIsNone(space.take('a'))
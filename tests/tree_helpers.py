@@ -0,0 +1,31 @@
+"""Functions which the tests use to compare trees"""
+
+
+def item_texts(items):
+    """Returns the texts of 'items' and their descendants as nested
+    (text, [children]) pairs. The children of collapsed items are unpickled,
+    see model.LazyChildren.
+    """
+    return [(item.text, texts(item)) for item in items]
+
+
+def texts(item):
+    """Returns the texts of the descendants of 'item', see item_texts()"""
+    child_items = item.childItems
+    if not isinstance(child_items, list):
+        child_items = child_items.load(item)
+    return item_texts(child_items)
+
+
+def item_dicts(root_item):
+    """Returns the attributes and the count of children of each item"""
+    dicts = []
+    stack = [root_item]
+    while stack:
+        item = stack.pop()
+        dicts.append({key: value
+                      for key, value in item.__getstate__().items()
+                      if key not in ('parentItem', 'childItems')})
+        dicts.append(len(item.childItems))
+        stack.extend(item.childItems)
+    return dicts
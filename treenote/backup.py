@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Differential backups.
+
+A backup file contains the items as JSON objects keyed by a stable id. Instead of its children, an object contains
+the ids of its children. A full backup contains all items. A delta backup contains just the items which changed since
+the previous backup, the ids of the removed items and the name of the previous backup ('base').
+A tree is restored by applying the deltas, in order, to the full backup they are based on.
+
+Backups may be compressed like JSON exports, e.g. 'tree_2018-01-01-10-00-00-000.delta.json.xz'.
+
+The id of an item is its creation time. Copies of an item (e.g. pasted twice) have the same creation time,
+so they get a suffix.
+
+Restore a backup from the command line with:
+    python -m treenote.backup <backup file> <exported JSON file>
+The exported JSON file can be imported in TreeNote.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import treenote.compression as compression
+import treenote.export as export
+import treenote.model as model
+
+BACKUP_VERSION = 1
+FULL_SUFFIX = '.full.json'
+DELTA_SUFFIX = '.delta.json'
+
+
+def is_backup(path):
+    return compression.strip_suffix(path).endswith((FULL_SUFFIX, DELTA_SUFFIX))
+
+
+def item_records(root_items):
+    """Returns the ids of the root items and {id: JSON object of the item}."""
+    encode = json.JSONEncoder().encode
+    item_ids = {}  # id(item): id of the backup
+    duplicate_counts = {}
+    items = []  # (item, id, child items) in pre-order
+    stack = list(reversed(root_items))
+    while stack:
+        item = stack.pop()
+        item_id = repr(getattr(item, 'creation_date_time', None))
+        if item_id in duplicate_counts:
+            duplicate_counts[item_id] += 1
+            item_id += '/{}'.format(duplicate_counts[item_id])
+        duplicate_counts[item_id] = 0
+        item_ids[id(item)] = item_id
+        child_items = export.child_items(item)  # loads LazyChildren, so they are kept here
+        items.append((item, item_id, child_items))
+        stack.extend(reversed(child_items))
+    records = {}
+    for item, item_id, child_items in items:
+        records[item_id] = '{' + ''.join(encode(key) + ': ' + encode(value) + ', '
+                                         for key, value in item.__getstate__().items()
+                                         if key != 'parentItem' and key != 'childItems') + \
+                           '"childItems": ' + encode([item_ids[id(child_item)] for child_item in child_items]) + '}'
+    return [item_ids[id(root_item)] for root_item in root_items], records
+
+
+def write_backup(root_items, path, previous_state=None, base=None, progress=None, level=compression.DEFAULT_LEVEL):
+    """Writes a full backup or, if 'previous_state' is given, a delta backup.
+
+    :param previous_state: the return value of the call which wrote the previous backup
+    :param base: the file name of the previous backup
+    :param progress: function which is called after each chunk with
+        (count of written items, count of written uncompressed bytes, seconds since the start)
+    :param level: compression level, if 'path' ends with a suffix of compression.FORMATS
+    :return: the state of this backup: {id: hash of the JSON object}
+    """
+    start_time = time.perf_counter()
+    root_ids, records = item_records(root_items)
+    state = {item_id: hash(record) for item_id, record in records.items()}
+    if previous_state is None:
+        changed_ids = list(records)
+        removed_ids = []
+    else:
+        changed_ids = [item_id for item_id, record_hash in state.items() if previous_state.get(item_id) != record_hash]
+        removed_ids = [item_id for item_id in previous_state if item_id not in state]
+    encode = json.JSONEncoder().encode
+    item_count = 0
+    byte_count = 0
+    chunk = ['{"version": ', encode(BACKUP_VERSION), ', "base": ', encode(base), ', "roots": ', encode(root_ids),
+             ', "removed": ', encode(removed_ids), ', "items": {']
+    chunk_length = sum(len(piece) for piece in chunk)
+    with compression.open_writer(path, level) as file:
+        for item_id in changed_ids:
+            piece = (', ' if item_count else '') + encode(item_id) + ': ' + records[item_id]
+            chunk.append(piece)
+            chunk_length += len(piece)
+            item_count += 1
+            if chunk_length >= export.CHUNK_SIZE:
+                # json escapes all non-ASCII characters, so the count of characters is the count of bytes
+                byte_count += file.write(''.join(chunk))
+                chunk = []
+                chunk_length = 0
+                if progress:
+                    progress(item_count, byte_count, time.perf_counter() - start_time)
+        chunk.append('}}')
+        byte_count += file.write(''.join(chunk))
+    if progress:
+        progress(item_count, byte_count, time.perf_counter() - start_time)
+    return state
+
+
+def restore(path):
+    """Rebuilds the trees as they were when the backup at 'path' was written.
+
+    :return: (root item of the item tree, root item of the bookmark tree)
+    """
+    backups = []
+    while path:
+        with open(path, 'rb') as raw_file, compression.open_reader(raw_file, path) as file:
+            backups.append(json.load(file))
+        base = backups[-1]['base']
+        path = os.path.join(os.path.dirname(path), base) if base else None
+    records = {}
+    for backup in reversed(backups):
+        for item_id in backup['removed']:
+            del records[item_id]
+        records.update(backup['items'])
+
+    def new_item(item_id, parent_item):
+        item = model.Tree_item(parent_item)
+        item.__setstate__({key: value for key, value in records[item_id].items() if key != 'childItems'})
+        stack.append((item, item_id))
+        return item
+
+    root_items = []
+    stack = []  # (item, id) of the items whose children are not created yet
+    for root_id in backups[0]['roots']:
+        root_items.append(new_item(root_id, None))
+    while stack:
+        item, item_id = stack.pop()
+        item.childItems = [new_item(child_id, item) for child_id in records[item_id]['childItems']]
+    return tuple(root_items)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Restores a differential TreeNote backup as a JSON export.')
+    parser.add_argument('backup_path', help='full or delta backup (*{} or *{}, may be compressed)'.format(
+        FULL_SUFFIX, DELTA_SUFFIX))
+    parser.add_argument('json_path', help='the JSON file to write, which can be imported in TreeNote')
+    arguments = parser.parse_args()
+    item_count = export.write_json(restore(arguments.backup_path), arguments.json_path)
+    print('Restored {} items into {}'.format(item_count, arguments.json_path))
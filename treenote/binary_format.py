@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact binary format of .treenote files.
+
+A pickled Tree_item carries all its attributes, including the names of all attributes.
+In this format, the items of both trees are stored in breadth-first order, so the children of each item are
+consecutive. Each attribute is a column: an array with one fixed size value per item. All strings are stored once
+in a string table and referenced by their number. 'type' and 'color' are numbers of small enum tables.
+Dates are stored as day numbers, estimates and planned values as numbers.
+Values which don't fit into the columns, and attributes which are not columns (e.g. 'header_list' of the root item),
+are pickled into the 'extras' section.
+
+Layout (all numbers little-endian):
+    header (HEADER)
+    columns (COLUMNS), each padded to a multiple of 8 bytes
+    type enum table, color enum table: string numbers (uint32), padded
+    string offsets: (string count + 1) uint64 byte offsets into the string data
+    string data: UTF-8
+    extras: pickled {item number: {attribute: value}}
+
+Because of the fixed layout, a single field of an item can be read from a memory-mapped file without parsing
+the rest of the file.
+"""
+
+import array
+import datetime
+import functools
+import itertools
+import math
+import operator
+import pickle
+import struct
+import sys
+
+import treenote.model as model
+
+MAGIC = b'TREENOTE'
+VERSION = 1
+# magic, version, flags, item count, number of the bookmark root item, number of the selected item, string count,
+# size of the string data, size of the extras, count of type enums, count of color enums
+HEADER = struct.Struct('<8sHHIIIIQQII')
+NO_ITEM = 0xFFFFFFFF
+
+# (attribute, array type code). 'parent', 'first_child' and 'child_count' describe the structure of the trees
+COLUMNS = (
+    ('parent', 'I'),
+    ('first_child', 'I'),
+    ('child_count', 'I'),
+    ('text', 'I'),  # string number
+    ('type', 'B'),  # enum number
+    ('color', 'B'),  # enum number
+    ('flags', 'B'),  # bits of FLAGS
+    ('planned', 'B'),
+    ('date', 'H'),  # days since FIRST_DAY. 0: no date
+    ('estimate', 'I'),  # estimate + 1. 0: no estimate
+    ('planned_order', 'i'),
+    ('search_text', 'I'),  # string number
+    ('shortcut', 'I'),  # string number + 1. 0: None
+    ('creation_date_time', 'd'),
+    ('saved_root_item_creation_date_time', 'd'),  # NaN: None
+)
+COLUMN_NAMES = tuple(name for name, type_code in COLUMNS)
+ROW_COLUMN_NAMES = COLUMN_NAMES[3:]  # the columns of the fields of an item, see item_attributes()
+FLAGS = ('expanded', 'quicklink_expanded', 'selected')
+# attributes which are stored in columns. other attributes are stored in the extras
+COLUMN_ATTRIBUTES = {'parentItem', 'childItems', 'text', 'type', 'color', 'planned', 'date', 'estimate',
+                     'planned_order', 'search_text', 'shortcut', 'creation_date_time',
+                     'saved_root_item_creation_date_time'} | set(FLAGS)
+# the value of the 'flags' column of each combination of FLAGS
+FLAG_BITS = {bits: sum(bit << number for number, bit in enumerate(bits))
+             for bits in itertools.product((0, 1), repeat=len(FLAGS))}
+EXTRAS = operator.attrgetter('extras')
+FIRST_DAY = datetime.date(1999, 12, 31)  # dates are saved as 'dd.MM.yy' and mean the years 2000 to 2099
+MAX_ENUM_COUNT = 256
+
+
+def is_binary(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def padded(size):
+    return (size + 7) // 8 * 8
+
+
+@functools.lru_cache(maxsize=4096)
+def encode_date(date):
+    """Returns the day number of a date string like '24.12.17', or None if it has an other format."""
+    if date == '':
+        return 0
+    try:
+        day_number = (datetime.datetime.strptime(date, '%d.%m.%y').date() - FIRST_DAY).days
+    except (TypeError, ValueError):
+        return None
+    return day_number if 0 < day_number <= 0xFFFF and decode_date(day_number) == date else None
+
+
+@functools.lru_cache(maxsize=4096)
+def decode_date(day_number):
+    if day_number == 0:
+        return ''
+    return (FIRST_DAY + datetime.timedelta(days=day_number)).strftime('%d.%m.%y')
+
+
+def encode_estimate(estimate):
+    """Returns the estimate + 1, if it is a string of a small number, or 0 if it is empty. Otherwise, None."""
+    if estimate == '':
+        return 0
+    if isinstance(estimate, str) and estimate.isdigit() and str(int(estimate)) == estimate \
+            and int(estimate) < 0xFFFFFFFF - 1:
+        return int(estimate) + 1
+    return None
+
+
+def loaded_child_items(item, unfetched):
+    # the children of collapsed items may still be pickled, see model.LazyChildren. they are unpickled temporarily
+    lazy_children = unfetched.get(item)
+    if lazy_children is None and isinstance(item.childItems, model.LazyChildren):
+        lazy_children = item.childItems
+    return item.childItems if lazy_children is None else lazy_children.load(item)
+
+
+def breadth_first(root_items, unfetched):
+    """Returns the items of both trees in breadth-first order and a list with the child items of each item."""
+    items = list(root_items)
+    children = []
+    # the list of items itself is the queue. it is walked without recursion, so the depth of the tree doesn't matter
+    for item in items:
+        child_items = item.childItems
+        if type(child_items) is not list or item in unfetched:
+            child_items = loaded_child_items(item, unfetched)
+        children.append(child_items)
+        items.extend(child_items)
+    return items, children
+
+
+def dumps(selected_item, root_items, unfetched):
+    """Returns the binary representation of the trees.
+
+    :param root_items: (root item of the item tree, root item of the bookmark tree)
+    :param unfetched: dict of items whose children are LazyChildren, see model.TreeModel.unfetched
+    """
+    items, children = breadth_first(root_items, unfetched)
+    columns = {name: array.array(type_code) for name, type_code in COLUMNS}
+    strings = {}  # string: number
+    enums = {'type': {}, 'color': {}}
+    extras = {}
+
+    def string_number(string):
+        number = strings.get(string)
+        if number is None:
+            number = strings[string] = len(strings)
+        return number
+
+    def set_extra(number, attribute, value):
+        extras.setdefault(number, {})[attribute] = value
+
+    # the columns are filled one after the other. they are built with map() and array, which loop in C, instead of
+    # Python code per item. values which don't fit are replaced by a default and saved as extras
+    # breadth-first order: the children of the item 'number' follow the children of the items before it
+    columns['child_count'].extend(map(len, children))
+    columns['first_child'].extend(itertools.accumulate(itertools.chain((len(root_items),), columns['child_count'])))
+    columns['first_child'].pop()
+    columns['parent'].extend(itertools.repeat(NO_ITEM, len(root_items)))
+    columns['parent'].extend(itertools.chain.from_iterable(
+        map(itertools.repeat, range(len(items)), columns['child_count'])))
+    item_extras = [(number, attributes) for number, attributes in enumerate(map(EXTRAS, items))
+                   if attributes is not None]
+
+    def field_values(name, default):
+        """Returns the values of the field 'name' of all items."""
+        if name in model.EXTRA_FIELDS:  # just the items with extras have other values than the default
+            values = [model.EXTRA_FIELDS[name]] * len(items)
+            for number, attributes in item_extras:
+                if name in attributes:
+                    values[number] = attributes[name]
+            return values
+        try:
+            return list(map(operator.attrgetter(name), items))
+        except AttributeError:  # e.g. items of old versions
+            return [getattr(item, name, default) for item in items]
+
+    def fill(name, encode, default=None, column=None):
+        """Appends encode(value) of each item to the column 'name'. encode() returns None, if the value doesn't fit.
+
+        encode() is called once per distinct value, because most columns have few distinct values.
+        """
+        values = field_values(name, default)
+        column = columns[name] if column is None else column
+        try:
+            encoded = dict.fromkeys(values)
+        except TypeError:  # e.g. a list
+            encoded = None
+        # equal values of different types like 1 and True would be merged by the dict
+        if encoded is not None and len(set(map(type, encoded)) - {type(None)}) <= 1:
+            for value in encoded:
+                encoded[value] = encode(value)
+            if None not in encoded.values():
+                column.extend(map(encoded.__getitem__, values))
+                return
+        for number, value in enumerate(values):
+            encoded_value = encode(value) if type(value) in (str, int, float, bool, type(None)) else None
+            if encoded_value is None:
+                column.append(0)
+                set_extra(number, name, value)
+            else:
+                column.append(encoded_value)
+
+    def encode_string(value):
+        return string_number(value) if type(value) is str else None
+
+    def fill_strings(name, default):
+        """Like fill(name, encode_string), but the new strings are numbered together, e.g. the mostly distinct texts."""
+        values = field_values(name, default)
+        distinct_values = dict.fromkeys(values)
+        if set(map(type, distinct_values)) != {str}:
+            fill(name, encode_string, default)
+            return
+        new_strings = [value for value in distinct_values if value not in strings]
+        strings.update(zip(new_strings, itertools.count(len(strings))))
+        columns[name].extend(map(strings.__getitem__, values))
+
+    def fill_floats(name, encode):
+        """Like fill(name, encode), but the floats are stored as they are, e.g. the mostly distinct creation times."""
+        values = field_values(name, None)
+        if set(map(type, values)) == {float}:
+            columns[name].extend(values)
+        else:
+            fill(name, encode)
+
+    def encode_enum(enum):
+        def encode(value):
+            number = enum.get(value)
+            if number is None and type(value) is str and len(enum) < MAX_ENUM_COUNT:
+                number = enum[value] = len(enum)
+            return number
+        return encode
+
+    def encode_int(minimum, maximum):
+        return lambda value: value if type(value) is int and minimum <= value <= maximum else None
+
+    def encode_flag(value):
+        return int(value) if type(value) is bool else None
+
+    def encode_float(value):
+        return value if type(value) is float and value == value else math.nan if value is None else None  # NaN: None
+
+    fill_strings('text', default='')
+    fill('type', encode_enum(enums['type']))
+    fill('color', encode_enum(enums['color']))
+    fill('planned', encode_int(0, 0xFF), default=0)
+    fill('date', encode_date, default='')
+    fill('estimate', encode_estimate, default='')
+    fill('planned_order', encode_int(-2 ** 31, 2 ** 31 - 1), default=0)
+    fill_strings('search_text', default='')
+    fill('shortcut', lambda value: 0 if value is None else string_number(value) + 1 if type(value) is str else None)
+    fill_floats('creation_date_time', lambda value: value if type(value) is float else None)
+    fill('saved_root_item_creation_date_time', encode_float)
+    flag_columns = []
+    for flag in FLAGS:
+        flag_columns.append(array.array('B'))
+        fill(flag, encode_flag, default=False, column=flag_columns[-1])
+    columns['flags'].extend(map(FLAG_BITS.__getitem__, zip(*flag_columns)))
+    for number, attributes in item_extras:
+        for attribute, value in attributes.items():
+            if attribute not in COLUMN_ATTRIBUTES:
+                set_extra(number, attribute, value)
+
+    enum_tables = [array.array('I', [string_number(value) for value in enums[enum_name]])
+                   for enum_name in ('type', 'color')]
+    # dicts keep the insertion order, which is the order of the numbers
+    encoded_strings = [string.encode('utf-8', 'surrogatepass') for string in strings]
+    string_data = b''.join(encoded_strings)
+    string_offsets = array.array('Q', itertools.accumulate(itertools.chain((0,), map(len, encoded_strings))))
+    extras_data = pickle.dumps(extras, protocol=pickle.HIGHEST_PROTOCOL) if extras else b''
+
+    try:
+        selected_number = list(map(id, items)).index(id(selected_item))
+    except ValueError:  # e.g. None
+        selected_number = NO_ITEM
+    parts = [HEADER.pack(MAGIC, VERSION, 0, len(items), len(root_items) - 1, selected_number, len(strings),
+                         len(string_data), len(extras_data), len(enum_tables[0]), len(enum_tables[1]))]
+    for column_array in [columns[name] for name in COLUMN_NAMES] + enum_tables + [string_offsets]:
+        if sys.byteorder == 'big':
+            column_array.byteswap()
+        data = column_array.tobytes()
+        parts.append(data + bytes(padded(len(data)) - len(data)))
+    parts.append(string_data)
+    parts.append(extras_data)
+    return b''.join(parts)
+
+
+class Layout():
+    """The sections of a file in this format. The columns are memoryviews into 'buffer', nothing is copied."""
+
+    def __init__(self, buffer):
+        """:param buffer: bytes or a mmap of the file"""
+        if len(buffer) < HEADER.size:
+            raise ValueError('The file is too short')
+        (magic, version, flags, self.item_count, self.bookmark_root_number, self.selected_number, self.string_count,
+         string_data_size, extras_size, type_count, color_count) = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError('The file is not in the binary TreeNote format')
+        if version > VERSION:
+            raise ValueError('The file was saved by a newer version of TreeNote')
+        self.view = view = memoryview(buffer)
+        offset = HEADER.size
+        sections = [(name, type_code, self.item_count) for name, type_code in COLUMNS] + \
+                   [('type_enum', 'I', type_count), ('color_enum', 'I', color_count),
+                    ('string_offsets', 'Q', self.string_count + 1)]
+        self.columns = {}
+        for name, type_code, count in sections:
+            size = array.array(type_code).itemsize * count
+            if offset + size > len(buffer):
+                raise ValueError('The file is truncated')
+            self.columns[name] = view[offset:offset + size].cast(type_code)
+            offset += padded(size)
+        self.string_data = view[offset:offset + string_data_size]
+        offset += string_data_size
+        self.extras_data = view[offset:offset + extras_size]
+        if offset + extras_size > len(buffer):
+            raise ValueError('The file is truncated')
+        if sys.byteorder == 'big':  # the columns must be copied and swapped
+            for name, column in self.columns.items():
+                swapped = array.array(column.format, column)
+                swapped.byteswap()
+                self.columns[name] = memoryview(swapped)
+        self.type_enum = [self.string(number) for number in self.columns['type_enum']]
+        self.color_enum = [self.string(number) for number in self.columns['color_enum']]
+
+    def string(self, number):
+        offsets = self.columns['string_offsets']
+        return str(self.string_data[offsets[number]:offsets[number + 1]], 'utf-8', 'surrogatepass')
+
+    def row(self, number):
+        """Returns the values of the item 'number' for item_attributes()."""
+        return tuple(self.columns[name][number] for name in ROW_COLUMN_NAMES)
+
+    def strings(self):
+        offsets = self.columns['string_offsets'].tolist()
+        data = self.string_data.tobytes()
+        return [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(offsets, offsets[1:])]
+
+    def extras(self):
+        return pickle.loads(self.extras_data) if len(self.extras_data) else {}
+
+    def release(self):
+        # a mmap can't be closed while memoryviews into it exist
+        for column in self.columns.values():
+            column.release()
+        self.string_data.release()
+        self.extras_data.release()
+        self.view.release()
+
+
+def item_attributes(row, string, type_enum, color_enum):
+    """Returns the attributes of an item like Tree_item.__init__() sets them, but without parentItem and childItems.
+
+    :param row: the values of the columns from 'text' to the last column
+    :param string: function which returns the string of a string number
+    """
+    (text, type_number, color_number, flags, planned, date, estimate, planned_order, search_text, shortcut,
+     creation_date_time, saved_root) = row
+    return {
+        'text': string(text),
+        'type': type_enum[type_number] if type_enum else model.NOTE,
+        'date': decode_date(date) if date else '',
+        'color': color_enum[color_number] if color_enum else model.NO_COLOR,
+        'estimate': str(estimate - 1) if estimate else '',
+        'expanded': bool(flags & 1),
+        'quicklink_expanded': bool(flags & 2),
+        'search_text': string(search_text),
+        'shortcut': string(shortcut - 1) if shortcut else None,
+        'saved_root_item_creation_date_time': None if saved_root != saved_root else saved_root,  # NaN
+        'creation_date_time': creation_date_time,
+        'selected': bool(flags & 4),
+        'planned': planned,
+        'planned_order': planned_order,
+    }
+
+
+def loads(data):
+    """Builds the trees from their binary representation.
+
+    :return: selected item, root item of the item tree, root item of the bookmark tree
+    """
+    layout = Layout(data)
+    strings = layout.strings()
+    new_item = model.Tree_item.__new__
+    items = []
+    # the attributes are set without calling Tree_item.__init__()
+    for row in zip(*[layout.columns[name].tolist() for name in ROW_COLUMN_NAMES]):
+        item = new_item(model.Tree_item)
+        item.__setstate__(item_attributes(row, strings.__getitem__, layout.type_enum, layout.color_enum))
+        items.append(item)
+    # breadth-first order: the children of each item are a consecutive slice of the items
+    for item, first_child, child_count in zip(items, layout.columns['first_child'].tolist(),
+                                              layout.columns['child_count'].tolist()):
+        child_items = items[first_child:first_child + child_count]
+        item.childItems = child_items
+        for child_item in child_items:
+            child_item.parentItem = item
+    items[0].parentItem = None
+    items[layout.bookmark_root_number].parentItem = None
+    for number, attributes in layout.extras().items():
+        items[number].__setstate__(attributes)
+    selected_item = items[layout.selected_number] if layout.selected_number != NO_ITEM else None
+    root_item, bookmark_root_item = items[0], items[layout.bookmark_root_number]
+    layout.release()
+    return selected_item, root_item, bookmark_root_item
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Command line interface, which reads .treenote files without starting the GUI. No QApplication is created.
+
+    python -m treenote.cli search FILE QUERY [--count] [--dates]
+    python -m treenote.cli export FILE [--format text|json] [--dates]
+    python -m treenote.cli convert PATH... [--to pickle|binary|sqlite|json] [--output FOLDER] [--check] [--jobs N]
+
+The query is the text of the search bar, e.g. 't=t date<0d' for the available tasks which are due today or earlier.
+'search' prints the rows the search bar would show, as an indented list like the plain text export,
+or with --count just the number of rows which match the query themselves. It exits with 1 if no row matches.
+'export' prints the whole tree. The output is written line by line, so it can be piped into other programs.
+'convert' loads, checks and writes many files in a process pool and prints a report per file and the throughput.
+Written files are compacted (see compaction.py), so converting files into their own format upgrades them.
+
+'search' and 'export' open the files read-only. A journal next to a file is applied in memory.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import pickle
+import sys
+import time
+
+import treenote.backup as backup
+import treenote.binary_format as binary_format
+import treenote.compaction as compaction
+import treenote.compression as compression
+import treenote.database as database
+import treenote.export as export
+import treenote.importer as importer
+import treenote.journal as journal
+import treenote.model as model
+import treenote.outline as outline
+import treenote.util as util
+
+TEXT_FORMAT = 'text'
+JSON_FORMAT = 'json'
+# formats of the convert command. a .treenote file of the storage mode 'journal' is a pickled tree, too
+PICKLE_FORMAT = 'pickle'
+BINARY_FORMAT = 'binary'
+SQLITE_FORMAT = 'sqlite'
+TREENOTE_SUFFIX = '.treenote'
+JSON_SUFFIX = '.json'
+HIT_LIST_SUFFIX = '.thlbackup'
+# the headers of trees which are built from files without them, in English like the command line
+TREE_HEADER = ['Text', 'Estimate', 'Start date']
+BOOKMARKS_HEADER = ['Bookmarks']
+
+Report = collections.namedtuple('Report', 'path converted_path item_count read_size written_size seconds error')
+
+
+def is_json(path):
+    return compression.strip_suffix(path).endswith(JSON_SUFFIX)
+
+
+def load(path):
+    """Loads the trees of a .treenote file of any storage mode, of a JSON backup or of a backup of The Hit List,
+    with all collapsed subtrees unpickled.
+
+    :return: selected item or None, (root item of the item tree, root item of the bookmark tree)
+    """
+    selected_item = None
+    if is_json(path):
+        root_items = list(backup.restore(path) if backup.is_backup(path) else importer.load_json(path))
+    elif path.endswith(HIT_LIST_SUFFIX):
+        bookmark_root_item = model.Tree_item()
+        bookmark_root_item.header_list = BOOKMARKS_HEADER
+        with open(path, 'rb') as file:
+            root_items = [outline.parse_hit_list(file, TREE_HEADER), bookmark_root_item]
+    elif database.is_database(path):
+        db = database.Database(path)
+        selected_item, root_items = db.load()
+        db.close()
+    else:
+        with open(path, 'rb') as file:
+            if binary_format.is_binary(path):
+                selected_item, *root_items = binary_format.loads(file.read())
+            else:
+                selected_item, *root_items = pickle.load(file)
+        journal.replay(path + journal.JOURNAL_SUFFIX, root_items)
+    compaction.remove_tombstones(root_items)
+    for root_item in root_items:
+        for item in compaction.all_items(root_item):  # unpickles the children of collapsed items
+            pass
+    return selected_item, tuple(root_items)
+
+
+def shown_items(root_item, query):
+    """Yields the items the search bar shows for 'query', in pre-order: the matching items and their ancestors.
+    The children of hidden items are hidden, too, as in the view.
+    """
+    stack = list(reversed(root_item.childItems))
+    while stack:
+        item = stack.pop()
+        if model.item_accepts_filter(query, item):
+            yield item
+            stack.extend(reversed(item.childItems))
+
+
+def search(args):
+    selected_item, (root_item, bookmark_root_item) = load(args.file)
+    if args.count:
+        count = sum(1 for item in compaction.all_items(root_item)
+                    if item is not root_item and model.unmatched_token(args.query, item) is None)
+        print(count)
+        return 0 if count else 1
+    shown_item_set = set(shown_items(root_item, args.query))
+    sys.stdout.writelines(export.plain_text_lines(export.outline_rows(root_item, shown_item_set), dates=args.dates))
+    return 0 if shown_item_set else 1
+
+
+def export_tree(args):
+    selected_item, root_items = load(args.file)
+    if args.format == JSON_FORMAT:
+        sys.stdout.writelines(export.json_pieces(root_items))
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.writelines(export.plain_text_lines(export.outline_rows(root_items[journal.ITEM_TREE]),
+                                                      dates=args.dates))
+    return 0
+
+
+def input_paths(paths):
+    """Yields (path, folder) of the files to convert. Folders are searched recursively, 'folder' is the one which was
+    given, so the structure below it can be copied.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.dirname(path)
+            continue
+        for folder, folder_names, file_names in os.walk(path):
+            folder_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith((TREENOTE_SUFFIX, HIT_LIST_SUFFIX)) or is_json(file_name):
+                    yield os.path.join(folder, file_name), path
+
+
+def output_path(path, base_folder, output_folder, file_format):
+    """Returns the path of the converted file: next to 'path', or in the same place below 'output_folder'."""
+    name = os.path.splitext(os.path.basename(compression.strip_suffix(path)))[0]
+    name += JSON_SUFFIX if file_format == JSON_FORMAT else TREENOTE_SUFFIX
+    folder = os.path.dirname(path)
+    if output_folder is not None:
+        folder = os.path.join(output_folder, os.path.relpath(folder, base_folder))
+    return os.path.join(folder, name)
+
+
+def check(root_items):
+    """Checks the links between the items. Raises ValueError if the trees are broken.
+
+    :return: count of items without the root items
+    """
+    item_count = 0
+    for root_item in root_items:
+        if not hasattr(root_item, 'header_list'):
+            raise ValueError('a root item has no header')
+        for item in compaction.all_items(root_item):
+            item_count += item is not root_item
+            for child_item in item.childItems:
+                if child_item.parentItem is not item:
+                    raise ValueError('the parent of the row {!r} is wrong'.format(child_item.text[:40]))
+    return item_count
+
+
+def write(path, file_format, selected_item, root_items):
+    root_item, bookmark_root_item = root_items
+    # a journal next to the loaded file was applied. the written file must not be replayed on top of it again
+    del root_item.journal_token
+    compaction.reset_unused_fields(root_item, bookmark_root_item)
+    if selected_item is None and root_item.childItems:
+        selected_item = root_item.childItems[0]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if file_format == JSON_FORMAT:
+        export.write_json(root_items, path + '.tmp')  # not compressed, see output_path()
+        os.replace(path + '.tmp', path)
+    elif file_format == SQLITE_FORMAT:
+        database.Database.create(path, selected_item, root_items).close()
+    elif file_format == BINARY_FORMAT:
+        util.write_atomically(path, binary_format.dumps(selected_item, root_items, {}))
+    else:
+        util.write_atomically(path, model.dump_trees(selected_item, root_item, bookmark_root_item, {}))
+    if os.path.exists(path + journal.JOURNAL_SUFFIX):  # its changes are in the written file
+        os.remove(path + journal.JOURNAL_SUFFIX)
+
+
+def convert_file(path, converted_path, file_format, overwrite=False):
+    """Loads, checks and writes one file. Runs in a worker process of convert().
+
+    :param converted_path: None: the file is just checked
+    :param overwrite: replace an other existing file at 'converted_path'. The file itself is always replaced
+    :return: Report. Errors are reported instead of raised, so the other files are converted anyway
+    """
+    start_time = time.perf_counter()
+    item_count = read_size = written_size = 0
+    error = None
+    try:
+        read_size = os.path.getsize(path)
+        selected_item, root_items = load(path)
+        item_count = check(root_items)
+        if converted_path is not None:
+            if os.path.exists(converted_path) and not overwrite and not os.path.samefile(path, converted_path):
+                raise FileExistsError('{} exists already, use --overwrite'.format(converted_path))
+            write(converted_path, file_format, selected_item, root_items)
+            written_size = os.path.getsize(converted_path)
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    return Report(path, converted_path, item_count, read_size, written_size, time.perf_counter() - start_time, error)
+
+
+def convert(args):
+    start_time = time.perf_counter()
+    reports = []
+    converted_paths = set()
+    futures = []
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        for path, base_folder in input_paths(args.paths):
+            converted_path = None if args.check else output_path(path, base_folder, args.output, args.to)
+            if converted_path is not None and converted_path in converted_paths:
+                reports.append(Report(path, converted_path, 0, 0, 0, 0, 'an other file is converted to the same path'))
+                print(report_line(reports[-1]), flush=True)
+                continue
+            converted_paths.add(converted_path)
+            futures.append(executor.submit(convert_file, path, converted_path, args.to, args.overwrite))
+        # the reports are printed when the files are done, not in the order of the files
+        for future in concurrent.futures.as_completed(futures):
+            reports.append(future.result())
+            print(report_line(reports[-1]), flush=True)
+    seconds = time.perf_counter() - start_time
+    item_count = sum(report.item_count for report in reports)
+    megabytes = sum(report.read_size for report in reports) / 1024 / 1024
+    failed_count = sum(1 for report in reports if report.error)
+    print('{} files, {} failed, {} rows, {:.1f} MB in {:.2f} s: {:.0f} rows/s, {:.1f} MB/s'.format(
+        len(reports), failed_count, item_count, megabytes, seconds, item_count / seconds, megabytes / seconds))
+    return 1 if failed_count else 0
+
+
+def report_line(report):
+    if report.error:
+        return 'FAILED {}: {}'.format(report.path, report.error)
+    return '{:>9} rows {:>9.1f} MB {:>7.2f} s  {}{}'.format(
+        report.item_count, report.read_size / 1024 / 1024, report.seconds, report.path,
+        ' -> ' + report.converted_path if report.converted_path else '')
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m treenote.cli',
+                                     description='Query and export TreeNote files without starting the GUI.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    search_parser = subparsers.add_parser('search', help='print the rows which the search bar shows for a query')
+    search_parser.add_argument('file')
+    search_parser.add_argument('query', help="search bar text, e.g. 't=t date<0d'")
+    search_parser.add_argument('--count', action='store_true',
+                               help='print just the number of rows which match the query themselves')
+    search_parser.add_argument('--dates', action='store_true', help='append the dates of the rows')
+    search_parser.set_defaults(function=search)
+
+    export_parser = subparsers.add_parser('export', help='print the whole tree')
+    export_parser.add_argument('file')
+    export_parser.add_argument('--format', choices=(TEXT_FORMAT, JSON_FORMAT), default=TEXT_FORMAT,
+                               help='indented plain text or JSON like a backup (default: %(default)s)')
+    export_parser.add_argument('--dates', action='store_true', help='append the dates of the rows (text only)')
+    export_parser.set_defaults(function=export_tree)
+
+    convert_parser = subparsers.add_parser(
+        'convert', help='convert, upgrade or check many files in parallel',
+        description='Converts .treenote files, JSON backups and backups of The Hit List (.thlbackup) in parallel, one '
+                    'process per core. Folders are searched recursively. Without --output, the files are written '
+                    'next to the originals, .treenote files are replaced. Close them in TreeNote before.')
+    convert_parser.add_argument('paths', nargs='+', metavar='path', help='file or folder')
+    convert_parser.add_argument('--to', choices=(PICKLE_FORMAT, BINARY_FORMAT, SQLITE_FORMAT, JSON_FORMAT),
+                                default=PICKLE_FORMAT, help='format of the written files (default: %(default)s)')
+    convert_parser.add_argument('--output', metavar='FOLDER', help='write the files into this folder')
+    convert_parser.add_argument('--overwrite', action='store_true', help='replace existing files')
+    convert_parser.add_argument('--check', action='store_true', help="just load and check the files, don't write")
+    convert_parser.add_argument('--jobs', type=int, help='count of worker processes (default: count of cores)')
+    convert_parser.set_defaults(function=convert)
+
+    args = parser.parse_args(arguments)
+    try:
+        return args.function(args)
+    except BrokenPipeError:  # e.g. piped into 'head'
+        # python would report the error again when flushing stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except OSError as e:
+        print('{}: {}'.format(parser.prog, e), file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Removal of dead data from the trees, before the file is rewritten.
+
+- Items with a delete marker (the attribute model.DELETED, see TreeModel.insert_remove_rows()) are removed with
+  their subtrees.
+- The bookmark fields of the items of the item tree are reset. Just bookmarks use them.
+- Bookmarks which focus on an item which doesn't exist anymore are reset to focus on the whole tree.
+- Attributes which Tree_item doesn't have anymore are removed. The root items keep theirs, like 'header_list'.
+
+The functions work on Tree_items without Qt. The caller resets the models around them.
+"""
+
+import treenote.model as model
+
+BOOKMARK_FIELDS = {model.SEARCH_TEXT: '', 'saved_root_item_creation_date_time': None}
+
+
+def loaded_child_items(item, load_if):
+    # the children of collapsed items may not be unpickled yet, see model.LazyChildren
+    if isinstance(item.childItems, list):
+        return item.childItems
+    if not load_if(item.childItems):
+        return ()
+    item.childItems = item.childItems.load(item)
+    return item.childItems
+
+
+def all_items(root_item, load_if=lambda lazy_children: True):
+    """Yields the items of the tree in pre-order. The tree is walked with a stack, so its depth doesn't matter.
+    The children of an item may be changed when it is yielded.
+    """
+    stack = [root_item]
+    while stack:
+        item = stack.pop()
+        if loaded_child_items(item, load_if):
+            yield item
+            stack.extend(reversed(item.childItems))
+        else:
+            yield item
+
+
+def remove_tombstones(root_items):
+    """Removes the items with a delete marker and their subtrees.
+    Collapsed subtrees which are not unpickled yet are unpickled just if they might contain a marker.
+
+    :return: count of removed items
+    """
+    removed_count = 0
+    for root_item in root_items:
+        for item in all_items(root_item, lambda lazy_children: lazy_children.might_contain(model.DELETED)):
+            if not isinstance(item.childItems, list):  # not unpickled, no marker inside
+                continue
+            removed_items = [child_item for child_item in item.childItems if getattr(child_item, model.DELETED, False)]
+            if removed_items:
+                item.childItems = [child_item for child_item in item.childItems
+                                   if not getattr(child_item, model.DELETED, False)]
+                removed_count += sum(sum(1 for _ in all_items(removed_item)) for removed_item in removed_items)
+    return removed_count
+
+
+def reset_unused_fields(root_item, bookmark_root_item):
+    """Resets bookmark fields outside of the bookmark tree, focuses of bookmarks on removed items and removes
+    attributes which are not used anymore. All items must be unpickled.
+
+    :return: count of changed fields
+    """
+    field_count = 0
+    creation_date_times = set()
+    for tree_root_item in root_item, bookmark_root_item:
+        for item in all_items(tree_root_item):
+            creation_date_times.add(item.creation_date_time)
+            if item is tree_root_item:  # the root items keep e.g. 'header_list' and 'journal_token'
+                continue
+            for field in [field for field in item.extras or () if field not in model.ITEM_FIELDS]:
+                del item.extras[field]
+                field_count += 1
+            if not item.extras:
+                item.extras = None
+            if tree_root_item is root_item:
+                for field, default in BOOKMARK_FIELDS.items():
+                    if getattr(item, field) != default:
+                        setattr(item, field, default)
+                        field_count += 1
+    for bookmark in all_items(bookmark_root_item):
+        if bookmark.saved_root_item_creation_date_time is not None and \
+                bookmark.saved_root_item_creation_date_time not in creation_date_times:
+            bookmark.saved_root_item_creation_date_time = None
+            field_count += 1
+    return field_count
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compressed JSON exports and backups.
+
+The compression format is chosen by the suffix of the path, e.g. 'backup.json.xz'.
+Files are written by a CompressingWriter: the encoder (see export.json_pieces()) writes text to it,
+and a thread of the writer compresses it. zlib, lzma and bz2 release the GIL while compressing,
+so encoding and compressing run in parallel.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+
+# suffix: (name shown in the settings, module)
+FORMATS = {
+    '.gz': ('gzip (zlib)', gzip),
+    '.xz': ('xz (lzma)', lzma),
+    '.bz2': ('bzip2', bz2),
+}
+DEFAULT_LEVEL = 6
+QUEUE_SIZE = 8  # chunks which wait for the compressor, so a slow disk doesn't let the queue grow
+
+
+def suffix(path):
+    """Returns the compression suffix of 'path' or '' if it's not compressed."""
+    for compression_suffix in FORMATS:
+        if path.endswith(compression_suffix):
+            return compression_suffix
+    return ''
+
+
+def strip_suffix(path):
+    compression_suffix = suffix(path)
+    return path[:-len(compression_suffix)] if compression_suffix else path
+
+
+def open_compressed(file, compression_suffix, mode, level=DEFAULT_LEVEL):
+    module = FORMATS[compression_suffix][1]
+    if 'w' not in mode:
+        return module.open(file, mode)
+    if module is lzma:
+        return lzma.open(file, mode, preset=level)
+    return module.open(file, mode, compresslevel=level)
+
+
+class CompressingWriter():
+    """Text file which compresses what is written to it in a thread."""
+
+    def __init__(self, path, level=DEFAULT_LEVEL):
+        self.file = open_compressed(path, suffix(path), 'wb', level)
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.compress, daemon=True)
+        self.thread.start()
+
+    def compress(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            if self.error is None:  # after an error, the rest is just taken from the queue
+                try:
+                    self.file.write(data)
+                except Exception as error:
+                    self.error = error
+
+    def write(self, text):
+        if self.error is not None:
+            raise self.error
+        data = text.encode('utf-8')
+        self.queue.put(data)
+        return len(data)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.file.close()
+        except Exception as error:
+            self.error = self.error or error
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:  # don't hide the exception of the encoder
+            self.queue.put(None)
+            self.thread.join()
+            self.file.close()
+
+
+def open_writer(path, level=DEFAULT_LEVEL):
+    """Opens a text file for writing JSON, which is compressed if 'path' has a compression suffix."""
+    if suffix(path):
+        return CompressingWriter(path, level)
+    return open(path, 'w', encoding='utf-8')
+
+
+def open_reader(raw_file, path):
+    """Opens a text file for reading JSON from the binary 'raw_file', which is decompressed if needed.
+
+    Reading from 'raw_file' itself lets callers measure the progress by the compressed bytes read.
+    """
+    compression_suffix = suffix(path)
+    if compression_suffix:
+        return io.TextIOWrapper(open_compressed(raw_file, compression_suffix, 'rb'), encoding='utf-8')
+    return io.TextIOWrapper(raw_file, encoding='utf-8')
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SQLite storage of a .treenote file.
+
+Each Tree_item is a row, keyed by an id and referencing the id of its parent item and its position among its siblings.
+The changes reported by TreeModel.log_change() (the same as the records of the journal) are translated to
+small UPDATE, INSERT and DELETE statements, so saving a change doesn't depend on the size of the tree.
+The texts are indexed with FTS5, if the SQLite library supports it. The search bar uses the index, see search().
+"""
+
+import os
+import pickle
+import re
+import sqlite3
+import weakref
+
+import treenote.journal as journal
+import treenote.model as model
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+# the words which the FTS5 tokenizer splits like the search bar filter, see is_word_search()
+WORD = re.compile(r'[0-9A-Za-z]+')
+DATABASE_VERSION = 1
+
+# these attributes have own columns. the other attributes of an item are pickled into the 'data' column
+NOT_PICKLED_FIELDS = ('parentItem', 'childItems', model.TEXT)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    tree INTEGER NOT NULL,
+    parent INTEGER,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_parent_position ON items (parent, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(text, content='items', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF text ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO items_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+SUBTREE_IDS = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT id FROM items WHERE parent = ? AND position >= ? AND position < ?
+    UNION ALL
+    SELECT items.id FROM items JOIN subtree ON items.parent = subtree.id
+)
+SELECT id FROM subtree
+"""
+
+# rows whose parent row doesn't exist anymore, e.g. after a crash of an older version. load() doesn't show them
+DELETE_ORPHANS = """
+DELETE FROM items WHERE id NOT IN (
+    WITH RECURSIVE reachable(id) AS (
+        SELECT id FROM items WHERE parent IS NULL
+        UNION ALL
+        SELECT items.id FROM items JOIN reachable ON items.parent = reachable.id
+    )
+    SELECT id FROM reachable
+)
+"""
+
+
+def is_database(path):
+    with open(path, 'rb') as file:
+        return file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def tree_rows(root_items):
+    """Yields (item, tree, parent id, position) of all items in pre-order. The ids are counted from 1 in this order."""
+    next_id = 1
+    for tree, root_item in enumerate(root_items):
+        # an explicit stack instead of recursion, so the depth of the tree doesn't matter
+        stack = [(root_item, None, 0)]
+        while stack:
+            item, parent_id, position = stack.pop()
+            yield item, tree, parent_id, position
+            # reversed, so the first child is popped first
+            stack.extend((item.childItems[child_position], next_id, child_position)
+                         for child_position in reversed(range(len(item.childItems))))
+            next_id += 1
+
+
+def is_word_search(text):
+    """Returns True if 'text' consists just of words which Database.search() finds like the search bar filter does.
+    Other searches (like tags, dates or '*part of a word*') are matched row by row.
+    """
+    tokens = text.split()
+    return bool(tokens) and all(WORD.fullmatch(token) for token in tokens)
+
+
+def item_data(item):
+    return pickle.dumps({key: value for key, value in item.__getstate__().items() if key not in NOT_PICKLED_FIELDS},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class Database():
+    def __init__(self, path):
+        """Opens the database at 'path'. It is created, if it does not exist.
+
+        Changes are collected in a transaction until commit() is called.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:  # SQLite was compiled without FTS5
+            self.has_fts = False
+        self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (DATABASE_VERSION,))
+        self.connection.commit()
+        # the rows of the items which are currently loaded
+        self.item_ids = weakref.WeakKeyDictionary()
+        self.id_items = weakref.WeakValueDictionary()
+
+    def set_id(self, item, item_id):
+        self.item_ids[item] = item_id
+        self.id_items[item_id] = item
+
+    @classmethod
+    def create(cls, path, selected_item, root_items):
+        """Writes the trees into a new database, which then replaces the file at 'path'."""
+        temp_path = path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        temp_database = cls(temp_path)
+        temp_database.write_trees(selected_item, root_items)
+        temp_database.close()
+        os.replace(temp_path, path)
+        database = cls(path)
+        # write_trees() numbers the items in the order of tree_rows()
+        for item_id, (item, tree, parent_id, position) in enumerate(tree_rows(root_items), start=1):
+            database.set_id(item, item_id)
+        return database
+
+    def insert_subtree(self, tree, parent_id, position, item):
+        stack = [(parent_id, position, item)]  # instead of recursion, like tree_rows()
+        while stack:
+            parent_id, position, item = stack.pop()
+            cursor = self.connection.execute('INSERT INTO items (tree, parent, position, text, data) '
+                                             'VALUES (?,?,?,?,?)',
+                                             (tree, parent_id, position, item.text, item_data(item)))
+            self.set_id(item, cursor.lastrowid)
+            stack.extend((cursor.lastrowid, child_position, child_item)
+                         for child_position, child_item in enumerate(item.childItems))
+
+    def write_trees(self, selected_item, root_items):
+        """Replaces the whole content of the database.
+
+        :param root_items: (root item of the item tree, root item of the bookmark tree)
+        """
+        self.connection.execute('DELETE FROM items')
+        self.item_ids.clear()
+        self.id_items.clear()
+
+        def rows():
+            for item_id, (item, tree, parent_id, position) in enumerate(tree_rows(root_items), start=1):
+                self.set_id(item, item_id)
+                yield item_id, tree, parent_id, position, item.text, item_data(item)
+
+        self.connection.executemany('INSERT INTO items VALUES (?,?,?,?,?,?)', rows())
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('selected', ?)",
+                                (self.item_ids.get(selected_item),))
+        self.connection.commit()
+
+    def load(self):
+        """Builds the trees row by row.
+
+        :return: selected item, (root item of the item tree, root item of the bookmark tree)
+        """
+        id_item_dict = {}
+
+        def get_item(item_id):
+            item = id_item_dict.get(item_id)
+            if item is None:
+                item = model.Tree_item()
+                id_item_dict[item_id] = item
+            return item
+
+        root_items = [None, None]
+        # children are appended in the order of their position, because the rows are sorted by parent and position
+        for item_id, tree, parent_id, text, data in self.connection.execute(
+                'SELECT id, tree, parent, text, data FROM items ORDER BY parent, position'):
+            item = get_item(item_id)
+            item.__setstate__(pickle.loads(data))
+            item.text = text
+            if parent_id is None:
+                root_items[tree] = item
+            else:
+                item.parentItem = get_item(parent_id)
+                item.parentItem.childItems.append(item)
+            self.set_id(item, item_id)
+        selected_row = self.connection.execute("SELECT value FROM meta WHERE key = 'selected'").fetchone()
+        selected_item = id_item_dict.get(selected_row[0]) if selected_row else None
+        if selected_item is None and root_items[journal.ITEM_TREE].childItems:
+            selected_item = root_items[journal.ITEM_TREE].childItems[0]
+        return selected_item, tuple(root_items)
+
+    def shift_positions(self, parent_id, start, end, offset):
+        """Adds 'offset' to the positions of the children from 'start' to 'end' (exclusive, None: to the last child)."""
+        if end is None:
+            self.connection.execute('UPDATE items SET position = position + ? WHERE parent = ? AND position >= ?',
+                                    (offset, parent_id, start))
+        else:
+            self.connection.execute('UPDATE items SET position = position + ? WHERE parent = ? AND position >= ? '
+                                    'AND position < ?', (offset, parent_id, start, end))
+
+    def apply(self, tree, kind, item, *args):
+        """Writes a change, which was reported by TreeModel.log_change(). See journal.py for the kinds of changes."""
+        item_id = self.item_ids[item]
+        if kind == journal.SET:
+            field, value = args
+            if field == model.TEXT:
+                self.connection.execute('UPDATE items SET text = ? WHERE id = ?', (value, item_id))
+            else:
+                data = pickle.loads(self.connection.execute('SELECT data FROM items WHERE id = ?',
+                                                            (item_id,)).fetchone()[0])
+                data[field] = value
+                self.connection.execute('UPDATE items SET data = ? WHERE id = ?',
+                                        (pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), item_id))
+        elif kind == journal.INSERT:
+            position, child_items = args
+            self.shift_positions(item_id, position, None, len(child_items))
+            for i, child_item in enumerate(child_items):
+                self.insert_subtree(tree, item_id, position + i, child_item)
+        elif kind == journal.REMOVE:
+            position, count = args
+            removed_ids = [(row[0],) for row in self.connection.execute(SUBTREE_IDS,
+                                                                        (item_id, position, position + count))]
+            self.connection.executemany('DELETE FROM items WHERE id = ?', removed_ids)
+            self.shift_positions(item_id, position + count, None, -count)
+        elif kind == journal.MOVE:
+            old_position, new_position = args
+            moved_id = self.connection.execute('SELECT id FROM items WHERE parent = ? AND position = ?',
+                                               (item_id, old_position)).fetchone()[0]
+            if new_position > old_position:
+                self.shift_positions(item_id, old_position + 1, new_position + 1, -1)
+            else:
+                self.shift_positions(item_id, new_position, old_position, 1)
+            self.connection.execute('UPDATE items SET position = ? WHERE id = ?', (new_position, moved_id))
+
+    def search(self, text):
+        """Returns the loaded items whose text contains all words of 'text'.
+        The items of a search bar filter are among them, if is_word_search() accepts the filter.
+        """
+        words = re.findall(r'\w+', text)
+        if not words:
+            return []
+        if self.has_fts:
+            query = ' '.join('"{}"'.format(word) for word in words)
+            rows = self.connection.execute('SELECT rowid FROM items_fts WHERE items_fts MATCH ?', (query,))
+        else:
+            rows = self.connection.execute('SELECT id FROM items WHERE ' + ' AND '.join(['text LIKE ?'] * len(words)),
+                                           ['%{}%'.format(word) for word in words])
+        return [self.id_items[row[0]] for row in rows if row[0] in self.id_items]
+
+    def remove_orphans(self):
+        """Deletes the rows which are not part of a tree. Returns their count."""
+        count = self.connection.execute(DELETE_ORPHANS).rowcount
+        self.connection.commit()
+        return count
+
+    def vacuum(self):
+        """Shrinks the file. SQLite keeps the pages of deleted rows otherwise."""
+        self.connection.commit()
+        self.connection.execute('VACUUM')
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Export of trees which runs in a background thread.
+
+The functions here don't use Qt, they work on a copy of the trees (see model.TreeSnapshot).
+"""
+
+import json
+import time
+
+import treenote.compression as compression
+
+CHUNK_SIZE = 64 * 1024  # characters which are written at once
+
+
+def child_items(item):
+    # the children of collapsed items may not be unpickled yet, see model.LazyChildren
+    if isinstance(item.childItems, list):
+        return item.childItems
+    return item.childItems.load(None)
+
+
+def json_pieces(root_items):
+    """Yields the trees as JSON in small pieces, one per item.
+
+    The result is the same as of json.dump(root_items) with each item encoded as its __getstate__()
+    without 'parentItem'.
+    The tree is walked with a stack instead of recursion, so the depth of the tree doesn't matter.
+    """
+    encode = json.JSONEncoder().encode
+    # iterators over the child items of the items above the current item
+    stack = [iter(root_items)]
+    separators = ['']
+    yield '['
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:  # all children written
+            stack.pop()
+            separators.pop()
+            yield ']}' if stack else ']'
+            continue
+        yield separators[-1] + '{' + ''.join(encode(key) + ': ' + encode(value) + ', '
+                                             for key, value in item.__getstate__().items()
+                                             if key != 'parentItem' and key != 'childItems') + '"childItems": ['
+        separators[-1] = ', '
+        stack.append(iter(child_items(item)))
+        separators.append('')
+
+
+def outline_rows(root_item, selected_items=None):
+    """Yields (depth, item) for the items below 'root_item' in pre-order. The children of 'root_item' have depth 0.
+
+    :param selected_items: set of items. If given, just these are yielded, but the whole tree is walked
+    """
+    stack = [(child_item, 0) for child_item in reversed(child_items(root_item))]
+    while stack:
+        item, depth = stack.pop()
+        if selected_items is None or item in selected_items:
+            yield depth, item
+        stack.extend((child_item, depth + 1) for child_item in reversed(child_items(item)))
+
+
+def plain_text_lines(rows, line_break='\n', continuation_indention='\t', dates=False):
+    """Yields a line '- text' for each (depth, item) row, indented with a tab per level.
+    The further lines of a text are indented by 'continuation_indention' more.
+
+    :param dates: append the date of an item like ' [[01.01.18]]'
+    """
+    for depth, item in rows:
+        indention = depth * '\t'
+        date = ' [[' + item.date + ']]' if dates and item.date else ''
+        yield indention + '- ' + item.text.replace('\n', line_break + indention + continuation_indention) + date + \
+            line_break
+
+
+def write_plain_text(root_item, path):
+    """Writes the tree below 'root_item' as an indented list into the file at 'path', line by line."""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(plain_text_lines(outline_rows(root_item)))
+
+
+def write_json(root_items, path, progress=None, level=compression.DEFAULT_LEVEL):
+    """Writes the trees as JSON into the file at 'path', in chunks of about CHUNK_SIZE characters.
+    The file is compressed if 'path' ends with a suffix of compression.FORMATS.
+
+    :param progress: function which is called after each chunk with
+        (count of written items, count of written uncompressed bytes, seconds since the start)
+    :param level: compression level from 1 (fast) to 9 (small)
+    """
+    start_time = time.perf_counter()
+    item_count = 0
+    byte_count = 0
+    chunk = []
+    chunk_length = 0
+    with compression.open_writer(path, level) as file:
+        for piece in json_pieces(root_items):
+            chunk.append(piece)
+            chunk_length += len(piece)
+            if piece.endswith('"childItems": ['):
+                item_count += 1
+            if chunk_length >= CHUNK_SIZE:
+                # json escapes all non-ASCII characters, so the count of characters is the count of bytes
+                byte_count += file.write(''.join(chunk))
+                chunk = []
+                chunk_length = 0
+                if progress:
+                    progress(item_count, byte_count, time.perf_counter() - start_time)
+        byte_count += file.write(''.join(chunk))
+    if progress:
+        progress(item_count, byte_count, time.perf_counter() - start_time)
+    return item_count
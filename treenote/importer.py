@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Import of JSON backups which are too big to be loaded at once.
+
+The file is read in chunks and parsed into a stream of events like ('start_map', None) or ('key', 'text').
+The items are built from these events directly, so neither the whole document nor a dict per item is held in memory.
+"""
+
+import json
+import os
+import re
+
+import treenote.compression as compression
+import treenote.model as model
+
+CHUNK_SIZE = 64 * 1024  # characters which are read at once
+
+# events
+START_MAP = 'start_map'
+END_MAP = 'end_map'
+START_ARRAY = 'start_array'
+END_ARRAY = 'end_array'
+KEY = 'key'
+VALUE = 'value'
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+LITERAL = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null|NaN|-?Infinity')
+LITERAL_VALUES = {'true': True, 'false': False, 'null': None}
+MAX_LITERAL_LENGTH = 64
+
+
+def json_events(file, progress=None):
+    """Yields (event, value) tuples while reading the JSON document of 'file' chunk by chunk.
+
+    :param progress: function which is called after each chunk with the count of read characters
+    """
+    buffer = ''
+    position = 0
+    end_of_file = False
+    read_count = 0
+    containers = []  # START_MAP or START_ARRAY of each open container
+    key_expected = False
+
+    def read_more():
+        nonlocal buffer, position, end_of_file, read_count
+        chunk = file.read(CHUNK_SIZE)
+        end_of_file = not chunk
+        read_count += len(chunk)
+        # drop what is parsed already, so just about one chunk is in memory
+        buffer = buffer[position:] + chunk
+        position = 0
+        if progress:
+            progress(read_count)
+
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if end_of_file:
+                return
+            read_more()
+            continue
+        character = buffer[position]
+        if character == '{':
+            containers.append(START_MAP)
+            key_expected = True
+            position += 1
+            yield START_MAP, None
+        elif character == '}':
+            containers.pop()
+            position += 1
+            yield END_MAP, None
+        elif character == '[':
+            containers.append(START_ARRAY)
+            key_expected = False
+            position += 1
+            yield START_ARRAY, None
+        elif character == ']':
+            containers.pop()
+            position += 1
+            yield END_ARRAY, None
+        elif character == ',':
+            key_expected = containers[-1] == START_MAP
+            position += 1
+        elif character == ':':
+            position += 1
+        elif character == '"':
+            try:
+                string, end = json.decoder.scanstring(buffer, position + 1)
+            except ValueError:  # the string continues in the next chunk
+                if end_of_file:
+                    raise
+                read_more()
+                continue
+            position = end
+            if key_expected:
+                key_expected = False
+                yield KEY, string
+            else:
+                yield VALUE, string
+        else:
+            # a literal at the end of the buffer may continue in the next chunk
+            if len(buffer) - position < MAX_LITERAL_LENGTH and not end_of_file:
+                read_more()
+                continue
+            match = LITERAL.match(buffer, position)
+            if match is None:
+                raise ValueError('Invalid JSON at character {}'.format(read_count - len(buffer) + position))
+            position = match.end()
+            literal = match.group()
+            if literal in LITERAL_VALUES:
+                yield VALUE, LITERAL_VALUES[literal]
+            elif literal.lstrip('-').isdigit():
+                yield VALUE, int(literal)
+            else:
+                yield VALUE, float(literal)
+
+
+def read_value(event, value, events):
+    """Builds the value which starts with (event, value), e.g. a list of strings."""
+    if event == VALUE:
+        return value
+    if event == START_ARRAY:
+        values = []
+        for event, value in events:
+            if event == END_ARRAY:
+                return values
+            values.append(read_value(event, value, events))
+    if event == START_MAP:
+        dic = {}
+        for event, key in events:
+            if event == END_MAP:
+                return dic
+            dic[key] = read_value(*next(events), events)
+    raise ValueError('Unexpected {} in JSON'.format(event))
+
+
+def load_json(path, progress=None):
+    """Reads a JSON backup, which was written by export.write_json() or by older versions of TreeNote.
+
+    :param progress: function which is called after each chunk with (count of read bytes, size of the file).
+        Compressed files (see compression.py) are decompressed while reading, the progress counts the compressed bytes.
+    :return: (root item of the item tree, root item of the bookmark tree)
+    """
+    size = os.path.getsize(path)
+    root_items = []
+    items = []  # the items whose maps are read currently. the last one is the parent of the next item
+    with open(path, 'rb') as raw_file, compression.open_reader(raw_file, path) as file:
+        events = json_events(file, progress and (lambda read_count: progress(raw_file.tell(), size)))
+        for event, value in events:
+            if event == START_MAP:  # the items are the only maps, besides in values of attributes
+                parent_item = items[-1] if items else None
+                item = model.Tree_item(parent_item)
+                if parent_item is None:
+                    root_items.append(item)
+                else:
+                    parent_item.childItems.append(item)
+                items.append(item)
+            elif event == END_MAP:
+                items.pop()
+            elif event == KEY:
+                if value == 'childItems':
+                    next(events)  # START_ARRAY. the next maps are the children
+                else:
+                    items[-1].__setstate__({value: read_value(*next(events), events)})
+    return tuple(root_items)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Append-only change journal of a .treenote file.
+
+Instead of pickling the whole tree after every change, each change of the tree is appended as a small record to a
+journal file next to the .treenote file. The whole tree (a snapshot) is written only from time to time.
+When opening a file, the snapshot is loaded and the journal is replayed on top of it.
+
+Items are addressed by their path, which is the list of child numbers from the root item down to the item.
+Because the records are replayed in the same order in which they were recorded, the paths are always valid.
+
+When the whole tree is saved in the background after every change, the journal is used as a write-ahead log:
+before serializing a snapshot, a CHECKPOINT record with the token of the snapshot is appended.
+When the snapshot is written, the records before the checkpoint are dropped (see Journal.truncate()).
+So the log exists just after a crash, and contains just the changes which are not in the saved snapshot.
+
+The journal file is written by the GUI thread. Everything which waits for the disk (syncing the records,
+rewriting the file without the dropped records) is done by a thread of the journal, so appending never blocks.
+"""
+
+import os
+import pickle
+import threading
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_VERSION = 2  # 2: may contain CHECKPOINT records
+
+# kinds of records
+SET = 'set'  # (SET, tree, path, field, value)
+INSERT = 'insert'  # (INSERT, tree, parent_path, position, items)
+REMOVE = 'remove'  # (REMOVE, tree, parent_path, position, count)
+MOVE = 'move'  # (MOVE, tree, parent_path, old_position, new_position)
+CHECKPOINT = 'checkpoint'  # (CHECKPOINT, token of the snapshot which contains the changes up to here)
+
+# index of the tree in the tuple of root items, which is passed to replay()
+ITEM_TREE = 0
+BOOKMARK_TREE = 1
+
+
+def item_path(item):
+    path = []
+    while item.parentItem is not None:
+        path.append(item.child_number())
+        item = item.parentItem
+    return tuple(reversed(path))
+
+
+def loaded_child_items(item):
+    # the children of collapsed items may not be unpickled yet, see model.LazyChildren
+    if not isinstance(item.childItems, list):
+        item.childItems = item.childItems.load(item)
+    return item.childItems
+
+
+def item_at_path(root_item, path):
+    item = root_item
+    for row in path:
+        item = loaded_child_items(item)[row]
+    return item
+
+
+class RecordPickler(pickle.Pickler):
+    # inserted items reference their parent item.
+    # pickling the parent would pickle the whole tree, so the reference is replaced by a placeholder
+    def __init__(self, file, parent_item):
+        super(RecordPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.parent_item = parent_item
+
+    def persistent_id(self, obj):
+        if obj is self.parent_item:
+            return 'parent'
+        return None
+
+
+class RecordUnpickler(pickle.Unpickler):
+    # the parent of inserted items is set when the record is applied
+    def persistent_load(self, pid):
+        return None
+
+
+class Journal():
+    def __init__(self, path, token, fsync=False):
+        """Creates a new, empty journal which belongs to the snapshot with the given token.
+
+        :param path: like '/home/user/tree.treenote.journal'
+        :param token: saved in the snapshot, too. A journal is only replayed on top of the snapshot with the same token.
+        :param fsync: make the flushed records durable. A thread syncs them to the disk, so flush() doesn't wait.
+            The records flushed while the thread waits for the disk are synced together in the next batch.
+        """
+        self.path = path
+        self.token = token
+        self.record_count = 0
+        self.file = open(path, 'wb')
+        pickle.dump((JOURNAL_VERSION, token), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        # token: (position after the CHECKPOINT record, record_count at the checkpoint)
+        self.checkpoints = {}
+        self.fsync = fsync
+        self.condition = threading.Condition()
+        self.unsynced = False
+        self.closing = False
+        # a truncation is done in three steps:
+        # 1. truncate() asks the thread to write the records between the checkpoint and the end of the file
+        #    into a new file (self.truncation). When it is written, the thread sets self.truncated.
+        # 2. the next flush() appends the records added meanwhile to the new file and writes to it from now on.
+        # 3. the thread syncs the new file and renames it to self.path (self.renaming). It closes the old file.
+        #    A following truncation is started only after the renaming, because it reads the file at self.path.
+        self.truncation = None  # (token, position of the checkpoint, end position, header)
+        self.truncated = None  # the truncation whose new file is written
+        self.renaming = None  # (path of the new file, old file)
+        self.requested_token = None  # truncate() was called while a truncation was running
+        self.thread = threading.Thread(target=self.run, name='Journal', daemon=True)
+        self.thread.start()
+
+    def append(self, tree, kind, item, *args):
+        # the record is pickled right away, so later changes of the items don't change the record
+        record = (kind, tree, item_path(item)) + args
+        RecordPickler(self.file, item if kind == INSERT else None).dump(record)
+        self.record_count += 1
+
+    def checkpoint(self, token):
+        """Marks that the snapshot with 'token' contains the changes recorded up to now."""
+        pickle.dump((CHECKPOINT, token), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.checkpoints[token] = self.file.tell(), self.record_count
+
+    def truncate(self, token):
+        """Drops the records before the checkpoint 'token'. Call when the snapshot with 'token' is written.
+
+        Returns at once: the file is rewritten by the thread of the journal, and replaced by a following flush().
+        Until then, the records before the checkpoint stay in the file, which is harmless: they are in the snapshot.
+        """
+        checkpoint = self.checkpoints.get(token)
+        if checkpoint is None:  # e.g. an older snapshot, which was replaced by a newer one before it was written
+            return
+        with self.condition:
+            if self.truncation is not None or self.truncated is not None:
+                self.requested_token = token  # truncated when the running truncation is done
+                return
+            self.file.flush()
+            header = pickle.dumps((JOURNAL_VERSION, token), protocol=pickle.HIGHEST_PROTOCOL)
+            self.truncation = token, checkpoint[0], self.file.tell(), header
+            self.condition.notify_all()
+
+    def finish_truncation(self):
+        """Waits until the thread has rewritten the file and replaces it. Call e.g. before checking record_count."""
+        with self.condition:
+            while self.truncation is not None:
+                self.condition.wait()
+        self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if self.truncated is not None:
+            self.replace_file()
+        if self.fsync:
+            with self.condition:
+                self.unsynced = True
+                self.condition.notify_all()
+
+    def replace_file(self):
+        token, position, end, header = self.truncated
+        new_path = self.path + '.tmp'
+        with open(self.path, 'rb') as file:
+            file.seek(end)
+            records = file.read()  # added after truncate() was called, so usually just a few
+        new_file = open(new_path, 'ab')
+        new_file.write(records)
+        new_file.flush()
+        with self.condition:
+            self.truncated = None
+            self.renaming = new_path, self.file
+            self.file = new_file
+            self.condition.notify_all()
+        record_count = self.checkpoints[token][1]
+        self.token = token
+        self.record_count -= record_count
+        self.checkpoints = {later_token: (later_position - position + len(header), later_count - record_count)
+                            for later_token, (later_position, later_count) in self.checkpoints.items()
+                            if later_position > position}
+        if self.requested_token is not None:
+            token, self.requested_token = self.requested_token, None
+            self.truncate(token)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.unsynced and self.truncation is None and self.renaming is None and not self.closing:
+                    self.condition.wait()
+                if not self.unsynced and self.truncation is None and self.renaming is None:
+                    return
+                unsynced, self.unsynced = self.unsynced, False
+                renaming, truncation = self.renaming, self.truncation
+                file = self.file
+            if unsynced and self.fsync:
+                os.fsync(file.fileno())
+            if renaming is not None:  # the new file is complete when it is synced, so the old one can be replaced
+                new_path, old_file = renaming
+                if self.fsync and not unsynced:
+                    os.fsync(file.fileno())
+                os.replace(new_path, self.path)
+                if self.fsync:
+                    sync_folder(self.path)
+                old_file.close()
+                with self.condition:
+                    self.renaming = None
+                    self.condition.notify_all()
+            if truncation is not None:
+                self.write_truncated(truncation)
+
+    def write_truncated(self, truncation):
+        token, position, end, header = truncation
+        with open(self.path, 'rb') as file:
+            file.seek(position)
+            records = file.read(end - position)
+        with open(self.path + '.tmp', 'wb') as file:
+            file.write(header + records)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        with self.condition:
+            self.truncation = None
+            self.truncated = truncation
+            self.condition.notify_all()
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        if self.truncated is not None:  # not swapped in yet; the old file is still complete
+            self.truncated = None
+            os.remove(self.path + '.tmp')
+        self.file.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+def sync_folder(path):
+    """Makes the renaming of the file at 'path' durable."""
+    if os.name == 'posix':
+        folder_descriptor = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(folder_descriptor)
+        finally:
+            os.close(folder_descriptor)
+
+
+def apply_record(record, root_items):
+    kind, tree, path = record[:3]
+    item = item_at_path(root_items[tree], path)
+    loaded_child_items(item)
+    if kind == SET:
+        field, value = record[3:]
+        setattr(item, field, value)
+    elif kind == INSERT:
+        position, child_items = record[3:]
+        for i, child_item in enumerate(child_items):
+            child_item.parentItem = item
+            item.childItems.insert(position + i, child_item)
+    elif kind == REMOVE:
+        position, count = record[3:]
+        del item.childItems[position:position + count]
+    elif kind == MOVE:
+        old_position, new_position = record[3:]
+        item.childItems.insert(new_position, item.childItems.pop(old_position))
+
+
+def replay(path, root_items):
+    """Applies the records of the journal at 'path' to the trees of a loaded snapshot.
+
+    The journal is ignored, if it belongs to a different snapshot. If the snapshot was written after the journal
+    was started, just the records after its CHECKPOINT record are applied.
+    A truncated last record (e.g. because TreeNote crashed while writing it) is skipped.
+
+    :param root_items: (root item of the item tree, root item of the bookmark tree)
+    :return: count of applied records
+    """
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, 'rb') as file:
+        try:
+            version, token = pickle.load(file)
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return 0
+        snapshot_token = getattr(root_items[ITEM_TREE], 'journal_token', None)
+        if version not in (1, JOURNAL_VERSION):
+            return 0
+        replaying = token == snapshot_token
+        while True:
+            try:
+                record = RecordUnpickler(file).load()
+            except (EOFError, pickle.UnpicklingError):
+                break
+            if record[0] == CHECKPOINT:
+                replaying = replaying or record[1] == snapshot_token
+            elif replaying:
+                apply_record(record, root_items)
+                count += 1
+    return count
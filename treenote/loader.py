@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class Loader(QObject):
+    """
+    Unpickles LazyChildren in a background thread, e.g. the children of the expanded items of a file which was
+    just opened (see TreeModel.load_expanded()). So the window shows the top level items right away.
+
+    The worker just creates new items. They are passed to the GUI thread with the loaded signal, which inserts them
+    into the tree. The LazyChildren are unpickled in the order in which they were added.
+    """
+    loaded = pyqtSignal(object, object, object)  # item, its LazyChildren, the unpickled child items or None
+
+    def __init__(self, parent):
+        super(Loader, self).__init__(parent)
+        self.condition = threading.Condition()
+        self.queue = collections.deque()  # (item, LazyChildren)
+        self.thread = None
+
+    def load(self, item, lazy_children):
+        with self.condition:
+            self.queue.append((item, lazy_children))
+            self.condition.notify_all()
+        if self.thread is None:
+            # daemon: a running thread must not prevent quitting
+            self.thread = threading.Thread(target=self.run, name='Loader', daemon=True)
+            self.thread.start()
+
+    def cancel(self):
+        """Drops the LazyChildren which were not unpickled yet, e.g. when an other file is opened."""
+        with self.condition:
+            self.queue.clear()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                item, lazy_children = self.queue.popleft()
+            try:
+                child_items = lazy_children.load(item)
+            except Exception:
+                # they stay unpickled. expanding the item unpickles them again and shows the error
+                child_items = None
+            self.loaded.emit(item, lazy_children, child_items)
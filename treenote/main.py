@@ -2,21 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import copy
-import json
+import itertools
 import logging
 import os
 import pickle
-import plistlib
 import re
 import sys
 import textwrap
+import uuid
 from functools import partial
 from traceback import format_exception
 #
 import sip  # needed for pyinstaller, get's removed with 'optimize imports'!
 from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot, QPoint, QModelIndex, QMimeData, QObject, QLocale, QTranslator, \
     QLibraryInfo, Qt, QSettings, QParallelAnimationGroup, QPropertyAnimation, QTimer, QItemSelectionModel, \
-    QItemSelection, QDate, QSize, QTime, QFileInfo, QUrl, QAbstractAnimation, QRectF
+    QItemSelection, QDate, QSize, QTime, QFileInfo, QUrl, QAbstractAnimation, QRectF, \
+    QPersistentModelIndex
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtPrintSupport import *
@@ -24,7 +25,19 @@ from PyQt5.QtPrintSupport import *
 import treenote.model as model
 import treenote.tag_model as tag_model
 import treenote.planned_model as planned_model
+import treenote.backup as backup
+import treenote.binary_format as binary_format
+import treenote.compaction as compaction
+import treenote.compression as compression
+import treenote.database as database
+import treenote.export as export
+import treenote.importer as importer
+import treenote.journal as journal
+import treenote.mapped_model as mapped_model
+import treenote.outline as outline
+import treenote.saver as saver
 import treenote.util as util
+import treenote.workspace as workspace
 from treenote.version import __version__
 from treenote.resources import qrc_resources  # get's removed with 'optimize imports'!
 
@@ -52,6 +65,16 @@ TOOLBAR_MARGIN = 6
 RESOURCE_FOLDER = resource_path('resources')
 PLAN_TAB = 'Plan'
 TREENOTE_FILE_NAME_FILTER = ".treenote (*.treenote)"
+JSON_FILE_NAME_FILTER = "*.json (*.json {})".format(' '.join('*.json' + suffix for suffix in compression.FORMATS))
+OUTLINE_FILE_NAME_FILTER = "OPML, Markdown, text (*.opml *.md *.markdown *.txt);;All files (*)"
+STORAGE_EVERY_CHANGE = 'every_change'  # pickle the whole tree after every change, log changes until it is written
+STORAGE_JOURNAL = 'journal'  # append changes to a journal, pickle the whole tree periodically and when closing
+STORAGE_SQLITE = 'sqlite'  # save each item as a row of a SQLite database, update just the changed rows
+STORAGE_BINARY = 'binary'  # save the whole tree in the compact binary format after every change
+JOURNAL_SNAPSHOT_INTERVAL = 1000  # count of journal records after which the whole tree is saved again
+SAVE_INTERVAL = 2  # seconds. changes done within this interval are saved together
+EXPORT_MESSAGE_DURATION = 5000  # ms
+DELTAS_PER_FULL_BACKUP = 20  # count of differential backups after which a full backup is written
 HOME_TREENOTE_FOLDER = os.path.join(os.path.expanduser("~"), 'TreeNote')
 if not os.path.exists(HOME_TREENOTE_FOLDER):
     os.makedirs(HOME_TREENOTE_FOLDER)
@@ -69,21 +92,76 @@ def exception_handler(type_, text, traceback):
 sys.excepthook = exception_handler
 
 
+def serialize_snapshots(binary, snapshots, selected_path):
+    """Serializes model.TreeSnapshots of the item tree and the bookmark tree, in the thread of the Saver.
+
+    :param binary: in the binary format, otherwise pickled like model.dump_trees()
+    :param selected_path: path of the selected item, see journal.item_path(). None, if no item is selected.
+    """
+    unfetched = {}
+    root_items = tuple(snapshot.root_item(unfetched) for snapshot in snapshots)
+    selected_item = None if selected_path is None else root_items[0]
+    for row in selected_path or ():
+        if selected_item in unfetched:  # the children were unpickled after the snapshot of the item was taken
+            selected_item.childItems = unfetched.pop(selected_item).load(selected_item)
+            for child_item in selected_item.childItems:
+                if isinstance(child_item.childItems, model.LazyChildren):
+                    unfetched[child_item] = child_item.childItems
+                    child_item.childItems = []
+        selected_item = selected_item.childItems[row]
+    if binary:
+        return binary_format.dumps(selected_item, root_items, unfetched)
+    return model.dump_trees(selected_item, root_items[0], root_items[1], unfetched)
+
+
 def get_current_date_time_string() -> str:
     """Returns a timestamp like 2017-02-13-22-04-31-908. It's unique because the last number is the current milliseconds."""
     return QDate.currentDate().toString('yyyy-MM-dd') + '-' + QTime.currentTime().toString('hh-mm-ss-zzz')
 
 
 class ExportThread(QThread):
+    progress = pyqtSignal(int, int, float)  # written items, written bytes, seconds
+    succeeded = pyqtSignal()
+    failed = pyqtSignal(str)  # error message
+
+    def __init__(self, snapshots, path, differential=False, previous_state=None, base=None,
+                 level=compression.DEFAULT_LEVEL):
+        """
+        :param snapshots: model.TreeSnapshot of each tree. The thread doesn't touch the shown trees.
+        :param differential: write a backup as described in backup.py instead of a JSON export.
+            It contains just the changes since the backup with 'previous_state', if given.
+        :param level: compression level, if 'path' ends with a suffix of compression.FORMATS
+        """
+        super(ExportThread, self).__init__()
+        self.snapshots = snapshots
+        self.path = path
+        self.differential = differential
+        self.previous_state = previous_state
+        self.base = base
+        self.level = level
+        self.backup_state = None
+
     def run(self):
-        splitted_path = os.path.split(self.main_window.save_path)
-        path = os.path.join(self.main_window.backup_folder,
-                            splitted_path[-1].replace('.treenote', '') + '_' + get_current_date_time_string())
-        self.main_window.save_json(path + '.json')
+        root_items = tuple(snapshot.root_item() for snapshot in self.snapshots)
+        try:
+            if self.differential:
+                self.backup_state = backup.write_backup(root_items, self.path, self.previous_state, self.base,
+                                                        self.progress.emit, self.level)
+            else:
+                export.write_json(root_items, self.path, self.progress.emit, self.level)
+        except Exception as e:  # e.g. OSError or a compressor error. the partial file is not a valid export
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit()
 
 
 class MainWindow(QMainWindow):
-    popup_json_save_failed = pyqtSignal()
+    popup_json_save_failed = pyqtSignal(str)
+    popup_save_failed = pyqtSignal(str)
 
     def __init__(self, app):
         super(MainWindow, self).__init__()
@@ -118,6 +196,19 @@ class MainWindow(QMainWindow):
         self.bookmark_model = model.TreeModel(self, header_list=BOOKMARKS_HEADER)
 
         settings = self.getQSettings()
+        self.storage_mode = settings.value('storage_mode', STORAGE_EVERY_CHANGE)
+        self.journal = None
+        self.database = None
+        # a file which is opened read-only, see open_archive()
+        self.archive = None
+        self.read_only = False
+        self.saver = saver.Saver(self, self.snapshot_tree, float(settings.value('save_interval', SAVE_INTERVAL)),
+                                 fsync=settings.value('fsync_on_save', 'false') == 'true')
+        self.saver.failed.connect(self.popup_save_failed)
+        self.saver.saved.connect(self.snapshot_saved)
+        self.save_path = None
+        # files which stay loaded after an other file is opened
+        self.workspace = workspace.Workspace(int(settings.value('workspace_budget', workspace.DEFAULT_BUDGET)))
 
         arguments = app.arguments()
         if len(arguments) > 1:
@@ -192,6 +283,8 @@ class MainWindow(QMainWindow):
 
         self.item_views_splitter = QSplitter(Qt.Horizontal)
         self.item_views_splitter.setHandleWidth(0)  # thing to grab the splitter
+        # the items found by the search bar belong to the old tree
+        self.item_model.modelAboutToBeReset.connect(self.forget_accepted_items)
 
         # third column
 
@@ -449,7 +542,10 @@ class MainWindow(QMainWindow):
         add_action('quitAction', act(self.tr('&Quit'), 'application-exit', self.close, shct=QKeySequence.Quit))
         add_action('openFileAction',
                    act(self.tr('&Open file...'), 'document-open', self.start_open_file, shct=QKeySequence.Open))
+        add_action('openArchiveAction',
+                   QAction(self.tr('Open archive &read-only...'), self, triggered=self.start_open_archive))
         add_action('newFileAction', act(self.tr('&New file...'), 'document-new', self.new_file, shct=QKeySequence.New))
+        add_action('compactFileAction', QAction(self.tr('&Compact file'), self, triggered=self.compact_file))
         add_action('importHitListAction',
                    QAction(self.tr('from The Hit List (Mac)...'), self, triggered=lambda: ImportDialog(
                        self, "*.thlbackup (*.thlbackup)", "Import from The Hit List",
@@ -458,20 +554,27 @@ class MainWindow(QMainWindow):
                        "Backup the database (this creates a .thlbackup file).\n"
                        "Task notes, creation date and modification date will get lost.\n"
                        "Tags won't be converted. You may replace their '@' with ':' manually before exporting.").exec()))
+        add_action('importOutlineAction',
+                   QAction(self.tr('from OPML, Markdown or indented text...'), self, triggered=self.import_outline))
         add_action('importJSONAction',
                    QAction(self.tr('from TreeNote JSON export...'), self, triggered=lambda: ImportDialog(
-                       self, "*.json (*.json)", "Import from TreeNote Backup", None).exec()))
+                       self, JSON_FILE_NAME_FILTER, "Import from TreeNote Backup", None).exec()))
 
         self.fileMenu = self.menuBar().addMenu(self.tr('&File'))
         self.fileMenu.addAction(self.newFileAction)
         self.fileMenu.addAction(self.openFileAction)
+        self.fileMenu.addAction(self.openArchiveAction)
+        self.openTreesMenu = self.fileMenu.addMenu(self.tr('&Switch to loaded file'))
+        self.openTreesMenu.aboutToShow.connect(self.fill_open_trees_menu)
         self.importMenu = self.fileMenu.addMenu(self.tr('&Import'))
         self.importMenu.addAction(self.importJSONAction)
         self.importMenu.addAction(self.importHitListAction)
+        self.importMenu.addAction(self.importOutlineAction)
         self.exportMenu = self.fileMenu.addMenu(self.tr('&Export'))
         self.exportMenu.addAction(self.exportJSONAction)
         self.exportMenu.addAction(self.exportPlainTextAction)
         self.fileMenu.addAction(self.printAction)
+        self.fileMenu.addAction(self.compactFileAction)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.editShortcutAction)
         self.fileMenu.addAction(self.editBookmarkAction)
@@ -645,6 +748,10 @@ class MainWindow(QMainWindow):
         if columns_hidden == 'true':
             self.toggle_columns()
 
+        self.worker = None
+        # the status bar shows the progress of exports. it is hidden when there is no message
+        self.statusBar().messageChanged.connect(lambda message: self.statusBar().setVisible(bool(message)))
+        self.statusBar().hide()
         self.backup_timer = QTimer()
         self.backup_timer.timeout.connect(self.backup_tree_if_changed)
         self.start_backup_service(settings.value('backup_interval', 0))
@@ -654,26 +761,44 @@ class MainWindow(QMainWindow):
         self.refresh_reminder_label_timer.start(6 * 60 * 60 * 1000)  # every 6 hours, time specified in ms
 
         self.print_size = float(settings.value('print_size', 1))
-        self.new_rows_plan_item_creation_date = settings.value('new_rows_plan_item_creation_date')
+        self.new_rows_plan_item_creation_date = model.to_item_id(settings.value('new_rows_plan_item_creation_date'))
         self.set_indentation_and_style_tree(settings.value('indentation', 40))
         self.backup_folder = settings.value('backup_folder', 'None set')
-
-        self.popup_json_save_failed.connect(lambda: QMessageBox(QMessageBox.NoIcon, ' ',
-                                                                "Backup failed: Could not find the folder '{}'.\n"
-                                                                "Specifiy an existing folder in the settings!".format(
-                                                                    self.backup_folder)).exec())
+        self.differential_backups = settings.value('differential_backups', 'false') == 'true'
+        self.deltas_per_full_backup = int(settings.value('deltas_per_full_backup', DELTAS_PER_FULL_BACKUP))
+        self.compression_suffix = settings.value('compression_suffix', '')  # a key of compression.FORMATS or ''
+        self.compression_level = int(settings.value('compression_level', compression.DEFAULT_LEVEL))
+        # the state of the last differential backup of the current file
+        self.backup_state = None
+        self.backup_path = None
+        self.delta_count = 0
+
+        self.popup_save_failed.connect(lambda error: QMessageBox(QMessageBox.NoIcon, ' ',
+                                                                self.tr('Saving failed:\n{}').format(error)).exec())
+        self.popup_json_save_failed.connect(lambda error: QMessageBox(QMessageBox.NoIcon, ' ',
+                                                                      "Backup failed:\n{}\nSpecifiy an existing, "
+                                                                      "writable folder '{}' in the settings!".format(
+                                                                          error, self.backup_folder)).exec())
 
     def backup_tree_if_changed(self):
-        if self.item_model.changed:
+        if self.item_model.changed and not (self.worker and self.worker.isRunning()):
             self.item_model.changed = False
-            self.worker = ExportThread()
-            self.worker.main_window = self
-            self.worker.start()
+            splitted_path = os.path.split(self.save_path)
+            path = os.path.join(self.backup_folder,
+                                splitted_path[-1].replace('.treenote', '') + '_' + get_current_date_time_string())
+            if self.differential_backups:
+                self.save_json(path, differential=True)
+            else:
+                self.save_json(path + '.json' + self.compression_suffix)
+
+    def show_export_progress(self, item_count, byte_count, seconds):
+        self.statusBar().showMessage(self.tr('Exporting: {} rows, {:.1f} MB ({:.1f} MB/s)').format(
+            item_count, byte_count / 1e6, byte_count / 1e6 / max(seconds, 1e-6)), EXPORT_MESSAGE_DURATION)
 
     def start_backup_service(self, minutes):
         self.backup_interval = int(minutes)
         self.backup_timer.stop()
-        if self.backup_interval != 0:
+        if self.backup_interval != 0 and not self.read_only:
             self.backup_timer.start(self.backup_interval * 1000 * 60)  # time specified in ms
 
     def get_widgets(self):
@@ -698,16 +823,16 @@ class MainWindow(QMainWindow):
 
     def fill_bookmarkShortcutsMenu(self):
         self.bookmarkShortcutsMenu.clear()
-        for index in self.item_model.indexes():
-            item = self.bookmark_model.getItem(index)
+        for item in self.item_model.iter_items(fetch_if=lambda lazy_children: lazy_children.shortcut):
             if item.shortcut:
+                index = self.item_model.item_index(item)
                 self.bookmarkShortcutsMenu.addAction(
                     QAction(item.text, self, shortcut=item.shortcut,
                             triggered=partial(self.focus_index, self.filter_proxy_index_from_model_index(index))))
         self.bookmarkShortcutsMenu.addSeparator()
-        for index in self.bookmark_model.indexes():
-            item = self.bookmark_model.getItem(index)
+        for item in self.bookmark_model.iter_items():
             if item.shortcut:
+                index = self.bookmark_model.item_index(item)
                 self.bookmarkShortcutsMenu.addAction(
                     QAction(item.text, self, shortcut=item.shortcut, triggered=partial(self.filter_bookmark, index)))
         if self.bookmarkShortcutsMenu.isEmpty():
@@ -735,7 +860,11 @@ class MainWindow(QMainWindow):
 
         expand_node(self.tag_view.selectionModel().currentIndex(), True)
 
-    def change_active_tree(self):
+    def change_active_tree(self, open_tree=None):
+        """Shows the trees of the models after they were replaced.
+
+        :param open_tree: the OpenTree the trees were parked in. Its search, focus and selection are restored.
+        """
         if not hasattr(self, 'item_views_splitter'):
             return
         self.focused_column().filter_proxy.setSourceModel(self.item_model)
@@ -743,16 +872,28 @@ class MainWindow(QMainWindow):
         self.quicklinks_view.setItemDelegate(model.BookmarkDelegate(self, self.item_model))
         self.set_undo_actions()
         self.old_search_text = 'dont save expanded states of last tree when switching to next tree'
-        self.setup_tag_model()
+        self.planned_view.model().refresh_model()
         self.reset_view()
-        for index in self.item_model.indexes():
-            if self.item_model.getItem(index) == self.item_model.selected_item:
-                self.select_from_to(index, index)
-                QTimer().singleShot(100, lambda: self.focused_column().view.scrollTo(
-                    self.filter_proxy_index_from_model_index(index)))
-                break
+        if open_tree is not None:
+            if open_tree.root_item is not self.item_model.rootItem:
+                self.focus_index(self.filter_proxy_index_from_model_index(
+                    self.item_model.item_index(open_tree.root_item)))
+            self.set_searchbar_text_and_search(open_tree.search_text)
+            selected_index = self.item_model.item_index(open_tree.current_item) if open_tree.current_item else None
+        else:
+            selected_index = None
+            # the selected item is never inside of a collapsed subtree which is not unpickled yet
+            if self.item_model.selected_item is not None and self.item_model.is_in_tree(self.item_model.selected_item):
+                selected_index = self.item_model.item_index(self.item_model.selected_item)
+        if selected_index is not None:
+            self.select_from_to(selected_index, selected_index)
+            # an other file may be shown until then
+            persistent_index = QPersistentModelIndex(selected_index)
+            QTimer().singleShot(100, lambda: persistent_index.isValid() and self.focused_column().view.scrollTo(
+                self.filter_proxy_index_from_model_index(QModelIndex(persistent_index))))
         self.fill_bookmarkShortcutsMenu()
-        self.setWindowTitle(self.save_path + ' - TreeNote')
+        self.backup_state = None  # the next backup of the new file is a full one
+        self.setWindowTitle(self.save_path + (self.tr(' (read-only)') if self.read_only else '') + ' - TreeNote')
 
     def set_undo_actions(self):
         if hasattr(self, 'undoAction'):
@@ -780,16 +921,33 @@ class MainWindow(QMainWindow):
         settings.setValue('splitter_sizes', self.mainSplitter.saveState())
         settings.setValue('indentation', self.focused_column().view.indentation())
         settings.setValue('backup_interval', self.backup_interval)
-        settings.setValue('last_opened_file_path', self.save_path)
+        if not self.read_only:  # archives are opened with open_archive() only
+            settings.setValue('last_opened_file_path', self.save_path)
         settings.setValue('print_size', self.print_size)
         settings.setValue('new_rows_plan_item_creation_date', self.new_rows_plan_item_creation_date)
         settings.setValue(COLUMNS_HIDDEN, self.focused_column().view.isHeaderHidden())
         settings.setValue('backup_folder', self.backup_folder)
+        settings.setValue('differential_backups', self.differential_backups)
+        settings.setValue('deltas_per_full_backup', self.deltas_per_full_backup)
+        settings.setValue('compression_suffix', self.compression_suffix)
+        settings.setValue('compression_level', self.compression_level)
+        settings.setValue('storage_mode', self.storage_mode)
+        settings.setValue('save_interval', self.saver.timer.interval() / 1000)
+        settings.setValue('fsync_on_save', self.saver.fsync)
+        settings.setValue('workspace_budget', self.workspace.budget)
 
         # save theme
         theme = 'light' if self.app.palette() == self.light_palette else 'dark'
         settings.setValue('theme', theme)
-        self.save_file()
+        self.save_file(snapshot=True)
+        if self.storage_mode in (STORAGE_EVERY_CHANGE, STORAGE_BINARY) and self.journal is not None:
+            # the file contains all changes. the write-ahead log is left behind just by a crash
+            self.journal.remove()
+            self.journal = None
+        for open_tree in self.workspace.take_all():
+            self.close_tree(open_tree)
+        if self.worker:  # let a running export finish
+            self.worker.wait()
 
     def getQSettings(self):
         return QSettings(os.path.join(HOME_TREENOTE_FOLDER, 'treenote_settings.ini'), QSettings.IniFormat)
@@ -805,7 +963,8 @@ class MainWindow(QMainWindow):
 
         # focus is either in a dialog, in item_view or in the search bar
         # item actions should be enabled while editing a row, so:
-        toggle_actions(not self.focused_column().search_bar.hasFocus(), self.item_view_actions)
+        toggle_actions(not self.focused_column().search_bar.hasFocus() and not self.read_only, self.item_view_actions)
+        self.copyAction.setEnabled(not self.focused_column().search_bar.hasFocus())
 
         toggle_actions(self.focused_column().view.state() != QAbstractItemView.EditingState,
                        self.item_view_not_editing_actions)
@@ -856,9 +1015,9 @@ class MainWindow(QMainWindow):
             self.set_searchbar_text_and_search(new_text)
 
     def get_index_by_creation_date(self, creation_date):
-        for index in self.item_model.indexes():
-            if str(self.item_model.getItem(index).creation_date_time) == str(creation_date):
-                return index
+        item = self.item_model.item_of_id(creation_date)
+        if item is not None:
+            return self.item_model.item_index(item)
 
     # set the search bar text according to the selected bookmark
     def filter_bookmark(self, bookmark_index):
@@ -1021,8 +1180,23 @@ class MainWindow(QMainWindow):
             self.focused_column().view.header().setSectionsClickable(True)
 
         # apply filter
-        self.focused_column().filter_proxy.filter = search_text
-        self.focused_column().filter_proxy.invalidateFilter()
+        filter_proxy = self.focused_column().filter_proxy
+        filter_proxy.accepted_items = None
+        if self.database is not None and database.is_word_search(search_text):
+            # the full-text index finds the matching items, instead of matching each row with its subtree
+            accepted_items = filter_proxy.accepted_items = set()
+            for item in self.database.search(search_text):
+                if model.unmatched_token(search_text, item) is None:
+                    # rows are also shown if one of their children matches
+                    while item is not None and item not in accepted_items:
+                        accepted_items.add(item)
+                        item = item.parentItem
+        elif not all(token.startswith((model.SORT, model.HIDE_TAGS, model.HIDE_FUTURE_START_DATE))
+                     for token in search_text.split()):
+            # rows are also shown if one of their children matches
+            self.item_model.fetch_all()
+        filter_proxy.filter = search_text
+        filter_proxy.invalidateFilter()
         # deselect tag if user changes the search string
         selected_tags = self.tag_view.selectionModel().selectedRows()
         if len(selected_tags) > 0 and selected_tags[0].data() not in search_text:
@@ -1069,6 +1243,8 @@ class MainWindow(QMainWindow):
 
     def expand_or_collapse_children(self, parent_index, bool_expand):
         self.focused_column().view.setExpanded(parent_index, bool_expand)  # for recursion
+        if bool_expand and self.focused_column().filter_proxy.canFetchMore(parent_index):
+            self.focused_column().filter_proxy.fetchMore(parent_index)
         for row_num in range(self.focused_column().filter_proxy.rowCount(parent_index)):
             child_index = self.focused_column().filter_proxy.index(row_num, 0, parent_index)
             self.focused_column().view.setExpanded(parent_index, bool_expand)
@@ -1115,10 +1291,16 @@ class MainWindow(QMainWindow):
         return text == '' or all(is_filter_keyword(token) for token in text.split())
 
     def rename_tag(self, tag, new_name):
-        for item in self.item_model.items():
-            if tag in item.text:
-                item.text = item.text.replace(tag, new_name)
+        # 'tag' may be a part of tags, like ':b' of ':a:b'
+        items = set()
+        for whole_tag in self.item_model.tag_counts():
+            if tag in whole_tag:
+                items.update(self.item_model.tagged_items(whole_tag))
+        for item in items:
+            item.text = item.text.replace(tag, new_name)
+            self.item_model.log_change(journal.SET, item, model.TEXT, item.text)
         self.setup_tag_model()
+        self.save_file()
 
     @pyqtSlot(QPoint)
     def open_rename_tag_contextmenu(self, point):
@@ -1258,14 +1440,6 @@ class MainWindow(QMainWindow):
     def remove_selection(self):
         self.focused_column().filter_proxy.remove_rows(self.selected_indexes())
 
-    def tree_as_string(self, item_model, index=QModelIndex(), rows_string=''):
-        indention_string = (model.indention_level(index) - 1) * '\t'
-        if index.data() is not None:
-            rows_string += indention_string + '- ' + index.data().replace('\n', '\n' + indention_string + '\t') + '\n'
-        for child_nr in range(item_model.rowCount(index)):
-            rows_string = self.tree_as_string(item_model, item_model.index(child_nr, 0, index), rows_string)
-        return rows_string
-
     def selected_indexes(self):
         return self.focusWidget().selectionModel().selectedRows()
 
@@ -1300,29 +1474,16 @@ class MainWindow(QMainWindow):
                 date = " [[" + date + "]]"
             rows_string = self.selected_indexes()[0].data() + date
         else:
-            selected_source_indexes = [self.map_to_source(index) for index in self.selected_indexes()]
-
-            def tree_as_string(index, rows_string=''):
-                indention_string = (model.indention_level(index) - 1) * '\t'
-                if index.data() is not None and index in selected_source_indexes:
-                    date = self.current_view().model().getItem(self.map_to_view(index)).date
-                    if date != "":
-                        date = " [[" + date + "]]"
-                    rows_string += indention_string + '- ' + \
-                                   index.data().replace('\n', '\r\n' + indention_string + '  ') + \
-                                   date + '\r\n'
-                for child_nr in range(self.item_model.rowCount(index)):
-                    child_index = self.item_model.index(child_nr, 0, index)
-                    rows_string = tree_as_string(child_index, rows_string)
-                return rows_string
-
-            rows_string = tree_as_string(QModelIndex())
+            selected_items = {self.item_model.getItem(self.map_to_source(index)) for index in self.selected_indexes()}
+            # collapsed subtrees which are not unpickled yet contain no selected items, so they are skipped
+            rows = list(export.outline_rows(self.item_model.rootItem, selected_items))
+            rows_string = ''.join(export.plain_text_lines(rows, line_break='\r\n', continuation_indention='  ',
+                                                          dates=True))
 
             # if a child is in the selection but not the parent: flatten
-            indention_level, left_most_index = min((model.indention_level(index), index)
-                                                   for index in selected_source_indexes)
-            for index in selected_source_indexes:
-                if index.parent() not in selected_source_indexes + [left_most_index.parent()]:
+            left_most_depth, left_most_item = min(rows, key=lambda row: row[0])
+            for depth, item in rows:
+                if item.parentItem not in selected_items and item.parentItem is not left_most_item.parentItem:
                     lines = []
                     for line in rows_string.split('\n'):
                         line = line.strip()
@@ -1408,59 +1569,37 @@ class MainWindow(QMainWindow):
             if QApplication.clipboard().mimeData().hasUrls():
                 text = '\n'.join(url.url() for url in QApplication.clipboard().mimeData().urls())
             else:
-                # paste from plain text
-                # builds a tree structure out of indented rows
-                # idea: insert new rows from top to bottom.
-                # depending on the indention, the parent will be the last inserted row with one lower indention
-                # we count the row position to know where to insert the next row
-                # \r ist for windows compatibility. strip is to remove the last linebreak
-                text = QApplication.clipboard().text().replace('\r\n', '\n').strip('\n')
-            # which format style has the text?
-            if re.search(r'(\n|^)([\t| ]*-)', text):  # each item starts with a dash
-                text = re.sub(r'\n([\t| ]*-)', r'\r\1', text)  # replaces \n which produce a new item with \r
-            else:  # each row is an item
-                text = re.sub(r'\n([\t| ]*)', r'\r\1', text)  # replaces \n which produce a new item with \r
-            lines = re.split(r'\r', text)
-            source_index = self.focused_column().filter_proxy.mapToSource(self.current_index())
-            indention_insert_position_dict = {}
-            if root_index:
-                indention_parent_index_dict = {-1: self.focused_column().filter_proxy.mapToSource(root_index)}
-            elif expanded_parent:
-                indention_parent_index_dict = {-1: source_index}
-            else:
-                indention_insert_position_dict[0] = source_index.row() + 1
-                indention_parent_index_dict = {-1: source_index.parent()}
-            # when indented with spaces, deep indentions are made with multiples of the smalles indention
-            smallest_indention = None
-            for line in lines:
-                stripped_line = line.lstrip('\t')
-                indention = len(line) - len(stripped_line)
-                if line.startswith(' '):
-                    stripped_line = line.lstrip(' ')
-                    indention = len(line) - len(stripped_line)
-                    if indention > 0:
-                        # first indentions is also smallest indention
-                        if not smallest_indention:
-                            smallest_indention = indention
-                        indention = indention / smallest_indention
-                # remove -, *, spaces and tabs from the beginning of the line
-                cleaned_line = re.sub(r'^(-|\*)? *|\t*', '', stripped_line)
-                if indention not in indention_insert_position_dict:
-                    indention_insert_position_dict[indention] = 0
-                child_index = self.paste_row(indention_insert_position_dict[indention],
-                                             indention_parent_index_dict[indention - 1], cleaned_line)
-                indention_insert_position_dict[indention] += 1
-                for key in indention_insert_position_dict.keys():
-                    if key > indention:
-                        indention_insert_position_dict[key] = 0
-                indention_parent_index_dict[indention] = child_index
-            self.save_file()
-
-    def paste_row(self, new_position, parent_index, text):
-        self.item_model.insert_remove_rows(new_position, parent_index, set_edit_focus=False)
-        child_index = self.item_model.index(new_position, 0, parent_index)
-        self.item_model.set_data(text, child_index)
-        return child_index
+                # paste from plain text. the rows are built into a tree offline and inserted at once
+                text = QApplication.clipboard().text()
+            self.insert_outline(outline.parse_indented_text(text))
+
+    def insert_position(self):
+        """Returns (position, parent index) for new rows: below the selected row, or as first children of an
+        expanded selected row, or of the shown root if it has no children.
+        """
+        if len(self.focused_column().filter_proxy.getItem(self.current_view().rootIndex()).childItems) == 0:
+            return 0, self.focused_column().filter_proxy.mapToSource(self.focused_column().view.rootIndex())
+        source_index = self.focused_column().filter_proxy.mapToSource(self.current_index())
+        if self.current_view().isExpanded(self.current_index()) and \
+                self.current_model().rowCount(self.current_index()) > 0:
+            return 0, source_index
+        return source_index.row() + 1, source_index.parent()
+
+    def insert_outline(self, items):
+        if items:
+            position, parent_index = self.insert_position()
+            self.item_model.insert_items(position, parent_index, items)
+
+    def import_outline(self):
+        path = QFileDialog.getOpenFileName(self, self.tr('Import'), self.save_folder(),
+                                           filter=OUTLINE_FILE_NAME_FILTER)[0]
+        if path:
+            try:
+                items = outline.parse_file(path)
+            except Exception as e:
+                QMessageBox.information(self, '', self.tr('Import went wrong:\n{}').format(e), QMessageBox.Ok)
+                return
+            self.insert_outline(items)
 
     # task menu actions
 
@@ -1529,17 +1668,13 @@ class MainWindow(QMainWindow):
 
     def set_plan(self, i):
         selected = self.selected_indexes()
-        creation_dates = [self.current_view().model().getItem(index).creation_date_time for index in selected]
+        items = {self.current_view().model().getItem(index) for index in selected}
         self.focused_column().filter_proxy.set_data(i, indexes=selected, field=model.PLANNED)
         if self.current_view() is self.planned_view:
-            self.select(self.get_indexes_from_creation_dates(creation_dates))
-
-    def get_indexes_from_creation_dates(self, creation_dates_list):
-        indexes = []
-        for index in self.current_view().model().indexes():
-            if self.current_view().model().getItem(index).creation_date_time in creation_dates_list:
-                indexes.append(index)
-        return indexes
+            # the rows of the plan are sorted again
+            planned_model = self.planned_view.model()
+            self.select([planned_model.index(row, 0) for row, item in enumerate(planned_model.items())
+                         if item in items])
 
     @pyqtSlot(str)
     def color_row(self, color_character):
@@ -1622,10 +1757,9 @@ class MainWindow(QMainWindow):
             # open internal link
             elif match:
                 text_to_find = match.group(1)[1:].strip(model.INTERNAL_LINK_DELIMITER)
-                for index in self.item_model.indexes():
-                    if self.item_model.getItem(index).text == text_to_find:
-                        self.focus_index(self.filter_proxy_index_from_model_index(index))
-                        break
+                item = self.item_model.item_of_text(text_to_find)
+                if item is not None:
+                    self.focus_index(self.filter_proxy_index_from_model_index(self.item_model.item_index(item)))
             # open URL in web browser
             else:
                 url_list = re.findall(util.url_regex, row_index.data())
@@ -1819,16 +1953,212 @@ class MainWindow(QMainWindow):
     def new_file(self):
         path = self.select_save_path("Save", 'new_tree.treenote', TREENOTE_FILE_NAME_FILTER)
         if len(path) > 0:
+            self.leave_file(path)
             self.save_path = path
-            self.item_model = model.TreeModel(self, header_list=self.tree_header)
-            self.bookmark_model = model.TreeModel(self, header_list=BOOKMARKS_HEADER)
+            self.start_storage()
             self.change_active_tree()
 
-    def save_file(self):
+    def log_change(self, changed_model, kind, item, *args):
+        if changed_model is self.item_model:
+            tree = journal.ITEM_TREE
+        elif changed_model is self.bookmark_model:
+            tree = journal.BOOKMARK_TREE
+        else:
+            return
+        if self.journal is not None:
+            self.journal.append(tree, kind, item, *args)
+        elif self.database is not None:
+            self.database.apply(tree, kind, item, *args)
+            # the found items may not match anymore. changed rows are matched one by one again
+            self.forget_accepted_items()
+
+    def forget_accepted_items(self):
+        for i in range(self.item_views_splitter.count()):
+            self.item_views_splitter.widget(i).filter_proxy.accepted_items = None
+
+    def journal_path(self):
+        return self.save_path + journal.JOURNAL_SUFFIX
+
+    def close_storage(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+        if self.archive is not None:
+            if self.worker:  # an export may still read the mapped file, see mapped_model.MappedChildren
+                self.worker.wait()
+            self.archive.close()
+            self.archive = None
+            self.read_only = False
+            self.start_backup_service(self.backup_interval)
+
+    def park_tree(self):
+        """Moves the shown file into the workspace, so it stays loaded. The models get new, empty trees.
+        Closes the files which don't fit into the memory budget of the workspace anymore.
+        """
+        if self.save_path is None:  # nothing is opened yet
+            return
+        if self.storage_mode in (STORAGE_EVERY_CHANGE, STORAGE_BINARY) and self.journal is not None and \
+                self.journal.record_count:
+            # the file is saved with all changes, so the write-ahead log can be removed when the file is closed
+            self.saver.save()
+            self.journal.finish_truncation()
+        else:
+            self.saver.flush()
+        if self.journal is not None:
+            self.journal.flush()
+        if self.database is not None:
+            self.database.commit()
+        # read the state of the view before the models are emptied
+        view = self.focused_column().view
+        current_index = view.selectionModel().currentIndex()
+        root_item = self.focused_column().filter_proxy.getItem(view.rootIndex())
+        current_item = self.focused_column().filter_proxy.getItem(current_index) if current_index.isValid() else None
+        open_tree = workspace.OpenTree(
+            self.save_path, self.storage_mode, self.item_model.take_tree_state(), self.bookmark_model.take_tree_state(),
+            self.journal, self.database, self.archive, self.focused_column().search_bar.text(), root_item,
+            current_item)
+        self.journal = None
+        self.database = None
+        if self.archive is not None:
+            self.archive = None
+            self.read_only = False
+            self.start_backup_service(self.backup_interval)
+        for evicted_tree in self.workspace.park(open_tree):
+            self.close_tree(evicted_tree)
+
+    def close_tree(self, open_tree):
+        """Closes the journal, database or archive of a parked file."""
+        if open_tree.journal is not None:
+            if open_tree.storage_mode in (STORAGE_EVERY_CHANGE, STORAGE_BINARY) and not open_tree.journal.record_count:
+                # the file was saved when it was parked, so the write-ahead log isn't needed
+                open_tree.journal.remove()
+            else:
+                open_tree.journal.close()
+        if open_tree.database is not None:
+            open_tree.database.close()
+        if open_tree.archive is not None:
+            if self.worker:  # an export may still read the mapped file
+                self.worker.wait()
+            open_tree.archive.close()
+
+    def activate_tree(self, open_tree):
+        """Shows a file of the workspace again."""
+        self.save_path = open_tree.path
+        self.item_model.set_tree_state(open_tree.item_state)
+        self.bookmark_model.set_tree_state(open_tree.bookmark_state)
+        self.journal = open_tree.journal
+        self.database = open_tree.database
+        self.archive = open_tree.archive
+        if self.archive is not None:
+            self.read_only = True
+            self.backup_timer.stop()
+        elif open_tree.storage_mode != self.storage_mode:  # convert the file
+            self.set_storage_mode(self.storage_mode)
+        self.item_model.load_expanded()
+        self.change_active_tree(open_tree)
+        self.update_actions()
+
+    def fill_open_trees_menu(self):
+        self.openTreesMenu.clear()
+        for path in self.workspace.paths():
+            self.openTreesMenu.addAction(QAction(path, self, triggered=partial(self.open_file, path)))
+        if self.openTreesMenu.isEmpty():
+            no_files_action = QAction(self.tr('No other files are loaded.'), self)
+            no_files_action.setDisabled(True)
+            self.openTreesMenu.addAction(no_files_action)
+
+    def set_workspace_budget(self, budget):
+        for evicted_tree in self.workspace.set_budget(budget):
+            self.close_tree(evicted_tree)
+
+    def start_storage(self, saved=False):
+        """Closes the journal or database of the previous file and saves the whole tree.
+        In journal mode, starts a new journal. In SQLite mode, writes the tree into a database.
+        Otherwise, starts a write-ahead log for the changes which are not saved yet.
+
+        :param saved: the file at self.save_path contains the trees as they are. So in the modes which save the whole
+            tree, the file is not saved again.
+        """
+        self.close_storage()
+        if saved and self.storage_mode in (STORAGE_EVERY_CHANGE, STORAGE_BINARY) and \
+                getattr(self.item_model.rootItem, 'journal_token', None) is not None:
+            self.journal = journal.Journal(self.journal_path(), self.item_model.rootItem.journal_token, fsync=True)
+        else:
+            self.write_snapshot()
+
+    def set_storage_mode(self, storage_mode):
+        self.storage_mode = storage_mode
+        if self.read_only:  # used for the next file
+            return
+        self.start_storage()
+        if storage_mode == STORAGE_SQLITE and os.path.exists(self.journal_path()):
+            os.remove(self.journal_path())  # the database contains the changes of the journal
+
+    def snapshot_tree(self):
+        """Returns (path, serialize, checkpoint) for the Saver. The trees are serialized by its thread."""
         # self.item_model.selected_item = self.focused_column().filter_proxy.getItem(self.current_index())
-        pickle.dump((self.item_model.selected_item, self.item_model.rootItem, self.bookmark_model.rootItem),
-                    open(self.save_path, 'wb'),
-                    protocol=pickle.HIGHEST_PROTOCOL)
+        checkpoint = None
+        if self.storage_mode in (STORAGE_EVERY_CHANGE, STORAGE_BINARY):
+            # after a crash, the write-ahead log is replayed from the checkpoint of the last written snapshot
+            checkpoint = self.item_model.rootItem.journal_token = uuid.uuid4().hex
+            self.item_model.item_changed(self.item_model.rootItem)
+            if self.journal is not None:
+                self.journal.checkpoint(checkpoint)
+        selected_item = self.item_model.selected_item
+        selected_path = None if selected_item is None else journal.item_path(selected_item)
+        snapshots = self.item_model.snapshot(), self.bookmark_model.snapshot()
+        return self.save_path, partial(serialize_snapshots, self.storage_mode == STORAGE_BINARY, snapshots,
+                                       selected_path), checkpoint
+
+    def snapshot_saved(self, checkpoint):
+        # the changes before the checkpoint are in the written file, so the write-ahead log doesn't need them
+        if checkpoint is not None and self.journal is not None:
+            self.journal.truncate(checkpoint)
+
+    def write_snapshot(self):
+        if self.storage_mode == STORAGE_JOURNAL:
+            # the journal is only replayed on top of the snapshot it belongs to
+            self.item_model.rootItem.journal_token = uuid.uuid4().hex
+            self.item_model.item_changed(self.item_model.rootItem)
+        if self.storage_mode == STORAGE_SQLITE:
+            # don't let a pending background save overwrite the database
+            self.saver.discard()
+            self.item_model.fetch_all()
+            if self.database is None:
+                self.database = database.Database.create(self.save_path, self.item_model.selected_item,
+                                                         (self.item_model.rootItem, self.bookmark_model.rootItem))
+            else:
+                self.database.write_trees(self.item_model.selected_item,
+                                          (self.item_model.rootItem, self.bookmark_model.rootItem))
+            return
+        if not self.saver.save():  # keep the old journal, it belongs to the snapshot in the file
+            return
+        if self.storage_mode == STORAGE_JOURNAL or self.journal is None:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = journal.Journal(self.journal_path(), self.item_model.rootItem.journal_token, fsync=True)
+
+    def save_file(self, snapshot=False):
+        """Saves all changes done since the last call.
+
+        :param snapshot: Save the whole tree right now. Otherwise, the tree is saved in the background
+            a few seconds later, and the changes are flushed to the write-ahead log until then.
+            In journal mode, the journal is flushed instead. In SQLite mode, the changed rows are committed instead.
+        """
+        if self.read_only or self.save_path is None:  # no file is opened, e.g. creating one was canceled
+            return
+        if snapshot or self.storage_mode == STORAGE_JOURNAL and self.journal.record_count >= JOURNAL_SNAPSHOT_INTERVAL:
+            self.write_snapshot()
+        elif self.database is not None:
+            self.database.commit()
+        else:
+            if self.journal is not None:
+                self.journal.flush()
+            if self.storage_mode != STORAGE_JOURNAL:
+                self.saver.mark_dirty()
 
         # this method is called everytime a change is done.
         # therefore it is the right place to set the model changed for backup purposes
@@ -1836,30 +2166,84 @@ class MainWindow(QMainWindow):
 
         self.planned_view.model().refresh_model()
 
+    def storage_size(self):
+        return sum(os.path.getsize(path) for path in (self.save_path, self.journal_path()) if os.path.exists(path))
+
+    def compact_file(self):
+        """Removes dead data from the trees (see compaction.py) and rewrites the file.
+        The undo history is cleared, because its commands may refer to removed items.
+        """
+        if self.read_only:
+            return
+        self.saver.flush()
+        old_size = self.storage_size()
+        self.item_model.fetch_all()
+        self.bookmark_model.fetch_all()
+        self.item_model.beginResetModel()
+        self.bookmark_model.beginResetModel()
+        row_count = compaction.remove_tombstones((self.item_model.rootItem, self.bookmark_model.rootItem))
+        field_count = compaction.reset_unused_fields(self.item_model.rootItem, self.bookmark_model.rootItem)
+        if self.database is not None:
+            row_count += self.database.remove_orphans()
+        # the selected item may be None, e.g. after opening a database, or of an other tree after an import
+        item = self.item_model.selected_item
+        if item is None or not self.item_model.is_in_tree(item):
+            self.item_model.selected_item = self.item_model.rootItem
+        self.item_model.endResetModel()
+        self.bookmark_model.endResetModel()
+        self.item_model.undoStack.clear()
+        self.bookmark_model.undoStack.clear()
+        self.item_model.take_lazy_children()
+        self.bookmark_model.take_lazy_children()
+        self.write_snapshot()
+        if self.database is not None:
+            self.database.vacuum()
+        self.change_active_tree()
+        QMessageBox.information(self, self.tr('Compact file'), self.tr(
+            'Removed {} rows and reset {} unused fields.\nThe file shrank from {:.1f} KB to {:.1f} KB.').format(
+            row_count, field_count, old_size / 1024, self.storage_size() / 1024), QMessageBox.Ok)
+
     def export_plain_text(self):
         path = self.select_save_path("Export", 'treenote_export.txt', "*.txt (*.txt)")
         if len(path) > 0:
-            with open(path, 'w', encoding='utf-8') as file:
-                file.write(self.tree_as_string(self.item_model))
-                QMessageBox(QMessageBox.NoIcon, ' ', 'Export successful!').exec()
+            self.item_model.fetch_all()
+            export.write_plain_text(self.item_model.rootItem, path)
+            QMessageBox(QMessageBox.NoIcon, ' ', 'Export successful!').exec()
 
     def export_json(self):
-        path = self.select_save_path("Export", 'treenote_export.json', "*.json (*.json)")
+        path = self.select_save_path("Export", 'treenote_export.json' + self.compression_suffix, JSON_FILE_NAME_FILTER)
         if len(path) > 0:
-            self.save_json(path)
-            QMessageBox(QMessageBox.NoIcon, ' ', 'Export successful!').exec()
-
-    def save_json(self, path):
-        def json_encoder(obj):
-            self.app.processEvents()
-            dic = obj.__dict__.copy()
-            del dic['parentItem']
-            return dic
-
-        try:
-            json.dump((self.item_model.rootItem, self.bookmark_model.rootItem), open(path, 'w'), default=json_encoder)
-        except FileNotFoundError:
-            self.popup_json_save_failed.emit()
+            self.save_json(path).succeeded.connect(
+                lambda: QMessageBox(QMessageBox.NoIcon, ' ', 'Export successful!').exec())
+
+    def save_json(self, path, differential=False):
+        """Writes the trees as they are now into a JSON file, in a background thread.
+
+        :param differential: write a differential backup, see backup.py. The suffixes are appended to 'path'.
+            Every DELTAS_PER_FULL_BACKUP backups, and after opening a file, a full backup is written.
+        The file is compressed in the background thread, too, if 'path' ends with a suffix of compression.FORMATS.
+        """
+        snapshots = self.item_model.snapshot(), self.bookmark_model.snapshot()
+        if differential:
+            full = self.backup_state is None or self.delta_count >= self.deltas_per_full_backup
+            path += (backup.FULL_SUFFIX if full else backup.DELTA_SUFFIX) + self.compression_suffix
+            self.worker = ExportThread(snapshots, path, differential=True,
+                                       previous_state=None if full else self.backup_state,
+                                       base=None if full else os.path.basename(self.backup_path),
+                                       level=self.compression_level)
+            self.worker.succeeded.connect(partial(self.backup_written, self.worker, full))
+        else:
+            self.worker = ExportThread(snapshots, path, level=self.compression_level)
+        self.worker.progress.connect(self.show_export_progress)
+        self.worker.failed.connect(self.popup_json_save_failed)
+        self.worker.start()
+        return self.worker
+
+    def backup_written(self, worker, full):
+        # the next differential backup contains the changes since this one
+        self.backup_state = worker.backup_state
+        self.backup_path = worker.path
+        self.delta_count = 0 if full else self.delta_count + 1
 
     def save_folder(self):
         return QFileInfo(self.save_path).absolutePath()
@@ -1867,61 +2251,140 @@ class MainWindow(QMainWindow):
     def start_open_file(self):
         path = QFileDialog.getOpenFileName(self, "Open", self.save_folder(), filter=TREENOTE_FILE_NAME_FILTER)[0]
         if path and len(path) > 0:
-            self.open_file(path)
+            try:
+                self.open_file(path)
+            except Exception as e:  # the shown file stays open
+                QMessageBox.information(self, '', self.tr('Could not open the file:\n{}').format(e), QMessageBox.Ok)
+
+    def start_open_archive(self):
+        path = QFileDialog.getOpenFileName(self, self.tr('Open archive read-only'), self.save_folder(),
+                                           filter=TREENOTE_FILE_NAME_FILTER)[0]
+        if path:
+            if binary_format.is_binary(path):
+                self.open_archive(path)
+            else:
+                QMessageBox.information(self, '', self.tr('Only files which were saved in the compact binary '
+                                                          'format can be opened read-only.'), QMessageBox.Ok)
+
+    def open_archive(self, open_path):
+        """Shows a file in the binary format without loading it. It is memory-mapped and read when rows are shown.
+        Changes, undo, saving and backups are disabled until an other file is opened.
+        """
+        self.leave_file(open_path)
+        self.archive = mapped_model.MappedTree(open_path)
+        self.read_only = True
+        self.save_path = open_path
+        self.item_model.beginResetModel()
+        self.bookmark_model.beginResetModel()
+        self.item_model.selected_item, self.item_model.rootItem, self.bookmark_model.rootItem = self.archive.load()
+        self.item_model.take_lazy_children()
+        self.bookmark_model.take_lazy_children()
+        self.item_model.endResetModel()
+        self.bookmark_model.endResetModel()
+        self.item_model.undoStack.clear()
+        self.bookmark_model.undoStack.clear()
+        self.backup_timer.stop()
+        self.change_active_tree()
+        self.update_actions()
 
     def import_backup(self, open_path, save_path):
-        self.item_model = model.TreeModel(self, header_list=self.tree_header)
-        self.bookmark_model = model.TreeModel(self, header_list=BOOKMARKS_HEADER)
-        if 'json' in open_path:
-            if 'json' in open_path:
-                def json_decoder(obj):
-                    if 'text' in obj:
-                        item = model.Tree_item()
-                        item.__dict__.update(obj)
-                        item.childItems = obj['childItems']
-                        return item
-                    return obj
-
-                self.item_model.rootItem, self.bookmark_model.rootItem = json.load(open(open_path, 'r'),
-                                                                                   object_hook=json_decoder)
+        self.leave_file(save_path)
+        if backup.is_backup(open_path):
+            self.item_model.rootItem, self.bookmark_model.rootItem = backup.restore(open_path)
+        elif 'json' in open_path:
+            progress_dialog = QProgressDialog(self.tr('Importing...'), None, 0, 100, self)
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            self.item_model.rootItem, self.bookmark_model.rootItem = importer.load_json(
+                open_path, lambda read_count, size: progress_dialog.setValue(100 * read_count // max(size, 1)))
+            progress_dialog.reset()
         else:
-            hit_list_dict = plistlib.load(open(open_path, 'rb'))
-            id_item_dict = {}
-            for task_dict in hit_list_dict['PFEntities']['Task'].values():
-                item = model.Tree_item()
-                item.text = task_dict['title']
-                date = task_dict.get('startDate')
-                if date:
-                    item.date = date.strftime('%d.%m.%y')
-                if item.text == 'ROOT':
-                    item.header_list = self.tree_header
-                    self.item_model.rootItem = item
-                item.child_id_list = task_dict.get('subtasks', [])
-                item.estimate = str(task_dict.get('priority', item.estimate))
-                id_item_dict[task_dict['uid']] = item
-
-            for item in id_item_dict.values():
-                for child_id in item.child_id_list:
-                    item.childItems.append(id_item_dict[child_id])
-                del item.child_id_list
-
-        def set_parents(parent_item):
-            for child_item in parent_item.childItems:
-                child_item.parentItem = parent_item
-                set_parents(child_item)
-
-        self.item_model.rootItem.parentItem = None
-        set_parents(self.item_model.rootItem)
-        self.bookmark_model.rootItem.parentItem = None
-        set_parents(self.bookmark_model.rootItem)
+            with open(open_path, 'rb') as file:
+                self.item_model.rootItem = outline.parse_hit_list(file, self.tree_header)
+
         self.save_path = save_path
+        self.start_storage()
         self.change_active_tree()
 
+    def leave_file(self, next_path):
+        """Parks the shown file in the workspace before an other file is shown. Empties the models.
+        A file is reloaded, if 'next_path' is the shown file, and it's closed, if it's parked.
+        """
+        parked_tree = self.workspace.take(next_path)
+        if parked_tree is not None:
+            self.close_tree(parked_tree)
+        if next_path == self.save_path:
+            self.saver.flush()
+            self.close_storage()
+            self.item_model.set_new_tree(self.tree_header)
+            self.bookmark_model.set_new_tree(BOOKMARKS_HEADER)
+        else:
+            self.park_tree()
+
     def open_file(self, open_path):
-        self.item_model.selected_item, self.item_model.rootItem, self.bookmark_model.rootItem = pickle.load(
-            open(open_path, 'rb'))
+        open_tree = self.workspace.take(open_path)
+        if open_tree is not None and open_tree.archive is None:
+            self.park_tree()
+            self.activate_tree(open_tree)
+            return
+        if open_tree is not None:  # opened read-only before
+            self.close_tree(open_tree)
+        if open_path == self.save_path:  # reloaded. the file and its journal must contain all changes
+            self.saver.flush()
+            if self.journal is not None:
+                self.journal.flush()
+            if self.database is not None:
+                self.database.commit()
+        # the file is read completely before the shown file is left. if it can't be read, the shown file stays
+        opened_database = None
+        try:
+            if database.is_database(open_path):
+                opened_database = database.Database(open_path)
+                reclaimed_count = opened_database.remove_orphans()
+                selected_item, (root_item, bookmark_root_item) = opened_database.load()
+                replayed_count = 0
+            else:
+                with open(open_path, 'rb') as file:
+                    if binary_format.is_binary(open_path):
+                        selected_item, root_item, bookmark_root_item = binary_format.loads(file.read())
+                        file_storage_mode = STORAGE_BINARY
+                    else:
+                        selected_item, root_item, bookmark_root_item = pickle.load(file)
+                        file_storage_mode = STORAGE_EVERY_CHANGE
+                # apply the changes which were saved in the journal after the snapshot was written.
+                # if the file was saved after every change, the journal is the write-ahead log left behind by a crash
+                replayed_count = journal.replay(open_path + journal.JOURNAL_SUFFIX, (root_item, bookmark_root_item))
+                reclaimed_count = 0
+            # files of older versions may contain items with a delete marker
+            reclaimed_count += compaction.remove_tombstones((root_item, bookmark_root_item))
+        except Exception:
+            if opened_database is not None:
+                opened_database.close()
+            raise
+        self.leave_file(open_path)
         self.save_path = open_path
+        self.item_model.selected_item, self.item_model.rootItem, self.bookmark_model.rootItem = \
+            selected_item, root_item, bookmark_root_item
+        # the children of collapsed items are unpickled when needed
+        self.item_model.take_lazy_children()
+        if opened_database is not None:
+            self.database = opened_database
+            if self.storage_mode != STORAGE_SQLITE:  # convert the file
+                self.start_storage()
+            elif reclaimed_count:
+                self.database.write_trees(self.item_model.selected_item,
+                                          (self.item_model.rootItem, self.bookmark_model.rootItem))
+                self.database.vacuum()
+        else:
+            # in the other storage modes, the file is converted
+            self.start_storage(saved=not replayed_count and not reclaimed_count and
+                               self.storage_mode == file_storage_mode)
+            if replayed_count and self.storage_mode == STORAGE_SQLITE:
+                os.remove(self.journal_path())
+        # the top level items are shown right away, the expanded items below them when they are unpickled
+        self.item_model.load_expanded()
         self.change_active_tree()
+        if reclaimed_count:
+            self.statusBar().showMessage(self.tr('Removed {} deleted rows').format(reclaimed_count), 5000)
 
     def print(self):
         dialog = QPrintPreviewDialog()
@@ -2010,15 +2473,15 @@ class FileLineEdit(QPlainTextEdit):
 
         self._separator = ' '
         # moving an item to its own child is not possible, so don't propose it
-        below_selection_set = set(self.main_window.focused_column().filter_proxy.mapToSource(index) for index in
+        below_selection_set = set(self.main_window.focused_column().filter_proxy.getItem(index) for index in
                                   self.main_window.selected_indexes())
-        other_indexes = set()
-        for index in self.main_window.item_model.indexes():
-            # works only, because indexes are in the right order
-            if index in below_selection_set or index.parent() in below_selection_set:
-                below_selection_set.add(index)
+        other_items = []
+        for item in itertools.islice(self.main_window.item_model.iter_items(), 1, None):
+            # works only, because parents are yielded before their children
+            if item in below_selection_set or item.parentItem in below_selection_set:
+                below_selection_set.add(item)
             else:
-                other_indexes.add(index)
+                other_items.append(item)
 
         def item_length(item_text) -> int:
             try:
@@ -2026,7 +2489,7 @@ class FileLineEdit(QPlainTextEdit):
             except TypeError:
                 return 0
 
-        self.completer = QCompleter(sorted((index.data() for index in other_indexes), key=item_length))
+        self.completer = QCompleter(sorted((item.text for item in other_items), key=item_length))
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)
         self.completer.setFilterMode(Qt.MatchStartsWith)
         self.completer.setWidget(self)
@@ -2035,8 +2498,9 @@ class FileLineEdit(QPlainTextEdit):
 
     def _insertCompletion(self, completion):
         self.popup.hide()
-        for index in self.main_window.item_model.indexes():
-            if self.main_window.item_model.getItem(index).text == completion:
+        for item in itertools.islice(self.main_window.item_model.iter_items(), 1, None):
+            if item.text == completion:
+                index = self.main_window.item_model.item_index(item)
                 lowest_index = self.main_window.focused_column().filter_proxy.mapToSource(
                     self.main_window.selected_indexes()[-1])
                 old_row = lowest_index.row()
@@ -2093,17 +2557,17 @@ class SelectRowLineEdit(QPlainTextEdit):
             self.setPlaceholderText(self.tr('Type the name of an entry'))
 
         self._separator = ' '
-        self.completer = QCompleter([index.data() for index in self.main_window.item_model.indexes()])
+        self.completer = QCompleter([item.text for item in
+                                     itertools.islice(self.main_window.item_model.iter_items(), 1, None)])
         self.completer.setFilterMode(Qt.MatchStartsWith)
         self.completer.setWidget(self)
         self.completer.activated[str].connect(self._insertCompletion)
         self._keysToIgnore = [Qt.Key_Enter, Qt.Key_Return, Qt.Key_Escape, Qt.Key_Tab]
 
     def _insertCompletion(self, completion):
-        for index in self.main_window.item_model.indexes():
-            item = self.main_window.item_model.getItem(index)
+        for item in itertools.islice(self.main_window.item_model.iter_items(), 1, None):
             if item.text == completion:
-                self.setPlainText(index.data())
+                self.setPlainText(item.text)
                 self.main_window.new_rows_plan_item_creation_date = item.creation_date_time
                 break
 
@@ -2408,6 +2872,51 @@ class SettingsDialog(FocusTreeAfterCloseDialog):
         backup_interval_spinbox.valueChanged[int].connect(
             lambda: main_window.start_backup_service(backup_interval_spinbox.value()))
 
+        differential_backups_checkbox = QCheckBox()
+        differential_backups_checkbox.setChecked(main_window.differential_backups)
+        differential_backups_checkbox.clicked[bool].connect(
+            lambda checked: setattr(main_window, 'differential_backups', checked))
+        deltas_per_full_backup_spinbox = QSpinBox()
+        deltas_per_full_backup_spinbox.setRange(0, 10000)
+        deltas_per_full_backup_spinbox.setValue(main_window.deltas_per_full_backup)
+        deltas_per_full_backup_spinbox.valueChanged[int].connect(
+            lambda value: setattr(main_window, 'deltas_per_full_backup', value))
+
+        compression_dropdown = QComboBox()
+        compression_dropdown.addItem(self.tr('None'), '')
+        for suffix, (name, module) in compression.FORMATS.items():
+            compression_dropdown.addItem(name, suffix)
+        compression_dropdown.setCurrentIndex(compression_dropdown.findData(main_window.compression_suffix))
+        compression_dropdown.currentIndexChanged[int].connect(
+            lambda i: setattr(main_window, 'compression_suffix', compression_dropdown.itemData(i)))
+        compression_level_spinbox = QSpinBox()
+        compression_level_spinbox.setRange(1, 9)
+        compression_level_spinbox.setValue(main_window.compression_level)
+        compression_level_spinbox.valueChanged[int].connect(
+            lambda value: setattr(main_window, 'compression_level', value))
+
+        storage_dropdown = QComboBox()
+        storage_dropdown.addItem(self.tr('Save the whole tree after every change'), STORAGE_EVERY_CHANGE)
+        storage_dropdown.addItem(self.tr('Save changes to a journal, save the whole tree periodically'),
+                                 STORAGE_JOURNAL)
+        storage_dropdown.addItem(self.tr('Save changes to a SQLite database'), STORAGE_SQLITE)
+        storage_dropdown.addItem(self.tr('Save the whole tree in a compact binary format after every change'),
+                                 STORAGE_BINARY)
+        storage_dropdown.setCurrentIndex(storage_dropdown.findData(main_window.storage_mode))
+        storage_dropdown.currentIndexChanged[int].connect(
+            lambda i: main_window.set_storage_mode(storage_dropdown.itemData(i)))
+        save_interval_spinbox = QSpinBox()
+        save_interval_spinbox.setRange(0, 600)
+        save_interval_spinbox.setValue(main_window.saver.timer.interval() // 1000)
+        save_interval_spinbox.valueChanged[int].connect(main_window.saver.set_interval)
+        fsync_checkbox = QCheckBox()
+        fsync_checkbox.setChecked(main_window.saver.fsync)
+        fsync_checkbox.clicked[bool].connect(lambda checked: setattr(main_window.saver, 'fsync', checked))
+        workspace_budget_spinbox = QSpinBox()
+        workspace_budget_spinbox.setRange(0, 100000)
+        workspace_budget_spinbox.setValue(main_window.workspace.budget)
+        workspace_budget_spinbox.valueChanged[int].connect(main_window.set_workspace_budget)
+
         new_rows_plan_view_label = QLabel('When inserting a row in the plan tab,\n'
                                           'add it below the following item of the tree:')
         new_rows_plan_view_label.setAlignment(Qt.AlignRight)
@@ -2423,6 +2932,14 @@ class SettingsDialog(FocusTreeAfterCloseDialog):
         backup_label.setAlignment(Qt.AlignRight)
         backup_label.setMinimumSize(550, 0)
         layout.addRow(backup_label, backup_interval_spinbox)
+        layout.addRow(self.tr('Back up just the rows changed since the last backup:'), differential_backups_checkbox)
+        layout.addRow(self.tr('Back up the whole tree after ... of these backups:'), deltas_per_full_backup_spinbox)
+        layout.addRow(self.tr('Compression of backups and JSON exports:'), compression_dropdown)
+        layout.addRow(self.tr('Compression level (1: fastest, 9: smallest):'), compression_level_spinbox)
+        layout.addRow(self.tr('Saving:'), storage_dropdown)
+        layout.addRow(self.tr('Save changes at most every ... seconds:'), save_interval_spinbox)
+        layout.addRow(self.tr('Wait until saved files are physically written to the disk:'), fsync_checkbox)
+        layout.addRow(self.tr('Keep other opened files loaded, up to ... MB:'), workspace_budget_spinbox)
         layout.addRow(new_rows_plan_view_label, new_rows_plan_view_edit)
         layout.addRow(buttonBox)
         layout.setLabelAlignment(Qt.AlignRight)
@@ -2494,10 +3011,14 @@ class SaveExpandTreeView(QTreeView):
         self.collapsed.connect(self.collapse)
 
     def expand(self, index):
-        self.model().getItem(index).quicklink_expanded = True
+        item = self.model().getItem(index)
+        item.quicklink_expanded = True
+        self.model().item_changed(item)
 
     def collapse(self, index):
-        self.model().getItem(index).quicklink_expanded = False
+        item = self.model().getItem(index)
+        item.quicklink_expanded = False
+        self.model().item_changed(item)
 
 
 class ResizeTreeView(QTreeView):
@@ -2522,11 +3043,15 @@ class ResizeTreeView(QTreeView):
         # save expanded state only when in normal mode,
         # not when doing a text search and therefore having everything expanded
         if self.main_window.is_no_text_search(self.main_window.focused_column().search_bar.text()):
-            self.model().getItem(index).expanded = True
+            item = self.model().getItem(index)
+            item.expanded = True
+            self.main_window.item_model.item_changed(item)
 
     def collapse(self, index):
         if self.main_window.is_no_text_search(self.main_window.focused_column().search_bar.text()):
-            self.model().getItem(index).expanded = False
+            item = self.model().getItem(index)
+            item.expanded = False
+            self.main_window.item_model.item_changed(item)
 
     def resizeEvent(self, event):
         self.itemDelegate().sizeHintChanged.emit(QModelIndex())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Read-only view of a file in the binary format (see binary_format.py), which is memory-mapped instead of loaded.
+
+The children of an item are MappedChildren until the item gets expanded, like the LazyChildren of pickled files
+(see TreeModel.fetchMore()). They read the fields of the items from the mapped file when they are needed.
+So opening an archive reads just the header, and Tree_items are created only for the rows which are shown.
+"""
+
+import mmap
+import re
+
+import treenote.binary_format as binary_format
+import treenote.model as model
+
+NOT_ZERO = re.compile(rb'[^\x00]')
+
+
+class MappedTree():
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.layout = binary_format.Layout(self.buffer)
+        self.extras = self.layout.extras()
+        self.ancestor_sets = {}
+
+    def item(self, number, parent_item):
+        item = model.Tree_item.__new__(model.Tree_item)
+        item.__setstate__(binary_format.item_attributes(self.layout.row(number), self.layout.string,
+                                                        self.layout.type_enum, self.layout.color_enum))
+        item.parentItem = parent_item
+        item.childItems = MappedChildren(self, number, item) if self.layout.columns['child_count'][number] else []
+        item.__setstate__(self.extras.get(number, {}))
+        return item
+
+    def load(self):
+        """Creates the root items and the items on the path to the selected item.
+
+        :return: selected item, root item of the item tree, root item of the bookmark tree
+        """
+        root_item = self.item(0, None)
+        bookmark_root_item = self.item(self.layout.bookmark_root_number, None)
+        selected_item = None
+        if self.layout.selected_number != binary_format.NO_ITEM:
+            parents = self.layout.columns['parent']
+            path = [self.layout.selected_number]
+            while parents[path[-1]] != binary_format.NO_ITEM:
+                path.append(parents[path[-1]])
+            selected_item = root_item if path[-1] == 0 else bookmark_root_item
+            # the selected item must be a Tree_item, so the children of its ancestors are created
+            for number in reversed(path[:-1]):
+                parent_item = selected_item
+                first_child = self.layout.columns['first_child'][parent_item.childItems.number]
+                parent_item.childItems = parent_item.childItems.load(parent_item)
+                selected_item = parent_item.childItems[number - first_child]
+        return selected_item, root_item, bookmark_root_item
+
+    def ancestors(self, column_name):
+        """Returns the numbers of the items which have a descendant with a value other than 0 in the column."""
+        if column_name not in self.ancestor_sets:
+            column = self.layout.columns[column_name]
+            parents = self.layout.columns['parent']
+            ancestors = set()
+            with column.cast('B') as data:
+                # the regular expression scans the mapped column without converting it
+                numbers = {match.start() // column.itemsize for match in NOT_ZERO.finditer(data)}
+            for number in numbers:
+                number = parents[number]
+                while number != binary_format.NO_ITEM and number not in ancestors:
+                    ancestors.add(number)
+                    number = parents[number]
+            self.ancestor_sets[column_name] = ancestors
+        return self.ancestor_sets[column_name]
+
+    def close(self):
+        self.layout.release()
+        self.buffer.close()
+        self.file.close()
+
+
+class MappedChildren(model.LazyChildren):
+    """The child items of the item 'number' of a MappedTree, which are not created yet."""
+
+    # tags are listed just for the created items, because finding them would mean reading all texts
+    tags = frozenset()
+    links = None  # unknown for the same reason
+
+    def __init__(self, tree, number, item):
+        self.tree = tree
+        self.number = number
+        self.item = item
+
+    @property
+    def planned(self):
+        return self.number in self.tree.ancestors('planned')
+
+    @property
+    def shortcut(self):
+        return self.number in self.tree.ancestors('shortcut')
+
+    def might_contain(self, text):
+        return True
+
+    def might_contain_id(self, item_id):
+        return True
+
+    def load(self, parent_item):
+        first_child = self.tree.layout.columns['first_child'][self.number]
+        child_count = self.tree.layout.columns['child_count'][self.number]
+        return [self.tree.item(number, parent_item) for number in range(first_child, first_child + child_count)]
+
+    def __reduce__(self):
+        # pickled copies of the tree (see model.snapshot_trees()) get the created items instead
+        return list, (self.load(self.item),)
@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import collections
+import copyreg
+import io
+import itertools
+import operator
+import pickle
 import time
 import re
+import struct
 import sys
 from xml.sax.saxutils import escape
 
 from PyQt5.QtCore import QAbstractItemModel, QModelIndex, QSortFilterProxyModel, QSize, Qt, QEvent, \
-    QPersistentModelIndex, QDate
+    QPersistentModelIndex, QDate, QTimer
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
 import treenote.planned_model as planned_model
+import treenote.journal as journal
+import treenote.loader as loader
 
 
 def QDateFromString(string):
@@ -20,10 +29,144 @@ def QDateFromString(string):
     return d
 
 
+def item_tags(text):
+    """Returns the words of 'text' which are tags, like {':home', ':phone'}."""
+    return {word for word in text.split() if word[0] == TAG_DELIMITER and word not in NO_TAG_LIST}
+
+
+def internal_links(text):
+    """Returns the targets of the internal links of 'text', like {'project'} for 'see #project#'."""
+    if INTERNAL_LINK_DELIMITER not in text:
+        return set()
+    return set(re.findall(FIND_INTERNAL_LINK_TARGET, text))
+
+
 def indention_level(index, level=1):
-    if index.parent() == QModelIndex():
-        return level
-    return indention_level(index.parent(), level=level + 1)
+    while index.parent() != QModelIndex():
+        index = index.parent()
+        level += 1
+    return level
+
+
+def is_item_task_available(item):
+    """
+    return True if the parent is no sequential project
+    returns True if it is the next available task from the parent sequential project
+    """
+    if item.type == NOTE:
+        return True
+    project_item = item.parentItem
+    if project_item.type == PAUSED:
+        return False
+    if project_item.type != SEQ:
+        return True
+    return next_available_child(project_item) is item
+
+
+def next_available_child(item):
+    # the first child which is a task or contains one
+    for child_item in item.childItems:
+        if child_item.type == TASK or next_available_child(child_item) is not None:
+            return child_item
+    return None
+
+
+def unmatched_token(filter, item):
+    """Returns the first token of the search bar text 'filter' which 'item' doesn't match, or None."""
+    tokens = filter.split()  # all tokens must be in the row's data
+    for token in tokens:
+        if token.startswith(SORT):  # ignore / let it pass
+            continue
+        elif token.startswith('c='):
+            color_character = token[2]
+            if item.color == CHAR_QCOLOR_DICT.get(color_character):
+                continue
+        elif token.startswith('t='):
+            task_character = token[2]
+            type = CHAR_TYPE_DICT.get(task_character)
+            if item.type == type:
+                # just available tasks
+                if type == TASK and not is_item_task_available(item):
+                    return token
+                continue
+        elif token.startswith(DATE_BELOW):
+            count_characters = token[5:-1]
+            if count_characters and item.date:
+                count = int(count_characters)
+                date_type_character = token[-1]
+                if date_type_character == 'd':
+                    future_date = QDate.currentDate().addDays(count)
+                elif date_type_character == 'w':
+                    future_date = QDate.currentDate().addDays(7 * count)
+                elif date_type_character == 'm':
+                    future_date = QDate.currentDate().addMonths(1)
+                elif date_type_character == 'y':
+                    future_date = QDate.currentDate().addYears(1)
+                else:
+                    return token
+                if QDateFromString(item.date) <= future_date:
+                    continue
+        elif re.match(r'e(<|>|=)', token):
+            if item.estimate == '':
+                return token
+            less_greater_equal_sign = token[1]
+            if less_greater_equal_sign == '=':
+                less_greater_equal_sign = '=='
+            estimate_search = token[2:]
+            if eval(item.estimate + less_greater_equal_sign + estimate_search):
+                continue
+        elif token.startswith(HIDE_TAGS):
+            # accept (continue) when row has no tag
+            if not re.search(' ' + TAG_DELIMITER, item.text):
+                continue
+        elif token.startswith(HIDE_FUTURE_START_DATE):
+            # accept (continue) when no date or date is not in future
+            if item.date == '' or QDateFromString(item.date) <= QDate.currentDate():
+                continue
+        # searching for "blue" shall find "a blue flower" but not "bluetooth"
+        elif ' ' + token.casefold() + ' ' in ' ' + item.text.casefold() + ' ':
+            continue
+        # searching for "*blue*" shall find "bluetooth"
+        elif token[0] == '*' and token[-1] == '*' and token[1:-1].casefold() in item.text.casefold():
+            continue
+        return token  # user type stuff that's not found
+    return None  # all tokens are in the row
+
+
+def item_accepts_filter(filter, item, focused_item=None):
+    """Returns True if 'item' matches the search bar text 'filter', or if one of its children does.
+    The items don't need a model, e.g. for the command line interface (see cli.py).
+
+    :param focused_item: if given, just the items below it are accepted
+    """
+    if focused_item and not is_descendant(focused_item, item):
+        return False
+    token = unmatched_token(filter, item)
+    if token is None:
+        return True
+    # return True if a child row is accepted
+    # but not with the hide checkboxes
+    if not token.startswith(HIDE_FUTURE_START_DATE) and not token.startswith(HIDE_TAGS):
+        for child_item in item.childItems:
+            if item_accepts_filter(filter, child_item):
+                return True
+    return False
+
+
+def to_item_id(value):
+    """Returns the creation_date_time which identifies an item, e.g. of its string in the settings, or None."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_descendant(ancestor_item, item):
+    while item.parentItem is not None:
+        if item.parentItem is ancestor_item:
+            return True
+        item = item.parentItem
+    return False
 
 
 class QUndoCommandStructure(QUndoCommand):
@@ -43,15 +186,69 @@ class QUndoCommandStructure(QUndoCommand):
         super(QUndoCommandStructure, self).__init__(QApplication.translate('command', self.title))
 
 
+# the fields of the items in the order of the __dict__ of earlier versions, without parentItem and childItems
+ITEM_FIELDS = ('text', 'type', 'date', 'color', 'estimate', 'expanded', 'quicklink_expanded', 'search_text',
+               'shortcut', 'saved_root_item_creation_date_time', 'creation_date_time', 'selected', 'planned',
+               'planned_order')
+ITEM_FIELD_SET = frozenset(ITEM_FIELDS)
+STATE_FIELD_SET = frozenset(ITEM_FIELDS + ('parentItem', 'childItems'))
+item_field_values = operator.itemgetter(*ITEM_FIELDS)
+# fields which most items don't set, like the fields of bookmarks, with their defaults. see Tree_item.extras
+EXTRA_FIELDS = {'search_text': '', 'shortcut': None, 'saved_root_item_creation_date_time': None}
+
+
+def extra_field(name, *default):
+    """Returns a property for the attribute 'name', which is stored in Tree_item.extras.
+    Without 'default', reading it raises AttributeError if it's not set, like a missing attribute.
+    """
+
+    def getter(item):
+        if item.extras is not None and name in item.extras:
+            return item.extras[name]
+        if default:
+            return default[0]
+        raise AttributeError(name)
+
+    def setter(item, value):
+        if default and value == default[0]:  # items with default values have no extras
+            deleter(item)
+        else:
+            if item.extras is None:
+                item.extras = {}
+            item.extras[name] = value
+
+    def deleter(item):
+        if item.extras is not None:
+            item.extras.pop(name, None)
+            if not item.extras:
+                item.extras = None
+
+    return property(getter, setter, deleter)
+
+
 class Tree_item():
     """
     To understand Qt's way of building a TreeView, read:
     http://doc.qt.io/qt-5/qtwidgets-itemviews-editabletreemodel-example.html
+
+    The fields are slots, which need less memory than a __dict__ and are faster to read.
+    Rare attributes are kept in 'extras', a dict which just the items that have some get:
+    the fields of bookmarks, 'header_list' and 'journal_token' of the root items and unknown attributes
+    of pickles of other versions.
     """
+    __slots__ = ('parentItem', 'childItems') + tuple(field for field in ITEM_FIELDS if field not in EXTRA_FIELDS) + \
+        ('extras', 'row', '__weakref__')  # row: the last known position in the children of the parent
+    search_text = extra_field('search_text', '')  # for bookmarks
+    shortcut = extra_field('shortcut', None)  # for bookmarks
+    saved_root_item_creation_date_time = extra_field('saved_root_item_creation_date_time', None)  # for bookmarks
+    header_list = extra_field('header_list')  # of root items
+    journal_token = extra_field('journal_token')  # of the root item, see journal.py
+    deleted = extra_field('deleted')  # delete marker, see compaction.remove_tombstones()
 
     def __init__(self, parentItem=None):
         self.parentItem = parentItem
         self.childItems = []
+        self.extras = None
         self.text = ''
         self.type = NOTE
         self.date = ''
@@ -59,18 +256,68 @@ class Tree_item():
         self.estimate = ''
         self.expanded = False
         self.quicklink_expanded = False
-        self.search_text = ''  # for bookmarks
-        self.shortcut = None  # for bookmarks
-        self.saved_root_item_creation_date_time = None  # for bookmarks
         self.creation_date_time = time.time()
         self.selected = False
         self.planned = 0
         self.planned_order = 0
 
+    def __getstate__(self):
+        """Returns the attributes like the __dict__ of earlier versions, so their pickles stay the same.
+        Use it instead of __dict__, e.g. for exporting all attributes.
+        """
+        # the bookmark fields of the extras replace their defaults
+        state = {'parentItem': self.parentItem, 'childItems': self.childItems, 'text': self.text, 'type': self.type,
+                 'date': self.date, 'color': self.color, 'estimate': self.estimate, 'expanded': self.expanded,
+                 'quicklink_expanded': self.quicklink_expanded, 'search_text': '', 'shortcut': None,
+                 'saved_root_item_creation_date_time': None, 'creation_date_time': self.creation_date_time,
+                 'selected': self.selected, 'planned': self.planned, 'planned_order': self.planned_order}
+        if self.extras is not None:
+            state.update(self.extras)
+        return state
+
+    def __setstate__(self, state):
+        """Sets the attributes of 'state', e.g. of a pickle of an earlier version."""
+        keys = state.keys()
+        if keys == ITEM_FIELD_SET or keys == STATE_FIELD_SET:  # fast path, e.g. for unpickling
+            (self.text, self.type, self.date, self.color, self.estimate, self.expanded, self.quicklink_expanded,
+             search_text, shortcut, saved_root_item_creation_date_time, self.creation_date_time, self.selected,
+             self.planned, self.planned_order) = item_field_values(state)
+            self.extras = None
+            if search_text or shortcut is not None or saved_root_item_creation_date_time is not None:
+                self.search_text = search_text
+                self.shortcut = shortcut
+                self.saved_root_item_creation_date_time = saved_root_item_creation_date_time
+            if 'childItems' in state:
+                self.parentItem = state['parentItem']
+                self.childItems = state['childItems']
+            return
+        try:
+            self.extras
+        except AttributeError:  # created with Tree_item.__new__()
+            self.extras = None
+        for field, value in state.items():
+            try:
+                setattr(self, field, value)
+            except AttributeError:  # unknown attribute
+                if self.extras is None:
+                    self.extras = {}
+                self.extras[field] = value
+
     def child_number(self):
-        if self.parentItem is not None:
-            return self.parentItem.childItems.index(self)
-        return 0
+        if self.parentItem is None:
+            return 0
+        sibling_items = self.parentItem.childItems
+        try:
+            if sibling_items[self.row] is self:
+                return self.row
+        except (AttributeError, IndexError):  # not numbered yet, or siblings were removed
+            pass
+        # the siblings were inserted, removed or moved since they were numbered. numbering all of them again
+        # instead of searching just this item keeps the next calls constant time, e.g. when Qt paints the siblings
+        for row, sibling_item in enumerate(sibling_items):
+            sibling_item.row = row
+        # finds the item right at its row. raises ValueError, if it's not a child of its parent
+        return sibling_items.index(self, getattr(self, 'row', 0))
 
     def add_child(self, position):
         item = Tree_item(self)
@@ -81,6 +328,193 @@ class Tree_item():
         return 'Tree_item({}, planned={}, planned_order={})'.format(self.text, self.planned, self.planned_order)
 
 
+class LazyChildren():
+    """
+    The pickled child items of a collapsed item.
+    They are unpickled when the item gets expanded or when a search needs them (see TreeModel.fetchMore()).
+    Some information about the pickled items is kept unpickled, so the tag list, the plan view, the bookmark
+    shortcuts and renaming link targets don't need to unpickle them.
+    """
+
+    links = None  # the targets of the internal links of the pickled items. None if unknown, e.g. for older files
+    tag_counts = None  # how many of the pickled items have each tag, like {':home': 2}. None for older files
+
+    def __init__(self, item, unfetched, split_items=None):
+        """Pickles the child items of 'item'.
+
+        :param unfetched: dict of items whose children are still LazyChildren. Those are pickled as they are.
+        :param split_items: items near the root whose children are pickled separately, see dump_trees().
+            If given, collapsed subtrees inside are pickled separately, too.
+        """
+        file = io.BytesIO()
+        # otherwise, collapsed subtrees inside of LazyChildren are not pickled separately again
+        pickler = TreePickler(file, unfetched, parent_item=item, split_collapsed=split_items is not None,
+                              split_items=split_items or ())
+        pickler.dump(item.childItems)
+        self.blob = file.getvalue()
+        self.tag_counts = collections.Counter()
+        self.planned = False
+        self.shortcut = False
+        self.links = set()
+        stack = list(item.childItems)
+        while stack:
+            child_item = stack.pop()
+            self.tag_counts.update(item_tags(child_item.text))
+            if self.links is not None:
+                self.links |= internal_links(child_item.text)
+            self.planned = self.planned or child_item.planned != 0
+            self.shortcut = self.shortcut or bool(child_item.shortcut)
+            lazy_children = unfetched.get(child_item) or pickler.created.get(child_item)
+            if lazy_children is not None:
+                self.tag_counts.update(lazy_children.tag_counts or collections.Counter(lazy_children.tags))
+                self.planned = self.planned or lazy_children.planned
+                self.shortcut = self.shortcut or lazy_children.shortcut
+                if self.links is not None:
+                    self.links = None if lazy_children.links is None else self.links | lazy_children.links
+            else:
+                stack.extend(child_item.childItems)
+        self.tags = set(self.tag_counts)
+
+    def might_contain(self, text):
+        """Returns False, if no item of the pickled items contains 'text'. Returns True, if one might do."""
+        return text.encode('utf-8') in self.blob
+
+    def might_contain_id(self, item_id):
+        """Returns False, if no item of the pickled items has the creation_date_time 'item_id'."""
+        # pickle stores floats as 8 bytes in big-endian order
+        return struct.pack('>d', item_id) in self.blob
+
+    def load(self, parent_item):
+        """Unpickles the child items. Their children may be LazyChildren again."""
+        return TreeUnpickler(io.BytesIO(self.blob), parent_item).load()
+
+
+class TreePickler(pickle.Pickler):
+    # pickles the children of collapsed items as LazyChildren
+    def __init__(self, file, unfetched, kept_items=(), parent_item=None, split_collapsed=True, split_items=()):
+        """
+        :param unfetched: dict of items whose children are still LazyChildren
+        :param kept_items: items whose children must be pickled directly, e.g. because they contain the selected item
+        :param parent_item: the parent of the pickled items. It is pickled just as a reference.
+        :param split_collapsed: pickle the children of collapsed items as new LazyChildren
+        :param split_items: items whose children are pickled as new LazyChildren, even if they are expanded
+        """
+        super(TreePickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.unfetched = unfetched
+        self.kept_items = kept_items
+        self.parent_item = parent_item
+        self.split_collapsed = split_collapsed
+        self.split_items = split_items
+        self.created = {}  # the new LazyChildren: {item: LazyChildren}
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[Tree_item] = self.reduce_item
+
+    def persistent_id(self, obj):
+        if self.parent_item is not None and obj is self.parent_item:
+            return 'parent'
+        return None
+
+    def reduce_item(self, item):
+        state = item.__getstate__()
+        lazy_children = self.unfetched.get(item)
+        if lazy_children is None and item in self.split_items:
+            lazy_children = self.created[item] = LazyChildren(item, self.unfetched, self.split_items)
+        elif lazy_children is None and self.split_collapsed and item.childItems and item.parentItem is not None \
+                and not item.expanded and not item.quicklink_expanded and item not in self.kept_items:
+            lazy_children = self.created[item] = LazyChildren(item, self.unfetched)
+        if lazy_children is not None:
+            state['childItems'] = lazy_children
+        return copyreg.__newobj__, (Tree_item,), state
+
+
+class TreeUnpickler(pickle.Unpickler):
+    def __init__(self, file, parent_item):
+        super(TreeUnpickler, self).__init__(file)
+        self.parent_item = parent_item
+
+    def persistent_load(self, pid):
+        return self.parent_item
+
+
+def dump_trees(selected_item, root_item, bookmark_root_item, unfetched):
+    """Pickles the trees like the tuple (selected_item, root_item, bookmark_root_item),
+    but with the children of collapsed items as LazyChildren.
+
+    The children of the items of the first PROGRESSIVE_DEPTH levels are LazyChildren, too, even if they are
+    expanded. So opening the file unpickles just the top level items and the path to the selected item,
+    and TreeModel.load_expanded() unpickles the expanded rest in the background.
+    """
+    # the selected item is referenced from outside of its subtree, so it must not be inside of LazyChildren
+    kept_items = set()
+    item = selected_item
+    while item is not None:
+        kept_items.add(item.parentItem)
+        item = item.parentItem
+    split_items = set()
+    level = [root_item]
+    for depth in range(PROGRESSIVE_DEPTH):
+        # the children of unfetched items are pickled already
+        level = [child_item for item in level if isinstance(item.childItems, list) for child_item in item.childItems]
+        split_items.update(item for item in level if isinstance(item.childItems, list) and item.childItems and
+                           item not in kept_items)
+    file = io.BytesIO()
+    TreePickler(file, unfetched, kept_items, split_items=split_items).dump(
+        (selected_item, root_item, bookmark_root_item))
+    return file.getvalue()
+
+
+def snapshot_trees(root_items, unfetched):
+    """Returns a pickled copy of the trees. Unpickling it gives items which are independent of the shown trees,
+    e.g. for exporting them in a background thread while the user continues editing.
+    """
+    file = io.BytesIO()
+    TreePickler(file, unfetched, split_collapsed=False).dump(root_items)
+    return file.getvalue()
+
+
+class TreeSnapshot():
+    """
+    Immutable copy of a tree, see TreeModel.snapshot(). Background threads may read it while the tree is edited.
+
+    Each item is stored as a node (names of the attributes, values of the attributes, child nodes).
+    The child nodes of collapsed items which were not unpickled yet are their LazyChildren, which don't change.
+    Snapshots share the nodes of the subtrees which didn't change in between.
+    """
+
+    def __init__(self, node):
+        self.node = node
+
+    def root_item(self, unfetched=None):
+        """Creates Tree_items from the snapshot. They belong to the caller, e.g. an export thread.
+
+        :param unfetched: if given, the items whose children were not unpickled yet are put into it like into
+            TreeModel.unfetched, e.g. for dump_trees(). Otherwise, their childItems are the LazyChildren.
+        """
+        root_item = Tree_item.__new__(Tree_item)
+        stack = [(root_item, None, self.node)]
+        while stack:
+            item, parent_item, (keys, values, child_nodes) = stack.pop()
+            item.__setstate__(dict(zip(keys, values)))
+            item.parentItem = parent_item
+            if isinstance(child_nodes, tuple):
+                item.childItems = [Tree_item.__new__(Tree_item) for _ in child_nodes]
+                stack.extend(zip(item.childItems, [item] * len(child_nodes), child_nodes))
+            elif unfetched is None:  # LazyChildren, see export.child_items()
+                item.childItems = child_nodes
+            else:
+                item.childItems = []
+                unfetched[item] = child_nodes
+        return root_item
+
+
+# the children of the items of the first levels are pickled separately, so a file can be shown before it's loaded
+PROGRESSIVE_DEPTH = 2
+# the attributes of TreeModel which belong to the tree, see TreeModel.take_tree_state()
+TREE_STATE_FIELDS = ('rootItem', 'selected_item', 'unfetched', 'snapshot_nodes', 'id_items', 'link_items',
+                     'item_links', 'lazy_link_items', 'target_items', 'tag_items', 'item_tag_sets', 'lazy_tag_items',
+                     'id_copies', 'missing_ids', 'indexed_root', 'undoStack', 'changed')
+
+
 class TreeModel(QAbstractItemModel):
     def __init__(self, main_window, header_list):
         """tree model
@@ -90,15 +524,380 @@ class TreeModel(QAbstractItemModel):
         """
         super(TreeModel, self).__init__()
         self.main_window = main_window
+        self.snapshot_keys = {}  # the tuples of attribute names, so equal tuples are stored once
+        self.loader = loader.Loader(self)
+        self.loader.loaded.connect(self.insert_loaded)
+        self.rowsAboutToBeRemoved.connect(self.unregister_rows)
+        self.set_new_tree(header_list)
+
+    def set_new_tree(self, header_list):
+        """Replaces the tree with a tree of one item and clears the undo history."""
+        self.beginResetModel()
         self.changed = False
         self.undoStack = QUndoStack(self)
-
         self.rootItem = Tree_item(None)
         self.rootItem.text = '/'
         self.rootItem.header_list = header_list
         self.rootItem.add_child(0)
         self.rootItem.childItems[0].text = "This is your first entry. Hit 'return' to create another one."
         self.selected_item = self.rootItem.childItems[0]
+        # items whose child items were not unpickled yet: {item: LazyChildren}
+        self.unfetched = {}
+        # nodes of the last snapshot: {item: node}. the nodes of changed items and of their ancestors are removed
+        self.snapshot_nodes = {}
+        self.clear_index(None)  # built when it's needed
+        # LazyChildren of self.unfetched which the loader unpickles in the background, see load_expanded()
+        self.loader.cancel()
+        self.loading = set()
+        self.endResetModel()
+
+    def clear_index(self, root_item):
+        """Empties the indexes of the items of the tree of 'root_item', see index_item()."""
+        # the unpickled items by their id, see item_of_id(): {creation_date_time: item}
+        self.id_items = {}
+        # copies of items have the same id. the unpickled ones which are not in id_items: {creation_date_time: {item}}
+        self.id_copies = {}
+        self.missing_ids = set()  # ids which are in no item of the tree, neither in a pickled one
+        # the unpickled items whose text links to a target, see link_sources(): {target: {item}}
+        self.link_items = {}
+        self.item_links = {}  # the targets of the links of the unpickled items: {item: {target}}
+        # items whose LazyChildren contain links to a target: {target: {item}}. None stands for unknown targets
+        self.lazy_link_items = {}
+        self.target_items = {}  # the items which links were resolved to, see item_of_text(): {text: item}
+        self.tag_items = {}  # the unpickled items with a tag, see tag_counts(): {tag: {item}}
+        self.item_tag_sets = {}  # the tags of the unpickled items: {item: {tag}}
+        self.lazy_tag_items = {}  # items whose LazyChildren contain items with a tag: {tag: {item}}
+        self.indexed_root = root_item  # the indexes are built again for an other tree
+
+    def take_tree_state(self):
+        """Returns the tree with its caches and undo history, see workspace.py. A new tree is set instead."""
+        state = {field: getattr(self, field) for field in TREE_STATE_FIELDS}
+        self.set_new_tree(getattr(self.rootItem, 'header_list', []))
+        return state
+
+    def set_tree_state(self, state):
+        """Replaces the tree with one returned by take_tree_state()."""
+        self.beginResetModel()
+        for field, value in state.items():
+            setattr(self, field, value)
+        self.endResetModel()
+
+    def snapshot(self):
+        """Returns a TreeSnapshot of the tree as it is now.
+
+        Just the items which changed since the last snapshot, and their ancestors, are copied.
+        So taking a snapshot after every change is cheap, and readers never see a half done change.
+        """
+        nodes = self.snapshot_nodes
+        stack = [(self.rootItem, False)]
+        while stack:
+            item, children_done = stack.pop()
+            if children_done:
+                state = item.__getstate__()
+                keys = tuple(key for key in state if key != 'parentItem' and key != 'childItems')
+                keys = self.snapshot_keys.setdefault(keys, keys)
+                child_nodes = self.unfetched.get(item)
+                if child_nodes is None:
+                    child_nodes = tuple(nodes[child_item] for child_item in item.childItems)
+                nodes[item] = keys, tuple(state[key] for key in keys), child_nodes
+            elif item not in nodes:
+                stack.append((item, True))
+                stack.extend((child_item, False) for child_item in item.childItems if child_item not in nodes)
+        return TreeSnapshot(nodes[self.rootItem])
+
+    def item_changed(self, item):
+        """Removes 'item' and its ancestors from the last snapshot, so the next one copies them again.
+        Changes which are not logged with log_change(), like expanding an item, must call this.
+        """
+        while item is not None:
+            self.snapshot_nodes.pop(item, None)
+            item = item.parentItem
+
+    def log_change(self, kind, item, *args):
+        # reports every change of the tree to the main window, which appends it to the journal of the open file
+        self.item_changed(item)
+        if kind == journal.INSERT:  # the whole inserted subtrees are saved
+            for inserted_item in args[1]:
+                self.fetch_all(inserted_item)
+                self.register_items(inserted_item)
+        elif kind == journal.SET and args[0] == TEXT and self.indexed_root is self.rootItem:
+            self.index_links(item)
+            self.index_tags(item)
+        self.main_window.log_change(self, kind, item, *args)
+
+    def take_lazy_children(self, root_item=None):
+        """Registers the LazyChildren below 'root_item' in self.unfetched. Call after loading a pickled tree."""
+        if root_item is None:
+            self.unfetched = {}
+            self.snapshot_nodes = {}
+            self.clear_index(self.rootItem)
+            root_item = self.rootItem
+        stack = [root_item]
+        while stack:
+            item = stack.pop()
+            if isinstance(item.childItems, LazyChildren):
+                self.unfetched[item] = item.childItems
+                item.childItems = []
+            self.index_item(item)
+            stack.extend(item.childItems)
+
+    def hasChildren(self, parent=QModelIndex()):
+        item = self.getItem(parent)
+        return len(item.childItems) > 0 or item in self.unfetched
+
+    def canFetchMore(self, parent):
+        # the view doesn't wait for the loader, the rows are inserted when they are unpickled
+        lazy_children = self.unfetched.get(self.getItem(parent))
+        return lazy_children is not None and lazy_children not in self.loading
+
+    def item_index(self, item):
+        return QModelIndex() if item is self.rootItem else self.createIndex(item.child_number(), 0, item)
+
+    def fetchMore(self, parent):
+        self.fetch_item(self.getItem(parent))
+
+    def fetch_item(self, item):
+        """Unpickles the child items of 'item', if they were not unpickled yet."""
+        lazy_children = self.unfetched.pop(item, None)
+        if lazy_children is None:
+            return
+        self.loading.discard(lazy_children)
+        parent_index = self.insert_children(item, lazy_children.load(item))
+        # restore the expanded state of the new rows, after the view finished expanding 'item'
+        persistent_index = QPersistentModelIndex(parent_index)
+        QTimer.singleShot(0, lambda: persistent_index.isValid() and self.expand_saved(QModelIndex(persistent_index)))
+
+    def insert_children(self, item, child_items):
+        parent_index = self.item_index(item)
+        self.beginInsertRows(parent_index, 0, len(child_items) - 1)
+        item.childItems = child_items
+        self.endInsertRows()
+        self.take_lazy_children(item)
+        return parent_index
+
+    def load_expanded(self, root_item=None):
+        """Lets the loader unpickle the children of the expanded items below 'root_item' in the background,
+        level by level. The view shows the loaded rows meanwhile.
+        """
+        queue = collections.deque([root_item or self.rootItem])
+        while queue:
+            item = queue.popleft()
+            lazy_children = self.unfetched.get(item)
+            if lazy_children is None:
+                queue.extend(item.childItems)
+            elif (item.expanded or item.quicklink_expanded) and lazy_children not in self.loading:
+                self.loading.add(lazy_children)
+                self.loader.load(item, lazy_children)
+
+    def insert_loaded(self, item, lazy_children, child_items):
+        # called when the loader unpickled 'lazy_children'. they may be unpickled meanwhile,
+        # e.g. by a search, or belong to an other tree
+        if lazy_children not in self.loading:
+            return
+        self.loading.discard(lazy_children)
+        if child_items is None or self.unfetched.get(item) is not lazy_children or not self.is_in_tree(item):
+            return
+        del self.unfetched[item]
+        parent_index = self.insert_children(item, child_items)
+        self.load_expanded(item)
+        self.expand_saved(parent_index)
+        if not self.loading:  # the plan doesn't wait for the loader, see PlannedModel.refresh_model()
+            self.main_window.planned_view.model().refresh_model()
+
+    def is_in_tree(self, item, root_item=None):
+        """Returns whether 'item' is 'root_item' or below it. By default, whether it's in the tree."""
+        root_item = root_item or self.rootItem
+        while item is not root_item:
+            if item.parentItem is None:
+                return False
+            try:
+                item.child_number()
+            except ValueError:  # removed
+                return False
+            item = item.parentItem
+        return True
+
+    def item_of_id(self, item_id):
+        """Returns the item whose creation_date_time is 'item_id', or None. Bookmarks and the plan refer to items
+        with it. Items which are unpickled are found in constant time, see self.id_items.
+        """
+        item_id = to_item_id(item_id)
+        if item_id is None:
+            return None
+        if self.indexed_root is not self.rootItem:  # the tree was replaced
+            self.register_items()
+        while item_id not in self.missing_ids:
+            item = self.registered_item(item_id)
+            if item is not None:
+                return item
+            # it may be inside of collapsed subtrees which are not unpickled yet. just the ones which contain the id
+            # are unpickled, and their items are registered
+            if not self.fetch_lazy_children([item for item, lazy_children in self.unfetched.items()
+                                             if lazy_children.might_contain_id(item_id)]):
+                self.missing_ids.add(item_id)  # until an item with it is registered, e.g. by undoing a removal
+        return None
+
+    def registered_item(self, item_id):
+        # the registered item may be removed without a signal, e.g. by the compaction. a copy of it may replace it
+        item = self.id_items.get(item_id)
+        if item is not None and self.is_in_tree(item):
+            return item
+        self.id_items.pop(item_id, None)
+        copies = self.id_copies.pop(item_id, set())
+        for item in copies:
+            if self.is_in_tree(item):
+                copies.discard(item)
+                self.id_items[item_id] = item
+                if copies:
+                    self.id_copies[item_id] = copies
+                return item
+        return None
+
+    def unregister_rows(self, parent_index, first, last):
+        # removed items are not found by their id anymore. moved items are registered again when they are inserted
+        if self.indexed_root is not self.rootItem:
+            return
+        stack = self.getItem(parent_index).childItems[first:last + 1]
+        while stack:
+            item = stack.pop()
+            if self.id_items.get(item.creation_date_time) is item:
+                del self.id_items[item.creation_date_time]
+            else:
+                self.id_copies.get(item.creation_date_time, set()).discard(item)
+            stack.extend(item.childItems)
+
+    def register_items(self, root_item=None):
+        """Adds the unpickled items below 'root_item' to the indexes. By default, they are built again."""
+        if root_item is None:
+            self.clear_index(self.rootItem)
+            root_item = self.rootItem
+        elif self.indexed_root is not self.rootItem:  # built again when it's needed
+            return
+        stack = [root_item]
+        while stack:
+            item = stack.pop()
+            self.index_item(item)
+            stack.extend(item.childItems)
+
+    def index_item(self, item):
+        # copies of an item have the same id. the first one is kept
+        if self.id_items.setdefault(item.creation_date_time, item) is not item:
+            self.id_copies.setdefault(item.creation_date_time, set()).add(item)
+        self.missing_ids.discard(item.creation_date_time)
+        self.index_links(item)
+        self.index_tags(item)
+        lazy_children = self.unfetched.get(item)
+        if lazy_children is not None:
+            for target in (None,) if lazy_children.links is None else lazy_children.links:
+                self.lazy_link_items.setdefault(target, set()).add(item)
+            for tag in lazy_children.tags:
+                self.lazy_tag_items.setdefault(tag, set()).add(item)
+
+    def index_links(self, item):
+        """Updates the targets of the links of 'item' in the indexes, e.g. after its text changed."""
+        for target in self.item_links.pop(item, ()):
+            self.link_items[target].discard(item)
+        links = internal_links(item.text)
+        if links:
+            self.item_links[item] = links
+            for target in links:
+                self.link_items.setdefault(target, set()).add(item)
+
+    def index_tags(self, item):
+        """Updates the tags of 'item' in the indexes, e.g. after its text changed."""
+        for tag in self.item_tag_sets.pop(item, ()):
+            self.tag_items[tag].discard(item)
+        tags = item_tags(item.text) if TAG_DELIMITER in item.text else None
+        if tags:
+            self.item_tag_sets[item] = tags
+            for tag in tags:
+                self.tag_items.setdefault(tag, set()).add(item)
+
+    def fetch_lazy_children(self, items):
+        """Unpickles the child items of those of 'items' which are in the tree and whose children are LazyChildren.
+        Returns whether there were any.
+        """
+        items = [item for item in items if item in self.unfetched and self.is_in_tree(item)]
+        for item in items:
+            self.fetch_item(item)  # its unpickled items are indexed, their LazyChildren, too
+        return len(items) > 0
+
+    def link_sources(self, target):
+        """Returns the items whose text links to 'target', like 'see #target#'.
+        Only the collapsed subtrees which contain such links are unpickled.
+        """
+        if not re.fullmatch(INTERNAL_LINK_TARGET, target):
+            return []
+        if self.indexed_root is not self.rootItem:
+            self.register_items()
+        link = INTERNAL_LINK_DELIMITER + target + INTERNAL_LINK_DELIMITER
+        while True:
+            # LazyChildren of older files don't know their links
+            unknown_items = self.lazy_link_items.get(None, set())
+            owner_items = [item for item in unknown_items if item in self.unfetched and
+                           self.unfetched[item].might_contain(link)]
+            unknown_items.difference_update(owner_items)
+            if not self.fetch_lazy_children(owner_items + list(self.lazy_link_items.pop(target, ()))):
+                break
+        source_items = self.link_items.get(target, set())
+        source_items.difference_update([item for item in source_items if not self.is_in_tree(item)])
+        return list(source_items)
+
+    def tag_counts(self, root_item=None):
+        """Returns how many items below 'root_item' have each tag, like {':home': 2}. By default, in the whole tree.
+        Just the items with tags are looked at, and the collapsed subtrees with tags are not unpickled.
+        """
+        if self.indexed_root is not self.rootItem:
+            self.register_items()
+        root_item = root_item or self.rootItem
+        counts = {}
+        for tag in set(self.tag_items) | set(self.lazy_tag_items):
+            items = self.tag_items.get(tag, set())
+            if root_item is self.rootItem:
+                items.difference_update([item for item in items if not self.is_in_tree(item)])
+                count = len(items)
+            else:
+                count = sum(1 for item in items if self.is_in_tree(item, root_item))
+            owner_items = self.lazy_tag_items.get(tag, set())
+            owner_items.intersection_update(self.unfetched)
+            for item in owner_items:
+                if self.is_in_tree(item, root_item):
+                    lazy_children = self.unfetched[item]
+                    count += lazy_children.tag_counts[tag] if lazy_children.tag_counts else 1
+            if count:
+                counts[tag] = count
+        return counts
+
+    def tagged_items(self, tag):
+        """Returns the items of the tree which have 'tag'. Just the collapsed subtrees with it are unpickled."""
+        if self.indexed_root is not self.rootItem:
+            self.register_items()
+        while self.fetch_lazy_children(self.lazy_tag_items.pop(tag, ())):
+            pass
+        items = self.tag_items.get(tag, set())
+        items.difference_update([item for item in items if not self.is_in_tree(item)])
+        return list(items)
+
+    def item_of_text(self, text):
+        """Returns an item whose text is 'text', or None. Internal links refer to items with it."""
+        item = self.target_items.get(text)
+        if item is not None and item.text == text and self.is_in_tree(item):
+            return item
+        for item in self.iter_items(fetch_if=lambda lazy_children: lazy_children.might_contain(text)):
+            if item.text == text:
+                self.target_items[text] = item
+                return item
+        return None
+
+    def fetch_all(self, root_item=None):
+        """Unpickles all items below 'root_item'. Needed e.g. before exporting."""
+        if not self.unfetched:
+            return
+        stack = [root_item or self.rootItem]
+        while stack:
+            item = stack.pop()
+            self.fetch_item(item)
+            stack.extend(item.childItems)
 
     def child_indexes(self, parent_index):
         indexes = []
@@ -106,30 +905,47 @@ class TreeModel(QAbstractItemModel):
             indexes.append(self.index(i, 0, parent_index))
         return indexes
 
-    # necessary, because persistentIndexList() seems not to include all indexes
-    def indexes(self):
-        indexes = []
-
-        def add_indexes(parent_index):
-            indexes.append(parent_index)
-            for i in range(self.rowCount(parent_index)):
-                add_indexes(self.index(i, 0, parent_index))
+    def iter_items(self, root_item=None, fetch_if=None, post_order=False, with_depth=False):
+        """Yields 'root_item' and the items below it, each item before its children. By default, all items.
+        The items are unpickled while they are yielded, so a search which stops early unpickles no more items.
+        Deep trees don't exceed the recursion limit.
 
-        add_indexes(QModelIndex())
-        return indexes
+        :param fetch_if: function which gets the LazyChildren of an item and returns whether they shall be unpickled.
+            If not, they are skipped. By default, all items are unpickled.
+        :param post_order: each item is yielded after its children
+        :param with_depth: (item, depth) tuples are yielded. The depth of 'root_item' is 0
+        """
+        stack = [(root_item or self.rootItem, 0, False)]
+        while stack:
+            item, depth, children_done = stack.pop()
+            if not children_done:
+                if post_order:
+                    stack.append((item, depth, True))
+                else:
+                    yield (item, depth) if with_depth else item
+                if item in self.unfetched and (fetch_if is None or fetch_if(self.unfetched[item])):
+                    self.fetch_item(item)
+                stack.extend((child_item, depth + 1, False) for child_item in reversed(item.childItems))
+            else:
+                yield (item, depth) if with_depth else item
 
-    def items(self, root_item=None):
-        if not root_item:
-            root_item = self.rootItem
-        items = []
+    def iter_indexes(self, root_index=QModelIndex(), fetch_if=None, post_order=False):
+        """Yields 'root_index' and the indexes below it, see iter_items()."""
+        for item in self.iter_items(self.getItem(root_index), fetch_if, post_order):
+            yield self.item_index(item)
 
-        def add_items(item):
-            items.append(item)
-            for child in item.childItems:
-                add_items(child)
+    # necessary, because persistentIndexList() seems not to include all indexes
+    def indexes(self, fetch_if=None):
+        """
+        :param fetch_if: see iter_items()
+        """
+        return list(self.iter_indexes(fetch_if=fetch_if))
 
-        add_items(root_item)
-        return items
+    def items(self, root_item=None, fetch_if=None):
+        """
+        :param fetch_if: see iter_items()
+        """
+        return list(self.iter_items(root_item, fetch_if))
 
     def headerData(self, column, orientation, role=Qt.DisplayRole):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
@@ -143,6 +959,8 @@ class TreeModel(QAbstractItemModel):
     def flags(self, index):
         if not index.isValid():
             return 0
+        if self.main_window.read_only:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
 
         return Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsSelectable
 
@@ -163,6 +981,7 @@ class TreeModel(QAbstractItemModel):
             return QModelIndex()
 
         childItem = parentItem.childItems[row]
+        childItem.row = row  # so parent() of its children doesn't need to number its siblings
         return self.createIndex(row, column, childItem)
 
     def parent(self, index):
@@ -215,25 +1034,29 @@ class TreeModel(QAbstractItemModel):
                 if self.column == 0:  # used for setting color etc, too
                     self.old_value = getattr(item, self.field)
                     setattr(item, self.field, value)
+                    self.model.log_change(journal.SET, item, self.field, value)
                     if self.field == TEXT:
                         if TAG_DELIMITER in value or TAG_DELIMITER in self.old_value:
                             self.model.main_window.setup_tag_model()
                         # rename internal links
-                        for item in self.model.items():
-                            old_link = INTERNAL_LINK_DELIMITER + self.old_value + INTERNAL_LINK_DELIMITER
-                            new_link = INTERNAL_LINK_DELIMITER + value + INTERNAL_LINK_DELIMITER
-                            if old_link in item.text:
-                                item.text = item.text.replace(old_link, new_link)
+                        old_link = re.compile(r'(?:^|(?<=[\n ]))' + re.escape(
+                            INTERNAL_LINK_DELIMITER + self.old_value + INTERNAL_LINK_DELIMITER) + '(?= |$)')
+                        new_link = INTERNAL_LINK_DELIMITER + value + INTERNAL_LINK_DELIMITER
+                        for item in self.model.link_sources(self.old_value):
+                            item.text = old_link.sub(lambda match: new_link, item.text)
+                            self.model.log_change(journal.SET, item, TEXT, item.text)
                     elif self.field == PLANNED:
                         orders_of_same_planning_level = [other_item.planned_order for other_item in
                                                          self.model.main_window.planned_view.model().items() if
                                                          other_item.planned == value and other_item != item]
                         if orders_of_same_planning_level:
                             item.planned_order = max(orders_of_same_planning_level) + 1
+                            self.model.log_change(journal.SET, item, PLANNED_ORDER, item.planned_order)
 
                 elif self.column == 1:
                     self.old_value = item.estimate
                     item.estimate = value
+                    self.model.log_change(journal.SET, item, ESTIMATE, value)
                 elif self.column == 2:
                     self.old_value = item.date
                     # user has not selected a date other than 'today'
@@ -243,6 +1066,7 @@ class TreeModel(QAbstractItemModel):
                     if value == EMPTY_DATE:  # user pressed del
                         value = ''
                     item.date = value
+                    self.model.log_change(journal.SET, item, DATE, value)
 
                 self.model.dataChanged.emit(self.index,
                                             self.model.index(self.index.row(), len(self.model.rootItem.header_list) - 1,
@@ -271,19 +1095,16 @@ class TreeModel(QAbstractItemModel):
         self.undoStack.push(SetDataCommand(self, index, value, index.column(), field))
 
     def expand_saved(self, idx=QModelIndex(), print_view=None):
-        def restore_children_expanded_state(index):
-            for i, child_item in enumerate(self.getItem(index).childItems):
-                child_index = self.index(i, 0, index)
-                if print_view:
-                    print_view.setExpanded(child_index, child_item.expanded)
-                else:
-                    proxy_index = self.main_window.filter_proxy_index_from_model_index(child_index)
-                    self.main_window.focused_column().view.setExpanded(proxy_index, child_item.expanded)
-                    self.main_window.quicklinks_view.setExpanded(child_index, child_item.quicklink_expanded)
-                restore_children_expanded_state(child_index)
-
         self.main_window.focused_column().view.setAnimated(False)
-        restore_children_expanded_state(idx)
+        # LazyChildren are not unpickled, they are unpickled when the view expands their items
+        for child_item in itertools.islice(self.iter_items(self.getItem(idx), lambda lazy_children: False), 1, None):
+            child_index = self.item_index(child_item)
+            if print_view:
+                print_view.setExpanded(child_index, child_item.expanded)
+            else:
+                proxy_index = self.main_window.filter_proxy_index_from_model_index(child_index)
+                self.main_window.focused_column().view.setExpanded(proxy_index, child_item.expanded)
+                self.main_window.quicklinks_view.setExpanded(child_index, child_item.quicklink_expanded)
         self.main_window.focused_column().view.setAnimated(True)
 
     # used for moving and inserting new rows. When inserting new rows, 'id_list' and 'indexes' are not used.
@@ -302,12 +1123,14 @@ class TreeModel(QAbstractItemModel):
             @staticmethod  # static because it is called from the outside for moving
             def insert_existing_entry(model, position, parent_index, child_item_list, select=True):
                 parent_item = model.getItem(parent_index)
+                model.fetch_item(parent_item)
                 parent_item.expanded = True
                 model.beginInsertRows(parent_index, position, position + len(child_item_list) - 1)
                 for i, child_item in enumerate(child_item_list):
                     child_item.parentItem = parent_item
                     parent_item.childItems.insert(position + i, child_item)
                 model.endInsertRows()
+                model.log_change(journal.INSERT, parent_item, position, child_item_list)
 
                 model.main_window.save_file()
 
@@ -322,15 +1145,24 @@ class TreeModel(QAbstractItemModel):
 
             def remove_rows(self):
                 self.deleted_child_parent_index_position_list = []
-                for index in self.indexes:
-                    parent_index = self.model.parent(index)
+                if self.items:  # undo pasting: the items are in one block
+                    parent_index, position = self.parent_index, self.position
                     parent_item = self.model.getItem(parent_index)
-                    item = self.model.getItem(index)
-                    position = item.child_number()
-                    self.deleted_child_parent_index_position_list.append((item, parent_index, position))
-                    self.model.beginRemoveRows(parent_index, position, position)
-                    del parent_item.childItems[position]
+                    self.model.beginRemoveRows(parent_index, position, position + len(self.items) - 1)
+                    del parent_item.childItems[position:position + len(self.items)]
                     self.model.endRemoveRows()
+                    self.model.log_change(journal.REMOVE, parent_item, position, len(self.items))
+                else:
+                    for index in self.indexes:
+                        parent_index = self.model.parent(index)
+                        parent_item = self.model.getItem(parent_index)
+                        item = self.model.getItem(index)
+                        position = item.child_number()
+                        self.deleted_child_parent_index_position_list.append((item, parent_index, position))
+                        self.model.beginRemoveRows(parent_index, position, position)
+                        del parent_item.childItems[position]
+                        self.model.endRemoveRows()
+                        self.model.log_change(journal.REMOVE, parent_item, position, 1)
 
                 self.model.main_window.save_file()
 
@@ -368,11 +1200,13 @@ class TreeModel(QAbstractItemModel):
                     else:
                         parent_item = self.model.getItem(self.parent_index)
                         parent_item.expanded = True
+                        self.model.fetch_item(parent_item)
                         self.model.beginInsertRows(self.parent_index, self.position, self.position)
                         child = parent_item.add_child(self.position)
                         # type of new items depends on their parent: note -> note, projekt -> task
                         child.type = NOTE if parent_item.type == NOTE else TASK
                         self.model.endInsertRows()
+                        self.model.log_change(journal.INSERT, parent_item, self.position, [child])
 
                         index_of_new_entry = self.model.index(self.position, 0, self.parent_index)
                         if self.model is not self.model.main_window.bookmark_model:
@@ -421,6 +1255,19 @@ class TreeModel(QAbstractItemModel):
         else:  # remove command
             self.undoStack.push(InsertRemoveRowCommand(self, position, parent_index, None, False, indexes, None))
 
+    def insert_items(self, position, parent_index, items):
+        """Adds new subtrees, e.g. built by outline.py, with a single insert and a single undo step.
+        Like rows which are added one by one, they get the type of new rows and items with children are expanded.
+        """
+        new_type = NOTE if self.getItem(parent_index).type == NOTE else TASK
+        stack = list(items)
+        while stack:
+            item = stack.pop()
+            item.type = new_type
+            item.expanded = bool(item.childItems)
+            stack.extend(item.childItems)
+        self.insert_remove_rows(position=position, parent_index=parent_index, items=items, set_edit_focus=False)
+
     def file(self, indexes, new_parent):
         class FileCommand(QUndoCommandStructure):
             _fields = ['model', 'indexes_and_old_positions_dict', 'new_parent']
@@ -429,9 +1276,12 @@ class TreeModel(QAbstractItemModel):
             def move(self, index, new_parent, old_position=None):
                 item = self.model.getItem(index)
                 parent_item = self.model.getItem(index.parent())
-                self.model.beginRemoveRows(index.parent(), item.child_number(), item.child_number())
-                del parent_item.childItems[item.child_number()]
+                position = item.child_number()
+                self.model.beginRemoveRows(index.parent(), position, position)
+                del parent_item.childItems[position]
                 self.model.endRemoveRows()
+                self.model.log_change(journal.REMOVE, parent_item, position, 1)
+                self.model.fetch_item(self.model.getItem(self.new_parent))
                 as_last = self.model.rowCount(self.new_parent)
                 new_position = old_position if old_position else as_last
                 self.model.insert_remove_rows(position=new_position, parent_index=new_parent, items=[item],
@@ -479,6 +1329,10 @@ class TreeModel(QAbstractItemModel):
                     elif up_or_down < 0 and item.planned > 1 or up_or_down > 0 and item.planned < max(
                             NUMBER_PLAN_DICT.keys()):
                         item.planned += up_or_down
+                    changed_items = [item, item_to_swap] if index_to_swap.isValid() else [item]
+                    for changed_item in changed_items:
+                        self.model.log_change(journal.SET, changed_item, PLANNED, changed_item.planned)
+                        self.model.log_change(journal.SET, changed_item, PLANNED_ORDER, changed_item.planned_order)
                     self.model.main_window.save_file()
                     self.model.main_window.select([index])
                 else:
@@ -507,6 +1361,7 @@ class TreeModel(QAbstractItemModel):
                         old_position = old_child_number + count
                     index_moving_item = self.model.index(old_position, 0, parent_index)
                     parent_item.childItems.insert(new_position, parent_item.childItems.pop(old_position))
+                    self.model.log_change(journal.MOVE, parent_item, old_position, new_position)
                     index_moving_item_new = self.model.index(new_position, 0, parent_index)
 
                     index_first_moved_item_new = self.model.index(old_child_number + up_or_down, 0, parent_index)
@@ -544,7 +1399,6 @@ class TreeModel(QAbstractItemModel):
         sibling_index = self.index(original_position - 1, 0, self.parent(indexes[0]))
         parent_index = self.parent(indexes[0])
         parent_parent_index = self.parent(parent_index)
-        last_childnr_of_sibling = len(item.parentItem.childItems[original_position - 1].childItems)
 
         # stop moving left if parent is root_item
         if parent_index == QModelIndex() and direction == -1:
@@ -554,6 +1408,11 @@ class TreeModel(QAbstractItemModel):
         if original_position == 0 and direction == 1:
             return
 
+        sibling_item = item.parentItem.childItems[original_position - 1]
+        if direction == 1:  # the items are appended to the children of the sibling above
+            self.fetch_item(sibling_item)
+        last_childnr_of_sibling = len(sibling_item.childItems)
+
         class MoveHorizontalCommand(QUndoCommandStructure):
             _fields = ['model', 'direction', 'parent_parent_index', 'parent_index', 'indexes_to_insert',
                        'position', 'original_position', 'sibling_index', 'last_childnr_of_sibling']
@@ -567,6 +1426,7 @@ class TreeModel(QAbstractItemModel):
                                            original_position + len(items) - 1)
                 del parent_item.childItems[original_position:original_position + len(items)]
                 self.model.endRemoveRows()
+                self.model.log_change(journal.REMOVE, parent_item, original_position, len(items))
                 # add rows to new parent
                 self.model.insert_remove_rows(position=position, parent_index=insert_in_index, items=items)
 
@@ -595,38 +1455,13 @@ class TreeModel(QAbstractItemModel):
                                   original_position, sibling_index, last_childnr_of_sibling))
 
     def get_tags_set(self, cut_delimiter=True, all_tags=False):
-        tags_set = set()
         current_root_index = QModelIndex() if all_tags else self.main_window.focused_column().view.rootIndex()
-        for item in self.items(root_item=self.main_window.focused_column().filter_proxy.getItem(current_root_index)):
-            for word in item.text.split():
-                if word[0] == TAG_DELIMITER and word not in NO_TAG_LIST:
-                    delimiter = '' if cut_delimiter else TAG_DELIMITER
-                    tags_set.add(delimiter + word.strip(TAG_DELIMITER))
-        return tags_set
+        root_item = self.main_window.focused_column().filter_proxy.getItem(current_root_index)
+        delimiter = '' if cut_delimiter else TAG_DELIMITER
+        return {delimiter + tag.strip(TAG_DELIMITER) for tag in self.tag_counts(root_item)}
 
     def is_task_available(self, index):
-        """
-        return True if the parent is no sequential project
-        returns True if it is the next available task from the parent sequential project
-        """
-        item = self.getItem(index)
-
-        if item.type == NOTE:
-            return True
-
-        project_item = item.parentItem
-        if project_item.type == PAUSED:
-            return False
-        if project_item.type != SEQ:
-            return True
-
-        project_index = self.parent(index)
-        project_parent_index = self.parent(project_index)
-        available_index = self.get_next_available_task(project_index.row(), project_parent_index)
-        if available_index == index:
-            return True
-
-        return False
+        return is_item_task_available(self.getItem(index))
 
     def get_next_available_task(self, row, parent):
         index = self.index(row, 0, parent)
@@ -763,94 +1598,19 @@ class FilterProxyModel(QSortFilterProxyModel, ProxyTools):
     # indexes or vice versa, use mapToSource(), mapFromSource(),
     # mapSelectionToSource(), and mapSelectionFromSource().
 
+    # the items which match the filter and their ancestors, if they were found with the index of the database,
+    # see MainWindow.search(). None: each row is matched with item_accepts_filter(), which walks its subtree
+    accepted_items = None
+
     def filterAcceptsRow(self, row, parent_index):
         index = self.sourceModel().index(row, 0, parent_index)
         return False if not index.isValid() else self.filter_accepts_row(self.filter, index)
 
-    def somehow_parent(self, focused_item, recursion_item):
-        if not recursion_item.parentItem:
-            return False
-        elif recursion_item.parentItem is focused_item:
-            return True
-        else:
-            return self.somehow_parent(focused_item, recursion_item.parentItem)
-
     def filter_accepts_row(self, filter, index, focused_item=None):
         item = self.sourceModel().getItem(index)
-
-        if focused_item:
-            if not self.somehow_parent(focused_item, item):
-                return False
-
-                # return True if this row's data is accepted
-        tokens = filter.split()  # all tokens must be in the row's data
-        for token in tokens:
-            if token.startswith(SORT):  # ignore / let it pass
-                continue
-            elif token.startswith('c='):
-                color_character = token[2]
-                if item.color == CHAR_QCOLOR_DICT.get(color_character):
-                    continue
-            elif token.startswith('t='):
-                task_character = token[2]
-                type = CHAR_TYPE_DICT.get(task_character)
-                if item.type == type:
-                    # just available tasks
-                    if type == TASK and not self.sourceModel().is_task_available(index):
-                        break
-                    continue
-            elif token.startswith(DATE_BELOW):
-                count_characters = token[5:-1]
-                if count_characters and item.date:
-                    count = int(count_characters)
-                    date_type_character = token[-1]
-                    if date_type_character == 'd':
-                        future_date = QDate.currentDate().addDays(count)
-                    elif date_type_character == 'w':
-                        future_date = QDate.currentDate().addDays(7 * count)
-                    elif date_type_character == 'm':
-                        future_date = QDate.currentDate().addMonths(1)
-                    elif date_type_character == 'y':
-                        future_date = QDate.currentDate().addYears(1)
-                    else:
-                        break
-                    if QDateFromString(item.date) <= future_date:
-                        continue
-            elif re.match(r'e(<|>|=)', token):
-                if item.estimate == '':
-                    break
-                less_greater_equal_sign = token[1]
-                if less_greater_equal_sign == '=':
-                    less_greater_equal_sign = '=='
-                estimate_search = token[2:]
-                if eval(item.estimate + less_greater_equal_sign + estimate_search):
-                    continue
-            elif token.startswith(HIDE_TAGS):
-                # accept (continue) when row has no tag
-                if not re.search(' ' + TAG_DELIMITER, item.text):
-                    continue
-            elif token.startswith(HIDE_FUTURE_START_DATE):
-                # accept (continue) when no date or date is not in future
-                if item.date == '' or QDateFromString(item.date) <= QDate.currentDate():
-                    continue
-            # searching for "blue" shall find "a blue flower" but not "bluetooth"
-            elif ' ' + token.casefold() + ' ' in ' ' + item.text.casefold() + ' ':
-                continue
-            # searching for "*blue*" shall find "bluetooth"
-            elif token[0] == '*' and token[-1] == '*' and token[1:-1].casefold() in item.text.casefold():
-                continue
-            break  # user type stuff that's not found
-        else:  # just executed when not breaked
-            return True  # all tokens are in the row
-
-        # return True if a child row is accepted
-        # but not with the hide checkboxes
-        if not token.startswith(HIDE_FUTURE_START_DATE) and not token.startswith(HIDE_TAGS):
-            for row in range(len(item.childItems)):
-                if self.filter_accepts_row(filter, self.sourceModel().index(row, 0, index)):
-                    return True
-
-        return False
+        if self.accepted_items is not None and focused_item is None:
+            return item in self.accepted_items
+        return item_accepts_filter(filter, item, focused_item)
 
     def lessThan(self, left_index, right_index):
         column = left_index.column()
@@ -893,8 +1653,7 @@ class Delegate(QStyledItemDelegate):
         # but not if the parent is the 'normal' parent which was set in the settings
         if self.model is self.main_window.planned_view.model() and \
                         index.column() == 0 and item.parentItem != self.main_window.item_model.rootItem and \
-                        str(item.parentItem.creation_date_time) != str(
-                    self.main_window.new_rows_plan_item_creation_date):
+                        item.parentItem.creation_date_time != self.main_window.new_rows_plan_item_creation_date:
             html = r'<font color={}>{}</font> {}'.format(DARK_GREY, item.parentItem.text, html)
 
         is_not_available = item.type == TASK and not self.model.is_task_available(index)
@@ -964,7 +1723,9 @@ class Delegate(QStyledItemDelegate):
     def createEditor(self, parent, option, index):
         if index.column() == 0:
             suggestions_list = list(self.main_window.item_model.get_tags_set(cut_delimiter=False, all_tags=True))
-            tree_item_list = [item.text for item in self.main_window.item_model.items()]
+            # completing the items which are not unpickled yet would unpickle the whole tree on every edit
+            tree_item_list = [item.text for item in
+                              self.main_window.item_model.iter_items(fetch_if=lambda lazy_children: False)]
             edit = AutoCompleteEdit(parent, suggestions_list, tree_item_list, self)
             padding_left = -5
             if self.model.getItem(index).type != NOTE:
@@ -1264,6 +2025,10 @@ NUMBER_PLAN_DICT = {
 TAG_DELIMITER = r':'
 INTERNAL_LINK_DELIMITER = r'#'
 FIND_INTERNAL_LINK = r'((\n|^| )(' + INTERNAL_LINK_DELIMITER + r'\w(\w| )+' + INTERNAL_LINK_DELIMITER + '))( |$)'
+INTERNAL_LINK_TARGET = r'\w[\w ]+'
+# like FIND_INTERNAL_LINK, but it finds links which share a space, too. the group is the target
+FIND_INTERNAL_LINK_TARGET = r'(?:^|(?<=[\n ]))' + INTERNAL_LINK_DELIMITER + '(' + INTERNAL_LINK_TARGET + ')' + \
+                            INTERNAL_LINK_DELIMITER + '(?= |$)'
 DONE_TASK = 'done'  # same as icon file names
 TASK = 'todo'
 NOTE = 'note'
@@ -1283,6 +2048,7 @@ DELETED = 'deleted'
 SEARCH_TEXT = 'search_text'  # for bookmarks
 SHORTCUT = 'shortcut'
 TEXT = 'text'
+DATE = 'date'
 FOCUS_TEXT = 'Focus on current row'
 CHECKBOX_SMALLER = 7
 FONT = 'Source Sans Pro'
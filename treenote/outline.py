@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parsers which build subtrees out of outlines: indented text, Markdown, OPML and backups of The Hit List.
+
+The items are built without a model. TreeModel.insert_items() then adds them to a tree at once,
+so importing or pasting thousands of rows is a single insert and a single undo step.
+"""
+
+import os
+import plistlib
+import re
+from xml.etree import ElementTree
+
+import treenote.model as model
+
+MARKDOWN_HEADING = re.compile(r'(#{1,6})\s+(.*?)\s*#*\s*$')
+MARKDOWN_ITEM = re.compile(r'(?:[-*+]|\d+[.)])\s+')
+MARKDOWN_BELOW_HEADINGS = 10  # depth of lines which are not headings, so they are children of the last heading
+OPML_SUFFIX = '.opml'
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+
+
+def items_from_rows(rows):
+    """Builds the subtrees out of (depth, text) rows. The parent of a row is the last row above with a lower depth.
+
+    :return: the top level items
+    """
+    top_items = []
+    stack = []  # (depth, item) of the possible parents of the next row
+    for depth, text in rows:
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        parent_item = stack[-1][1] if stack else None
+        item = model.Tree_item(parent_item)
+        item.text = text
+        (parent_item.childItems if parent_item else top_items).append(item)
+        stack.append((depth, item))
+    return top_items
+
+
+def parse_indented_text(text):
+    """Each row is an item, which is a child of the row above with less indention.
+    If rows start with a dash, each dash starts an item and the rows without one continue the text of the item.
+    When indented with spaces, the first indention is the width of one level.
+    """
+    text = text.replace('\r\n', '\n').strip('\n')
+    # \r marks the line breaks which start a new item
+    if re.search(r'(\n|^)([\t| ]*-)', text):  # each item starts with a dash
+        text = re.sub(r'\n([\t| ]*-)', r'\r\1', text)
+    else:  # each row is an item
+        text = re.sub(r'\n([\t| ]*)', r'\r\1', text)
+    rows = []
+    smallest_indention = None
+    for line in text.split('\r'):
+        stripped_line = line.lstrip('\t')
+        indention = len(line) - len(stripped_line)
+        if line.startswith(' '):
+            stripped_line = line.lstrip(' ')
+            indention = len(line) - len(stripped_line)
+            if not smallest_indention:
+                smallest_indention = indention
+            indention = indention / smallest_indention
+        # remove -, *, spaces and tabs from the beginning of the line
+        rows.append((indention, re.sub(r'^(-|\*)? *|\t*', '', stripped_line)))
+    return items_from_rows(rows)
+
+
+def parse_markdown(text):
+    """Headings become items with the following sections as children. List items and paragraphs are nested by
+    their indention below the last heading. Blank lines are skipped.
+    """
+    rows = []
+    for line in text.replace('\r\n', '\n').split('\n'):
+        if not line.strip():
+            continue
+        heading_match = MARKDOWN_HEADING.match(line)
+        if heading_match:
+            rows.append((len(heading_match.group(1)), heading_match.group(2)))
+            continue
+        stripped_line = line.expandtabs(4).lstrip(' ')
+        indention = len(line.expandtabs(4)) - len(stripped_line)
+        rows.append((MARKDOWN_BELOW_HEADINGS + indention, MARKDOWN_ITEM.sub('', stripped_line, count=1).rstrip()))
+    return items_from_rows(rows)
+
+
+def parse_opml(file):
+    """Each outline element becomes an item. Its note ('_note' attribute) is appended to the text."""
+    top_items = []
+    stack = []
+    # iterparse keeps just the open elements, so big files and deep outlines don't matter
+    for event, element in ElementTree.iterparse(file, events=('start', 'end')):
+        if element.tag != 'outline':
+            continue
+        if event == 'start':
+            parent_item = stack[-1] if stack else None
+            item = model.Tree_item(parent_item)
+            item.text = element.get('text', '')
+            if element.get('_note'):
+                item.text += '\n' + element.get('_note')
+            (parent_item.childItems if parent_item else top_items).append(item)
+            stack.append(item)
+        else:
+            stack.pop()
+            element.clear()
+    return top_items
+
+
+def parse_file(path):
+    """Parses an OPML, a Markdown or an indented text file, depending on the suffix of 'path'.
+
+    :return: the top level items
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == OPML_SUFFIX:
+        with open(path, 'rb') as file:
+            return parse_opml(file)
+    with open(path, encoding='utf-8') as file:
+        text = file.read()
+    if suffix in MARKDOWN_SUFFIXES:
+        return parse_markdown(text)
+    return parse_indented_text(text)
+
+
+def parse_hit_list(file, header_list):
+    """Builds a tree out of a plist backup of The Hit List. The task called 'ROOT' becomes the root item.
+
+    :return: the root item
+    """
+    hit_list_dict = plistlib.load(file)
+    root_item = None
+    id_item_dict = {}
+    child_ids = {}
+    for task_dict in hit_list_dict['PFEntities']['Task'].values():
+        item = model.Tree_item()
+        item.text = task_dict['title']
+        date = task_dict.get('startDate')
+        if date:
+            item.date = date.strftime('%d.%m.%y')
+        if item.text == 'ROOT':
+            item.header_list = header_list
+            root_item = item
+        child_ids[item] = task_dict.get('subtasks', [])
+        item.estimate = str(task_dict.get('priority', item.estimate))
+        id_item_dict[task_dict['uid']] = item
+
+    for item, item_child_ids in child_ids.items():
+        for child_id in item_child_ids:
+            item.childItems.append(id_item_dict[child_id])
+            id_item_dict[child_id].parentItem = item
+    root_item.parentItem = None
+    return root_item
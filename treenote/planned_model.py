@@ -20,8 +20,10 @@ class PlannedModel(QAbstractItemModel):
     def refresh_model(self):
         # we map to the indexes of the item_model
         self.beginResetModel()
-        self.orignal_indexes = [index for index in self.item_model.indexes() if
-                                self.item_model.getItem(index).planned != 0]
+        # children which the loader unpickles in the background are added when it's done
+        items = self.item_model.iter_items(fetch_if=lambda lazy_children: lazy_children.planned and
+                                           lazy_children not in self.item_model.loading)
+        self.orignal_indexes = [self.item_model.item_index(item) for item in items if item.planned != 0]
         if self.filter_proxy.filter:
             self.orignal_indexes = [index for index in self.orignal_indexes if
                                     self.filter_proxy.filterAcceptsRow(index.row(), index.parent())]
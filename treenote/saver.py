@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+import treenote.util as util
+
+
+class Saver(QObject):
+    """
+    Saves the tree in a background thread, at most once per interval.
+
+    save_file() is called after every change. Instead of writing the file each time, the tree is just marked as
+    changed. When the interval has passed, a snapshot of the tree is taken on the GUI thread (so it can't change
+    meanwhile). That is cheap, see model.TreeModel.snapshot(). A worker thread serializes the snapshot and writes
+    the bytes to a temporary file, which then replaces the .treenote file. So the time the GUI is blocked doesn't
+    grow with the size of the tree. If a newer snapshot arrives while the worker is still writing, older snapshots
+    which were not written yet are dropped.
+    """
+    failed = pyqtSignal(str)
+    saved = pyqtSignal(object)  # the checkpoint of the written snapshot, see __init__()
+
+    def __init__(self, parent, take_snapshot, interval, fsync=False):
+        """
+        :param take_snapshot: function which returns (path, serialize, checkpoint) of the current tree.
+            'serialize' is a function without arguments which returns the bytes to write. It is called on the worker
+            thread, so it must not touch the shown tree.
+            'checkpoint' is emitted by the saved signal when the bytes are written, e.g. to truncate a write-ahead log.
+        :param interval: in seconds
+        :param fsync: wait until the data is physically written to the disk
+        """
+        super(Saver, self).__init__(parent)
+        self.take_snapshot = take_snapshot
+        self.fsync = fsync
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.save_in_background)
+        self.set_interval(interval)
+        self.condition = threading.Condition()
+        self.pending = None  # (path, serialize, checkpoint, fsync)
+        self.writing = False
+        self.thread = None
+
+    def set_interval(self, seconds):
+        self.timer.setInterval(int(seconds * 1000))
+
+    def mark_dirty(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def save_in_background(self):
+        snapshot = self.take_snapshot()
+        with self.condition:
+            self.pending = snapshot + (self.fsync,)
+            self.condition.notify_all()
+        if self.thread is None:
+            # daemon: a running thread must not prevent quitting. closeEvent() saves synchronously anyway
+            self.thread = threading.Thread(target=self.run, name='Saver', daemon=True)
+            self.thread.start()
+
+    def discard(self):
+        """Drops changes which are not written yet. Returns when the worker is done with writing."""
+        self.timer.stop()
+        with self.condition:
+            self.pending = None
+            while self.writing:
+                self.condition.wait()
+
+    def save(self):
+        """Saves the current tree synchronously, e.g. when closing.
+
+        :return: whether the file was written. If not, the failed signal is emitted, like when saving in the background.
+        """
+        # the current tree contains the pending changes, too
+        self.discard()
+        return self.write(*self.take_snapshot() + (self.fsync,))
+
+    def flush(self):
+        """Returns when all changes are written, e.g. before opening another file."""
+        if self.timer.isActive():
+            self.save()
+        else:
+            with self.condition:
+                while self.pending is not None or self.writing:
+                    self.condition.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                pending = self.pending
+                self.pending = None
+                self.writing = True
+            try:
+                self.write(*pending)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def write(self, path, serialize, checkpoint, fsync):
+        try:
+            util.write_atomically(path, serialize(), fsync)
+        except Exception as e:  # e.g. OSError. the worker must keep running, so every error is reported
+            self.failed.emit(str(e))
+            return False
+        self.saved.emit(checkpoint)
+        return True
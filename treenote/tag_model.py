@@ -14,6 +14,8 @@ class TagTreeItem(object):
         self.parentItem = parent
         self.text = text
         self.childItems = []
+        self.child_rows = {}  # {text: row} of the child items
+        self.row_number = 0
 
     def child(self, row):
         return self.childItems[row]
@@ -25,16 +27,15 @@ class TagTreeItem(object):
         return self.parentItem
 
     def row(self):
-        if self.parentItem:
-            return self.parentItem.childItems.index(self)
-
-        return 0
+        # children are just appended, so their rows don't change
+        return self.row_number
 
     def add_and_return_child(self, item):
-        for existing_item in self.childItems:
-            if existing_item.text == item.text:
-                return existing_item
+        row = self.child_rows.get(item.text)
+        if row is not None:
+            return self.childItems[row]
 
+        item.row_number = self.child_rows[item.text] = len(self.childItems)
         self.childItems.append(item)
         return item
 
@@ -130,7 +131,7 @@ class TagModel(QAbstractItemModel):
 
     def setupModelData(self, tags_set):
         self.beginResetModel()
-        self.rootItem.childItems = []
+        self.rootItem = TagTreeItem(None)
         for whole_tag in sorted(tags_set, key=str.lower):
             splitted_tag = whole_tag.split(model.TAG_DELIMITER)
 
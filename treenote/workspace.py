@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Files which stay loaded when an other file is opened, so switching back to them is instant.
+
+MainWindow has one item model and one bookmark model. When an other file is opened, the trees of the models,
+their caches and undo histories (see TreeModel.take_tree_state()), the open journal or database of the file and
+the search and focus of the view are parked in an OpenTree. Opening the file again swaps them back in,
+without reading the file. When the parked files need more memory than the budget,
+the least recently used ones are closed.
+"""
+
+import collections
+
+DEFAULT_BUDGET = 512  # MB
+ITEM_SIZE = 260  # bytes of an unpickled item without its text, measured with tracemalloc
+
+
+def tree_size(tree_state):
+    """Estimates the bytes of the unpickled items and of the pickled collapsed subtrees of a tree."""
+    size = 0
+    stack = [tree_state['rootItem']]
+    while stack:
+        item = stack.pop()
+        size += ITEM_SIZE + len(item.text)
+        stack.extend(item.childItems)
+    # the subtrees of archives are memory-mapped, they have no blob
+    return size + sum(len(getattr(lazy_children, 'blob', b'')) for lazy_children in tree_state['unfetched'].values())
+
+
+class OpenTree():
+    """A loaded file which is not shown."""
+
+    def __init__(self, path, storage_mode, item_state, bookmark_state, journal, database, archive, search_text,
+                 root_item, current_item):
+        """
+        :param storage_mode: the storage mode the file was saved with. If it changes, the file is converted when it
+            is shown again
+        :param root_item: the item which was focused
+        :param current_item: the item which was selected
+        """
+        self.path = path
+        self.storage_mode = storage_mode
+        self.item_state = item_state
+        self.bookmark_state = bookmark_state
+        self.journal = journal
+        self.database = database
+        self.archive = archive
+        self.search_text = search_text
+        self.root_item = root_item
+        self.current_item = current_item
+        self.size = tree_size(item_state) + tree_size(bookmark_state)
+
+
+class Workspace():
+    def __init__(self, budget=DEFAULT_BUDGET):
+        """
+        :param budget: MB the parked files may use
+        """
+        self.budget = budget
+        self.open_trees = collections.OrderedDict()  # {path: OpenTree}, the least recently used first
+
+    def __contains__(self, path):
+        return path in self.open_trees
+
+    def paths(self):
+        """Returns the paths of the parked files, the most recently used first."""
+        return list(reversed(self.open_trees))
+
+    def take(self, path):
+        """Removes the OpenTree of 'path' from the workspace and returns it, or None if it's not parked."""
+        return self.open_trees.pop(path, None)
+
+    def park(self, open_tree):
+        """Adds 'open_tree'.
+
+        :return: the least recently used OpenTrees which don't fit into the budget anymore. The caller closes them
+        """
+        self.open_trees[open_tree.path] = open_tree
+        return self.evict()
+
+    def set_budget(self, budget):
+        self.budget = budget
+        return self.evict()
+
+    def evict(self):
+        evicted_trees = []
+        size = sum(open_tree.size for open_tree in self.open_trees.values())
+        while self.open_trees and size > self.budget * 1024 * 1024:
+            path, open_tree = self.open_trees.popitem(last=False)
+            size -= open_tree.size
+            evicted_trees.append(open_tree)
+        return evicted_trees
+
+    def take_all(self):
+        open_trees = list(self.open_trees.values())
+        self.open_trees.clear()
+        return open_trees